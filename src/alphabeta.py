@@ -0,0 +1,252 @@
+"""Module providing an iterative-deepening alpha-beta engine for half-chess
+
+The engine searches with negamax and alpha-beta pruning on a single board
+with push/pop. Positions are scored by material (material_advantage, from the
+side to move), and mates by their distance. It extends the main search with
+a quiescence search over captures and promotions, stores results in a
+transposition table keyed by Zobrist hash, and orders moves as follows: the
+table's move first, then captures and promotions by most valuable victim,
+then killer moves, then moves by their history score.
+
+best_move(board, time_ms) deepens until the time is up and returns the best
+move of the last completed iteration. AlphaBetaEvaluator wraps a shallow
+search as an Evaluator for MCTS when no network is available.
+"""
+
+import math
+import sys
+import time
+from typing import Optional
+import numpy as np
+from half_chess_board import HalfChessBoard, Move, ACTION_MOVES
+from evaluator import Evaluator
+
+MATE = 1000
+# Scores beyond this are mates, stored in the table relative to the node rather than the root.
+MATE_BOUND = MATE - 100
+EXACT, LOWER, UPPER = range(3)
+
+_VALUES = {piece: abs(value) for piece, value in HalfChessBoard.point_values.items()}
+_VALUES['K'] = _VALUES['k'] = 100
+
+
+class _Timeout(Exception):
+    pass
+
+
+class AlphaBeta:
+    """Alpha-beta searcher whose transposition table, killers and history persist between searches."""
+
+    def __init__(self, table_size=1_000_000):
+        self.table_size = table_size
+        self.table: dict[int, tuple[int, int, int, int]] = {}  # hash -> (depth, score, bound, action)
+        self.history = np.zeros(len(ACTION_MOVES), dtype=np.int64)
+        self.killers: list[list[int]] = []
+        self.nodes = 0
+        self.deadline = None
+
+    def search(self, board: HalfChessBoard, max_depth=64, time_ms: Optional[float] = None
+               ) -> tuple[Optional[Move], int, int]:
+        """(best move, score for the player to move, depth completed) from iterative deepening
+        to max_depth plies, stopping early when time_ms runs out. Depth 1 always completes.
+        The move is None if the game is over."""
+        board = HalfChessBoard(board.board.copy(), board.white_to_move)
+        result = board.result()
+        if result is not None:
+            return None, 0 if result == 0 else -MATE, 0
+        if len(self.table) > self.table_size:
+            self.table.clear()
+        self.history //= 8
+        self.nodes = 0
+        start = time.perf_counter()
+        best, score, completed = None, 0, 0
+        for depth in range(1, max_depth + 1):
+            self.deadline = None if time_ms is None or depth == 1 else start + time_ms / 1000
+            self.killers = [[-1, -1] for _ in range(depth + 1)]
+            try:
+                score = self.__negamax(board, depth, 0, -MATE - 1, MATE + 1)
+            except _Timeout:
+                break
+            best, completed = ACTION_MOVES[self.table[board.zobrist_hash][3]], depth
+            if abs(score) > MATE_BOUND:
+                break  # a forced mate has been found; deeper searches can't change the result
+        return best, score, completed
+
+    def __negamax(self, board: HalfChessBoard, depth: int, ply: int, alpha: int, beta: int) -> int:
+        self.__tick()
+        result = board.result()
+        if result is not None:
+            # The player to move can only have lost, or drawn.
+            return 0 if result == 0 else -(MATE - ply)
+        if depth <= 0:
+            return self.__quiesce(board, ply, alpha, beta)
+
+        key = board.zobrist_hash
+        entry = self.table.get(key)
+        table_action = -1
+        if entry is not None:
+            entry_depth, entry_score, bound, table_action = entry
+            if entry_depth >= depth and ply > 0:
+                entry_score = _from_table(entry_score, ply)
+                if bound == EXACT or bound == LOWER and entry_score >= beta \
+                        or bound == UPPER and entry_score <= alpha:
+                    return entry_score
+
+        original_alpha = alpha
+        best_score, best_action = -MATE - 1, -1
+        for action in self.__ordered(board, board.legal_actions, ply, table_action):
+            board.push(ACTION_MOVES[action])
+            try:
+                score = -self.__negamax(board, depth - 1, ply + 1, -beta, -alpha)
+            finally:
+                board.pop()
+            if score > best_score:
+                best_score, best_action = score, action
+            if score > alpha:
+                alpha = score
+            if alpha >= beta:
+                if not _is_noisy(board, ACTION_MOVES[action]):
+                    killers = self.killers[ply]
+                    if killers[0] != action:
+                        killers[1], killers[0] = killers[0], action
+                    self.history[action] += depth * depth
+                break
+
+        bound = UPPER if best_score <= original_alpha else LOWER if best_score >= beta else EXACT
+        self.table[key] = (depth, _to_table(best_score, ply), bound, best_action)
+        return best_score
+
+    def quiescence(self, board: HalfChessBoard) -> int:
+        """Score of board for the player to move after resolving captures and promotions."""
+        self.deadline = None
+        return self.__quiesce(board, 0, -MATE - 1, MATE + 1)
+
+    def __quiesce(self, board: HalfChessBoard, ply: int, alpha: int, beta: int) -> int:
+        """Searches captures and promotions only, letting the player to move stand pat on material."""
+        self.__tick()
+        result = board.result()
+        if result is not None:
+            return 0 if result == 0 else -(MATE - ply)
+        stand_pat = board.material_advantage() if board.white_to_move else -board.material_advantage()
+        if stand_pat >= beta:
+            return stand_pat
+        alpha = max(alpha, stand_pat)
+        noisy = [action for action in board.legal_actions if _is_noisy(board, ACTION_MOVES[action])]
+        for action in sorted(noisy, key=lambda action: -_capture_score(board, ACTION_MOVES[action])):
+            board.push(ACTION_MOVES[action])
+            try:
+                score = -self.__quiesce(board, ply + 1, -beta, -alpha)
+            finally:
+                board.pop()
+            if score >= beta:
+                return score
+            alpha = max(alpha, score)
+        return alpha
+
+    def __ordered(self, board: HalfChessBoard, actions, ply: int, table_action: int) -> list[int]:
+        killers = self.killers[ply] if ply < len(self.killers) else ()
+
+        def key(action):
+            if action == table_action:
+                return 1 << 40
+            move = ACTION_MOVES[action]
+            if _is_noisy(board, move):
+                return (1 << 32) + _capture_score(board, move)
+            if action in killers:
+                return 1 << 31
+            return int(self.history[action])
+
+        return sorted(actions, key=key, reverse=True)
+
+    def __tick(self) -> None:
+        self.nodes += 1
+        if self.deadline is not None and self.nodes % 64 == 0 and time.perf_counter() > self.deadline:
+            raise _Timeout
+
+
+def _is_noisy(board: HalfChessBoard, move: Move) -> bool:
+    """Captures, and promotions that take out a piece."""
+    return board.board[move.new_r, move.new_c] != ' ' or move.is_promotion()
+
+
+def _capture_score(board: HalfChessBoard, move: Move) -> int:
+    """Most valuable victim first, then least valuable attacker."""
+    gained = _VALUES[board.board[move.new_r, move.new_c]]
+    if move.is_promotion():
+        gained += _VALUES[board.board[move.prom_r, move.prom_c]]
+    return 10 * gained - _VALUES[board.board[move.old_r, move.old_c]]
+
+
+def _to_table(score: int, ply: int) -> int:
+    if score > MATE_BOUND:
+        return score + ply
+    if score < -MATE_BOUND:
+        return score - ply
+    return score
+
+
+def _from_table(score: int, ply: int) -> int:
+    if score > MATE_BOUND:
+        return score - ply
+    if score < -MATE_BOUND:
+        return score + ply
+    return score
+
+
+def best_move(board: HalfChessBoard, time_ms: float, engine: Optional[AlphaBeta] = None) -> Optional[Move]:
+    """The engine's move in board after searching for about time_ms milliseconds.
+    Pass an engine to keep its transposition table from move to move."""
+    engine = engine if engine is not None else AlphaBeta()
+    return engine.search(board, time_ms=time_ms)[0]
+
+
+class AlphaBetaEvaluator(Evaluator):
+    """Scores each state with a depth-limited search: the value is tanh(score / scale) for
+    the player to move (+-1 for mates), and the policy a softmax over each legal move's
+    search score divided by temperature."""
+
+    def __init__(self, depth=1, scale=3.0, temperature=1.0, engine: Optional[AlphaBeta] = None):
+        self.depth = depth
+        self.scale = scale
+        self.temperature = temperature
+        self.engine = engine if engine is not None else AlphaBeta()
+
+    def evaluate(self, states):
+        values = np.zeros(len(states), dtype=np.float32)
+        policies = []
+        for i, state in enumerate(states):
+            board = HalfChessBoard(state.board.copy(), state.white_to_move)
+            scores = []
+            for move in state.legal_moves:
+                board.push(move)
+                if self.depth > 1:
+                    scores.append(-self.engine.search(board, max_depth=self.depth - 1)[1])
+                else:
+                    scores.append(-self.engine.quiescence(board))
+                board.pop()
+            if not scores:
+                policies.append({})
+                continue
+            best = max(scores)
+            values[i] = math.copysign(1, best) if abs(best) > MATE_BOUND else math.tanh(best / self.scale)
+            weights = np.exp((np.array(scores, dtype=np.float64) - best) / self.temperature)
+            policies.append(dict(zip(state.legal_moves, (weights / weights.sum()).tolist())))
+        return values, policies
+
+
+if __name__ == '__main__':
+    TIME_MS = 1000 if len(sys.argv) < 2 else float(sys.argv[1])
+    MAX_PLIES = 100 if len(sys.argv) < 3 else int(sys.argv[2])
+
+    board = HalfChessBoard()
+    engine = AlphaBeta()
+    for _ in range(MAX_PLIES):
+        if board.result() is not None:
+            break
+        start = time.perf_counter()
+        move, score, depth = engine.search(board, time_ms=TIME_MS)
+        elapsed = time.perf_counter() - start
+        print(f'{move} score={score} depth={depth} nodes={engine.nodes} ({engine.nodes / elapsed:.0f}/s)')
+        board = board.make_move(move)
+    print(board)
+    print('result:', board.result())
@@ -0,0 +1,182 @@
+"""Module providing a compact, array-backed MCTS tree and a batched search over it"""
+
+import sys
+import time
+from typing import Optional
+import numpy as np
+import numpy.typing as npt
+from half_chess_board import HalfChessBoard, Move
+from encoder_decoder import ACTION_IDS, decode_action
+from evaluator import Evaluator, PredictEvaluator
+from mcts import dummy_model_predict, terminal_value
+
+
+class ArrayTree:
+    """MCTS tree stored as parallel NumPy arrays indexed by node id; node 0 is the root.
+
+    The children of a node occupy the contiguous block
+    [first_child, first_child + num_children), so selection scores a node's
+    children with one vectorised expression. A child is created with only its
+    action id and prior; its HalfChessBoard is made the first time it is
+    visited. As in mcts.Node, value_sum is from the perspective of the player
+    who moved into the node."""
+
+    # Node arrays with their dtypes and the value of unused slots.
+    FIELDS = {
+        'prior': (np.float32, 0),
+        'visits': (np.int32, 0),
+        'value_sum': (np.float32, 0),
+        'first_child': (np.int32, 0),
+        'num_children': (np.int16, 0),
+        'action': (np.int16, -1),
+        'parent': (np.int32, -1),
+    }
+
+    def __init__(self, root_state: HalfChessBoard, capacity=1024):
+        self.size = 1
+        for name, (dtype, fill) in self.FIELDS.items():
+            setattr(self, name, np.full(capacity, fill, dtype=dtype))
+        self.states: dict[int, HalfChessBoard] = {0: root_state}
+
+    def __len__(self) -> int:
+        return self.size
+
+    @property
+    def capacity(self) -> int:
+        return len(self.prior)
+
+    def nbytes(self) -> int:
+        """Bytes held by the node arrays (excluding materialized states)."""
+        return sum(getattr(self, name).nbytes for name in self.FIELDS)
+
+    def state(self, node: int) -> HalfChessBoard:
+        """Position at node, materialized from its parent's on first access."""
+        state = self.states.get(node)
+        if state is None:
+            parent_state = self.state(int(self.parent[node]))
+            state = self.states[node] = parent_state.make_move(decode_action(int(self.action[node])))
+        return state
+
+    def is_expanded(self, node: int) -> bool:
+        return self.num_children[node] > 0
+
+    def children(self, node: int) -> range:
+        start = int(self.first_child[node])
+        return range(start, start + int(self.num_children[node]))
+
+    def expand(self, node: int, action_probs: dict[Move, float]) -> None:
+        """Appends a child block for the moves with positive probability in action_probs."""
+        moves = [move for move in self.state(node).legal_moves if action_probs.get(move, 0) > 0]
+        if not moves:
+            return
+        start = self.size
+        self.__reserve(start + len(moves))
+        end = start + len(moves)
+        self.prior[start:end] = [action_probs[move] for move in moves]
+        self.action[start:end] = [ACTION_IDS[move] for move in moves]
+        self.parent[start:end] = node
+        self.first_child[node] = start
+        self.num_children[node] = len(moves)
+        self.size = end
+
+    def select_child(self, node: int) -> int:
+        """Child with the highest UCB score, computed over the whole child block at once."""
+        start = self.first_child[node]
+        end = start + self.num_children[node]
+        visits = self.visits[start:end]
+        value = np.divide(self.value_sum[start:end], visits,
+                          out=np.zeros(len(visits), dtype=np.float32), where=visits > 0)
+        score = value + self.prior[start:end] * np.sqrt(self.visits[node]) / (visits + 1)
+        return int(start + score.argmax())
+
+    def select(self) -> list[int]:
+        """Path of node ids from the root down to a leaf."""
+        node = 0
+        search_path = [node]
+        while self.num_children[node] > 0:
+            node = self.select_child(node)
+            search_path.append(node)
+        return search_path
+
+    def backup(self, search_path: list[int], value: float) -> None:
+        """Backs up a value given from the perspective of the player to move at the leaf."""
+        path = np.array(search_path)
+        # The node just above the leaf's mover gets -value, its parent +value, and so on.
+        signs = np.where((len(path) - np.arange(len(path))) % 2 == 1, -1.0, 1.0)
+        self.value_sum[path] += signs * value
+        self.visits[path] += 1
+
+    def add_virtual_loss(self, search_path: list[int], virtual_loss: int) -> None:
+        self.visits[search_path] += virtual_loss
+        self.value_sum[search_path] -= virtual_loss
+
+    def root_visits(self) -> dict[Move, int]:
+        """Visit counts of the root's children, keyed by move."""
+        return {decode_action(int(self.action[child])): int(self.visits[child])
+                for child in self.children(0)}
+
+    def __reserve(self, size: int) -> None:
+        if size <= self.capacity:
+            return
+        capacity = max(size, 2 * self.capacity)
+        for name, (dtype, fill) in self.FIELDS.items():
+            old = getattr(self, name)
+            new = np.full(capacity, fill, dtype=dtype)
+            new[:len(old)] = old
+            setattr(self, name, new)
+
+
+class ArrayMCTS:
+    """Batched MCTS with virtual loss over an ArrayTree; see mcts.MCTS for the algorithm."""
+
+    def __init__(self, evaluator: Optional[Evaluator] = None, batch_size=1, virtual_loss=1):
+        self.evaluator = evaluator if evaluator is not None else PredictEvaluator(dummy_model_predict)
+        self.batch_size = batch_size
+        self.virtual_loss = virtual_loss
+
+    def run(self, tree: ArrayTree, num_simulations: int) -> None:
+        """Runs num_simulations simulations from the root of tree, expanding it first if necessary."""
+        if not tree.is_expanded(0) and terminal_value(tree.state(0)) is None:
+            self.__evaluate_and_expand(tree, [0])
+
+        done = 0
+        while done < num_simulations:
+            pending = []
+            while len(pending) < self.batch_size and done + len(pending) < num_simulations:
+                search_path = tree.select()
+                leaf = search_path[-1]
+                value = terminal_value(tree.state(leaf))
+                if value is not None:
+                    tree.backup(search_path, value)
+                    done += 1
+                    continue
+                if any(leaf == other[-1] for other in pending):
+                    # Virtual loss did not steer this descent elsewhere; evaluate what we have.
+                    break
+                tree.add_virtual_loss(search_path, self.virtual_loss)
+                pending.append(search_path)
+
+            if pending:
+                values = self.__evaluate_and_expand(tree, [path[-1] for path in pending])
+                for search_path, value in zip(pending, values):
+                    tree.add_virtual_loss(search_path, -self.virtual_loss)
+                    tree.backup(search_path, value)
+                done += len(pending)
+
+    def __evaluate_and_expand(self, tree: ArrayTree, leaves: list[int]) -> npt.NDArray:
+        values, policies = self.evaluator.evaluate([tree.state(leaf) for leaf in leaves])
+        for leaf, policy in zip(leaves, policies):
+            tree.expand(leaf, policy)
+        return values
+
+
+if __name__ == '__main__':
+    NUM_SIMULATIONS = 1000 if len(sys.argv) < 2 else int(sys.argv[1])
+
+    tree = ArrayTree(HalfChessBoard())
+    start = time.perf_counter()
+    ArrayMCTS().run(tree, NUM_SIMULATIONS)
+    elapsed = time.perf_counter() - start
+    print(f'{NUM_SIMULATIONS / elapsed:.0f} simulations/s, {len(tree)} nodes, '
+          f'{len(tree.states)} materialized, {tree.nbytes() / 1024:.0f} KiB of node arrays')
+    print(sorted(tree.root_visits().items(), key=lambda item: -item[1])[:5])
@@ -0,0 +1,324 @@
+"""Vectorized move generation for batches of half-chess positions.
+
+Positions are given as an (N, 8, 4) integer array of piece codes (0 for an
+empty square, 1 + the encode_board plane of the piece otherwise, see
+PIECE_CODES) and N side-to-move flags. legal_move_masks marks the legal
+actions of every position over the encode_action index space at once:
+
+1. Black-to-move positions are replaced by their mirror images (see
+   HalfChessBoard.mirror), so moves are only generated for white.
+2. Pseudo-legal moves are found for every (position, white piece) pair
+   against all 32 target squares, using static (from, to) tables: which
+   pieces can make each step, the squares a slider passes over, and the
+   pawn rules, including which pieces a promotion may take out.
+3. Each pseudo-legal move is replayed on 32-bit piece bitboards, and moves
+   leaving the king attacked are dropped. Attacks are computed for all
+   candidate moves together by shifting bitboards; sliders are flooded
+   through empty squares.
+4. Moves of mirrored positions are mapped back with MIRROR_ACTIONS.
+
+in_check and results give the check status and game result of each
+position, matching HalfChessBoard.result. Nothing loops over positions in
+Python, so throughput grows with the batch size; run this module to compare
+against HalfChessBoard.legal_moves and check that they agree.
+"""
+
+import sys
+import time
+from typing import Optional
+import numpy as np
+import numpy.typing as npt
+from half_chess_board import (HalfChessBoard, NUM_ACTIONS, ACTION_MOVES, MIRROR_ACTIONS,
+                              _plain_action, _promotion_action)
+from encoder_decoder import PIECE_PLANES
+
+PIECE_CODES = ' ' + PIECE_PLANES  # code -> piece; white pieces are 1-5, black pieces 6-10
+ROOK, KNIGHT, BISHOP, PAWN, KING = range(5)  # piece type: (code - 1) % 5
+# Game result for positions that are still going on.
+ONGOING = 2
+
+_CODE_OF_CHAR = np.zeros(128, dtype=np.int8)
+for _code, _piece in enumerate(PIECE_CODES):
+    if _piece != ' ':
+        _CODE_OF_CHAR[ord(_piece)] = _code
+# Code of the same piece in the other colour.
+_SWAP_COLOUR = np.array([0, 6, 7, 8, 9, 10, 1, 2, 3, 4, 5], dtype=np.int8)
+_MIRROR_ACTIONS = np.array(MIRROR_ACTIONS, dtype=np.intp)
+
+FULL = np.uint64((1 << 32) - 1)
+_BIT = np.uint64(1) << np.arange(32, dtype=np.uint64)
+_ROW_MASKS = [sum(1 << (4 * row + col) for col in range(4)) for row in range(8)]
+_COL_MASKS = [sum(1 << (4 * row + col) for row in range(8)) for col in range(4)]
+# Squares a shift by dc columns may land on without wrapping around a row.
+_DEST_COLS = {dc: np.uint64(sum(_COL_MASKS[col] for col in range(4) if 0 <= col - dc < 4)) for dc in range(-2, 3)}
+
+
+def _between(old_r: int, old_c: int, new_r: int, new_c: int) -> int:
+    """Squares strictly between two squares on a line, as a bitboard."""
+    dr, dc = new_r - old_r, new_c - old_c
+    steps = max(abs(dr), abs(dc))
+    sr, sc = np.sign(dr), np.sign(dc)
+    return sum(1 << int(4 * (old_r + i * sr) + old_c + i * sc) for i in range(1, steps))
+
+
+def _step_tables():
+    """(from, to) tables for white's plain moves, indexed by square row * 4 + col."""
+    reach = np.zeros((5, 32, 32), dtype=bool)  # piece type can step from -> to (pawns: pushes)
+    pawn_captures = np.zeros((32, 32), dtype=bool)
+    between = np.zeros((32, 32), dtype=np.uint64)
+    actions = np.zeros((32, 32), dtype=np.intp)
+    # Black pieces a pawn reaching row 0 by the step could take out instead (all of them otherwise).
+    prom_allowed = np.zeros((32, 32), dtype=np.uint64)
+    for old in range(32):
+        old_r, old_c = divmod(old, 4)
+        for new in range(32):
+            new_r, new_c = divmod(new, 4)
+            dr, dc = new_r - old_r, new_c - old_c
+            actions[old, new] = _plain_action(old_r, old_c, new_r, new_c)
+            if old == new:
+                continue
+            reach[ROOK, old, new] = dr == 0 or dc == 0
+            reach[BISHOP, old, new] = abs(dr) == abs(dc)
+            reach[KNIGHT, old, new] = {abs(dr), abs(dc)} == {1, 2}
+            reach[KING, old, new] = max(abs(dr), abs(dc)) == 1
+            reach[PAWN, old, new] = dr == -1 and dc == 0
+            pawn_captures[old, new] = dr == -1 and abs(dc) == 1
+            if reach[ROOK, old, new] or reach[BISHOP, old, new]:
+                between[old, new] = _between(old_r, old_c, new_r, new_c)
+            if new_r == 0:
+                prom_allowed[old, new] = FULL if dc == 0 else FULL & ~np.uint64(_ROW_MASKS[0] | _COL_MASKS[new_c])
+    return reach, pawn_captures, between, actions, prom_allowed
+
+
+_REACH, _PAWN_CAPTURES, _BETWEEN, _STEP_ACTIONS, _PROM_ALLOWED = _step_tables()
+
+
+def _promotion_tables():
+    """(pawn column, column shift + 1, square taken out) tables for white's promotions from row 1."""
+    actions = np.zeros((4, 3, 32), dtype=np.intp)
+    allowed = np.zeros((4, 3, 32), dtype=bool)
+    for col in range(4):
+        for shift in range(3):
+            new_c = col + shift - 1
+            if not 0 <= new_c < 4:
+                continue
+            for sq in range(32):
+                prom_r, prom_c = divmod(sq, 4)
+                actions[col, shift, sq] = _promotion_action(1, col, new_c, prom_r, prom_c)
+                # A capturing promotion can't take out a piece on the row or column it captures on.
+                allowed[col, shift, sq] = shift == 1 or (prom_r != 0 and prom_c != new_c)
+    return actions, allowed
+
+
+_PROM_ACTIONS, _PROM_ALLOWED_SQUARES = _promotion_tables()
+
+
+def _action_tables():
+    """Per-action from and to squares, the squares the action empties, and whether a pawn
+    making it leaves the board, for replaying moves on bitboards."""
+    from_sq = np.array([4 * m.old_r + m.old_c for m in ACTION_MOVES], dtype=np.intp)
+    # Off-board promotion ids never occur; give them square 0 rather than an invalid index.
+    to_sq = np.array([4 * m.new_r + m.new_c if 0 <= m.new_c < 4 else 0 for m in ACTION_MOVES], dtype=np.intp)
+    cleared = _BIT[from_sq] | _BIT[to_sq]
+    for action, m in enumerate(ACTION_MOVES):
+        if m.is_promotion():
+            cleared[action] |= _BIT[4 * m.prom_r + m.prom_c]
+    vanishes = np.array([m.new_r in (0, 7) for m in ACTION_MOVES])
+    return from_sq, to_sq, cleared, vanishes
+
+
+_FROM, _TO, _CLEARED, _PAWN_VANISHES = _action_tables()
+
+
+def encode_pieces(states: npt.NDArray[np.str_]) -> npt.NDArray[np.int8]:
+    """(N, 8, 4) character boards (HalfChessBoard.board) to piece codes."""
+    return _CODE_OF_CHAR[np.asarray(states, dtype='<U1').view(np.uint32)]
+
+
+def pieces_of_boards(boards: list[HalfChessBoard]) -> tuple[npt.NDArray[np.int8], npt.NDArray[np.bool_]]:
+    """Piece codes and side-to-move flags of a list of boards."""
+    return (encode_pieces(np.stack([board.board for board in boards])),
+            np.array([board.white_to_move for board in boards], dtype=bool))
+
+
+def bitboards(pieces: npt.NDArray[np.integer]) -> npt.NDArray[np.uint64]:
+    """(N, 10) bitboards, one per encode_board plane, with bit row * 4 + col set for each piece."""
+    flat = np.asarray(pieces).reshape(len(pieces), 32)
+    planes = flat[:, None, :] == np.arange(1, 11)[:, None]
+    return np.packbits(planes, axis=-1, bitorder='little').view('<u4')[..., 0].astype(np.uint64)
+
+
+def _shift(bb: npt.NDArray[np.uint64], dr: int, dc: int) -> npt.NDArray[np.uint64]:
+    """Moves every set square by (dr, dc), dropping squares that leave the board."""
+    step = 4 * dr + dc
+    moved = bb << np.uint64(step) if step > 0 else bb >> np.uint64(-step)
+    return moved & _DEST_COLS[dc] & FULL
+
+
+_KNIGHT_STEPS = ((1, 2), (1, -2), (-1, 2), (-1, -2), (2, 1), (2, -1), (-2, 1), (-2, -1))
+_KING_STEPS = tuple((dr, dc) for dr in (-1, 0, 1) for dc in (-1, 0, 1) if dr or dc)
+_ROOK_STEPS = ((1, 0), (-1, 0), (0, 1), (0, -1))
+_BISHOP_STEPS = ((1, 1), (1, -1), (-1, 1), (-1, -1))
+
+
+def attacks(boards: npt.NDArray[np.uint64], by_white: npt.ArrayLike) -> npt.NDArray[np.uint64]:
+    """Squares attacked by the given side in each position of (M, 10) bitboards, as in
+    HalfChessBoard.is_attacked."""
+    by_white = np.broadcast_to(np.asarray(by_white, dtype=bool), len(boards))
+    side = np.where(by_white[:, None], boards[:, :5], boards[:, 5:])
+    rooks, knights, bishops, pawns, kings = side.T
+    empty = ~np.bitwise_or.reduce(boards, axis=1) & FULL
+    attacked = np.zeros(len(boards), dtype=np.uint64)
+    for dr, dc in _KNIGHT_STEPS:
+        attacked |= _shift(knights, dr, dc)
+    for dr, dc in _KING_STEPS:
+        attacked |= _shift(kings, dr, dc)
+    # White pawns capture towards row 0, black pawns towards row 7.
+    white_pawns = np.where(by_white, pawns, np.uint64(0))
+    black_pawns = pawns ^ white_pawns
+    for dc in (-1, 1):
+        attacked |= _shift(white_pawns, -1, dc) | _shift(black_pawns, 1, dc)
+    for sliders, steps in ((rooks, _ROOK_STEPS), (bishops, _BISHOP_STEPS)):
+        for dr, dc in steps:
+            fill = sliders
+            for _ in range(6 if dc == 0 else 2):
+                fill = fill | _shift(fill, dr, dc) & empty
+            attacked |= _shift(fill, dr, dc)
+    return attacked
+
+
+def _white_in_check(boards: npt.NDArray[np.uint64]) -> npt.NDArray[np.bool_]:
+    return attacks(boards, False) & boards[:, KING] != 0
+
+
+def _canonical(pieces: npt.NDArray[np.integer], white_to_move: npt.NDArray[np.bool_]) -> npt.NDArray[np.int8]:
+    """(N, 32) piece codes with every black-to-move position replaced by its mirror image."""
+    flat = np.asarray(pieces, dtype=np.int8).reshape(len(pieces), 8, 4)
+    black = ~white_to_move
+    if black.any():
+        flat = flat.copy()
+        flat[black] = _SWAP_COLOUR[flat[black, ::-1]]
+    return flat.reshape(len(flat), 32)
+
+
+def in_check(pieces: npt.NDArray[np.integer], white_to_move: npt.ArrayLike) -> npt.NDArray[np.bool_]:
+    """Whether the player to move in each position is in check."""
+    return _white_in_check(bitboards(_canonical(pieces, np.asarray(white_to_move, dtype=bool))))
+
+
+def _pseudo_legal(flat: npt.NDArray[np.int8], boards: npt.NDArray[np.uint64]
+                  ) -> tuple[npt.NDArray[np.intp], npt.NDArray[np.intp]]:
+    """(position, action) pairs of white's pseudo-legal moves in white-to-move positions."""
+    occupied = np.bitwise_or.reduce(boards, axis=1)
+    # Black pieces other than the king, which promotions may take out.
+    black_men = np.bitwise_or.reduce(boards[:, 5:9], axis=1)
+
+    rows, squares = np.nonzero((flat >= 1) & (flat <= 5))
+    kinds = flat[rows, squares] - 1
+    targets = flat[rows]
+    steps = _REACH[kinds, squares] & ((targets == 0) | (targets >= 6)) \
+        & (_BETWEEN[squares] & occupied[rows, None] == 0)
+    pawns = kinds == PAWN
+    pawn_targets = targets[pawns]
+    pawn_steps = steps[pawns] & (pawn_targets == 0) | _PAWN_CAPTURES[squares[pawns]] & (pawn_targets >= 6)
+    # A pawn reaching the last row moves plainly only if it has nothing to take out.
+    pawn_steps &= _PROM_ALLOWED[squares[pawns]] & black_men[rows[pawns], None] == 0
+    steps[pawns] = pawn_steps
+    pairs, to = np.nonzero(steps)
+    plain_rows, plain_actions = rows[pairs], _STEP_ACTIONS[squares[pairs], to]
+
+    promoting = pawns & (squares >= 4) & (squares < 8)
+    prom_rows, cols = rows[promoting], squares[promoting] - 4
+    targets = targets[promoting]
+    new_cols = cols[:, None] + np.arange(-1, 2)
+    ahead = np.take_along_axis(targets, np.clip(new_cols, 0, 3), axis=1)
+    can_reach = (new_cols >= 0) & (new_cols < 4) & np.where(np.arange(3) == 1, ahead == 0, ahead >= 6)
+    takeable = (targets >= 6) & (targets <= 9)
+    pairs, shifts, taken = np.nonzero(_PROM_ALLOWED_SQUARES[cols] & can_reach[:, :, None] & takeable[:, None, :])
+    return (np.concatenate([plain_rows, prom_rows[pairs]]),
+            np.concatenate([plain_actions, _PROM_ACTIONS[cols[pairs], shifts, taken]]))
+
+
+def _legal(flat: npt.NDArray[np.int8], boards: npt.NDArray[np.uint64], rows: npt.NDArray[np.intp],
+           actions: npt.NDArray[np.intp]) -> npt.NDArray[np.bool_]:
+    """Which of white's pseudo-legal moves don't leave the white king attacked."""
+    after = boards[rows]
+    mover = flat[rows, _FROM[actions]] - 1
+    lands = ~(_PAWN_VANISHES[actions] & (mover == PAWN))
+    after &= ~_CLEARED[actions][:, None]
+    after[np.arange(len(rows)), mover] |= np.where(lands, _BIT[_TO[actions]], np.uint64(0))
+    return ~_white_in_check(after)
+
+
+def _masks(rows, actions, white_to_move, num_positions) -> npt.NDArray[np.bool_]:
+    masks = np.zeros((num_positions, NUM_ACTIONS), dtype=bool)
+    masks[rows, np.where(white_to_move[rows], actions, _MIRROR_ACTIONS[actions])] = True
+    return masks
+
+
+def pseudo_legal_masks(pieces: npt.NDArray[np.integer], white_to_move: npt.ArrayLike) -> npt.NDArray[np.bool_]:
+    """(N, NUM_ACTIONS) masks of the moves each position's pieces can make, ignoring checks
+    (the moves of HalfChessBoard(..., ignore_pins=True))."""
+    white = np.asarray(white_to_move, dtype=bool)
+    flat = _canonical(pieces, white)
+    rows, actions = _pseudo_legal(flat, bitboards(flat))
+    return _masks(rows, actions, white, len(flat))
+
+
+def legal_move_masks(pieces: npt.NDArray[np.integer], white_to_move: npt.ArrayLike) -> npt.NDArray[np.bool_]:
+    """(N, NUM_ACTIONS) masks of each position's legal moves, as encoder_decoder.legal_move_masks."""
+    white = np.asarray(white_to_move, dtype=bool)
+    flat = _canonical(pieces, white)
+    boards = bitboards(flat)
+    rows, actions = _pseudo_legal(flat, boards)
+    legal = _legal(flat, boards, rows, actions)
+    return _masks(rows[legal], actions[legal], white, len(flat))
+
+
+def results(pieces: npt.NDArray[np.integer], white_to_move: npt.ArrayLike,
+            masks: Optional[npt.NDArray[np.bool_]] = None) -> npt.NDArray[np.int8]:
+    """HalfChessBoard.result of each position (1, 0 or -1 for white), or ONGOING.
+    Pass the positions' legal_move_masks if already computed."""
+    white = np.asarray(white_to_move, dtype=bool)
+    if masks is None:
+        masks = legal_move_masks(pieces, white)
+    flat = np.asarray(pieces).reshape(len(pieces), 32)
+    counts = np.stack([(flat == code).sum(axis=1) for code in range(11)], axis=1)
+    kind_counts = counts[:, 1:6] + counts[:, 6:]
+    insufficient = (kind_counts[:, ROOK] == 0) & (kind_counts[:, PAWN] == 0) \
+        & (kind_counts[:, KNIGHT] + kind_counts[:, BISHOP] <= 1)
+
+    out = np.full(len(flat), ONGOING, dtype=np.int8)
+    out[insufficient] = 0
+    stuck = ~masks.any(axis=1)
+    out[stuck] = 0
+    mated = stuck & in_check(pieces, white)
+    out[mated] = np.where(white[mated], -1, 1)
+    return out
+
+
+if __name__ == '__main__':
+    from benchmark import sample_positions
+
+    NUM_GAMES = 100 if len(sys.argv) < 2 else int(sys.argv[1])
+
+    positions = sample_positions(NUM_GAMES)
+    pieces, white_to_move = pieces_of_boards(positions)
+    states = [(board.board, board.white_to_move) for board in positions]
+
+    start = time.perf_counter()
+    masks = legal_move_masks(pieces, white_to_move)
+    game_results = results(pieces, white_to_move, masks)
+    batch_rate = len(positions) / (time.perf_counter() - start)
+
+    start = time.perf_counter()
+    boards = [HalfChessBoard(state.copy(), white) for state, white in states]
+    expected = [board.legal_actions for board in boards]
+    loop_rate = len(positions) / (time.perf_counter() - start)
+
+    mismatches = sum(set(np.flatnonzero(mask).tolist()) != set(legal) for mask, legal in zip(masks, expected))
+    mismatches += sum((ONGOING if board.result() is None else board.result()) != result
+                      for board, result in zip(boards, game_results))
+    print(f'{len(positions)} positions, {mismatches} mismatches')
+    print(f'HalfChessBoard.legal_moves: {loop_rate:.0f} positions/s')
+    print(f'batch_movegen:              {batch_rate:.0f} positions/s')
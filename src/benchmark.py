@@ -0,0 +1,220 @@
+"""Benchmarks for the half-chess engine and search.
+
+Run as `python benchmark.py <name> [args...]`; with no name, lists the available benchmarks.
+"""
+
+import asyncio
+import os
+import sys
+import time
+import tracemalloc
+import numpy as np
+from half_chess_board import HalfChessBoard
+from encoder_decoder import encode_board, encode_boards
+from evaluator import NumpyEvaluator
+from mcts import MCTS, Node
+from transposition import TranspositionTable
+from search_metrics import JsonlSink
+from inference_server import InferenceServer
+from array_tree import ArrayMCTS, ArrayTree
+from parallel_mcts import SharedTreeMCTS, root_parallel_search
+from batch_movegen import pieces_of_boards, legal_move_masks, results
+
+
+def sample_positions(num_games: int, max_plies=100, seed=0) -> list[HalfChessBoard]:
+    """Positions from random games played out from the starting position."""
+    rng = np.random.default_rng(seed)
+    positions = []
+    for _ in range(num_games):
+        board = HalfChessBoard()
+        for _ in range(max_plies):
+            if board.result() is not None:
+                break
+            positions.append(board)
+            board = board.make_move(board.legal_moves[rng.integers(len(board.legal_moves))])
+    return positions
+
+
+def node_cost(num_games=10):
+    """Per-node cost of expanding an MCTS node: creating each child board, then
+    generating the legal moves of one of them as a later visit would."""
+    positions = [(p.board, p.white_to_move) for p in sample_positions(int(num_games))]
+
+    start = time.perf_counter()
+    for state, white_to_move in positions:
+        HalfChessBoard(state, white_to_move).legal_moves
+    generate = (time.perf_counter() - start) / len(positions)
+
+    boards = [HalfChessBoard(state, white_to_move) for state, white_to_move in positions]
+    children = sum(len(board.legal_moves) for board in boards)
+    start = time.perf_counter()
+    for board in boards:
+        for move in board.legal_moves:
+            board.make_move(move)
+    expand = (time.perf_counter() - start) / children
+
+    start = time.perf_counter()
+    for board in boards:
+        for move in board.legal_moves:
+            board.push(move)
+            board.pop()
+    push_pop = (time.perf_counter() - start) / children
+
+    print(f'positions:           {len(positions)}')
+    print(f'legal_moves:         {generate * 1e6:.1f} us/position')
+    print(f'make_move (child):   {expand * 1e6:.1f} us/child')
+    print(f'push + pop:          {push_pop * 1e6:.1f} us/move')
+    print(f'expanded node:       {(generate + expand * children / len(positions)) * 1e6:.1f} us/node')
+
+
+def search_batch(num_simulations=800, hidden=1024):
+    """MCTS simulations/sec from the starting position against evaluation batch size,
+    using the NumPy stand-in network on CPU."""
+    evaluator = NumpyEvaluator(hidden=int(hidden))
+    print('batch size   simulations/s')
+    for batch_size in (1, 2, 4, 8, 16, 32, 64):
+        root = Node(prior=0, state=HalfChessBoard())
+        start = time.perf_counter()
+        MCTS(evaluator, batch_size=batch_size).run(root, int(num_simulations))
+        print(f'{batch_size:>10}   {int(num_simulations) / (time.perf_counter() - start):>13.0f}')
+
+
+def encode(num_games=10):
+    """Positions/sec encoding one board at a time against encoding the batch into a preallocated buffer."""
+    boards = sample_positions(int(num_games))
+    out = np.empty([len(boards), 11, 8, 4], dtype=np.float32)
+
+    start = time.perf_counter()
+    for board in boards:
+        encode_board(board)
+    single = time.perf_counter() - start
+
+    start = time.perf_counter()
+    encode_boards(boards, out=out)
+    batch = time.perf_counter() - start
+
+    print(f'encode_board:   {len(boards) / single:.0f} positions/s')
+    print(f'encode_boards:  {len(boards) / batch:.0f} positions/s')
+
+
+def tree_memory(num_simulations=5000):
+    """Memory and simulations/sec of the object tree (mcts.Node) against the array tree."""
+    num_simulations = int(num_simulations)
+
+    def measure(build):
+        # Timed without tracing, since tracemalloc slows allocation-heavy code unevenly.
+        start = time.perf_counter()
+        build()
+        elapsed = time.perf_counter() - start
+        tracemalloc.start()
+        tree = build()
+        memory = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        return tree, elapsed, memory
+
+    def build_nodes():
+        root = Node(prior=0, state=HalfChessBoard())
+        MCTS().run(root, num_simulations)
+        return root
+
+    def build_arrays():
+        tree = ArrayTree(HalfChessBoard())
+        ArrayMCTS().run(tree, num_simulations)
+        return tree
+
+    for name, build in (('Node', build_nodes), ('ArrayTree', build_arrays)):
+        _, elapsed, memory = measure(build)
+        print(f'{name:<10} {num_simulations / elapsed:>8.0f} simulations/s {memory / 2**20:>8.1f} MiB')
+
+
+def search_metrics(num_simulations=2000, batch_size=16, hidden=1024):
+    """One metrics record (see search_metrics.py) per search from the starting position,
+    with and without a transposition table."""
+    evaluator = NumpyEvaluator(hidden=int(hidden))
+    for label, table in (('no-table', None), ('table', TranspositionTable())):
+        mcts = MCTS(evaluator, batch_size=int(batch_size), table=table, metrics=JsonlSink(config=label))
+        mcts.run(Node(prior=0, state=HalfChessBoard()), int(num_simulations))
+
+
+def inference_server(num_games=64, num_simulations=50, max_batch_size=256, max_wait_ms=1.0, hidden=1024):
+    """Evaluations/sec of num_games searches run one after another, each evaluating its own
+    batches of 8, against the same searches run concurrently through one InferenceServer."""
+    num_games, num_simulations = int(num_games), int(num_simulations)
+    evaluator = NumpyEvaluator(hidden=int(hidden))
+    mcts = MCTS(evaluator, batch_size=8)
+
+    roots = [Node(prior=0, state=HalfChessBoard()) for _ in range(num_games)]
+    start = time.perf_counter()
+    for root in roots:
+        mcts.run(root, num_simulations)
+    sequential = time.perf_counter() - start
+
+    async def concurrent():
+        async with InferenceServer(evaluator, int(max_batch_size), float(max_wait_ms)) as server:
+            roots = [Node(prior=0, state=HalfChessBoard()) for _ in range(num_games)]
+            start = time.perf_counter()
+            await asyncio.gather(*(mcts.run_async(root, num_simulations, server) for root in roots))
+            return server, time.perf_counter() - start
+
+    server, elapsed = asyncio.run(concurrent())
+    latencies = np.array(server.latencies) * 1000
+    print(f'sequential:       {num_games * num_simulations / sequential:.0f} simulations/s')
+    print(f'inference server: {num_games * num_simulations / elapsed:.0f} simulations/s, '
+          f'{server.requests / elapsed:.0f} evaluations/s, mean batch {server.mean_batch_size():.1f}, '
+          f'latency p50 {np.percentile(latencies, 50):.2f} ms p99 {np.percentile(latencies, 99):.2f} ms')
+
+
+def parallel(num_simulations=800, hidden=1024):
+    """Simulations/sec for one move decision against worker count, for root-parallel
+    processes and shared-tree threads, using the NumPy stand-in network."""
+    num_simulations = int(num_simulations)
+    evaluator = NumpyEvaluator(hidden=int(hidden))
+    print('workers   root-parallel/s   shared-tree/s')
+    for workers in sorted({1, 2, 4, os.cpu_count()}):
+        start = time.perf_counter()
+        root_parallel_search(HalfChessBoard(), num_simulations, workers, evaluator)
+        root_rate = num_simulations / (time.perf_counter() - start)
+
+        start = time.perf_counter()
+        SharedTreeMCTS(evaluator, num_threads=workers).run(Node(prior=0, state=HalfChessBoard()), num_simulations)
+        shared_rate = num_simulations / (time.perf_counter() - start)
+        print(f'{workers:>7}   {root_rate:>15.0f}   {shared_rate:>13.0f}')
+
+
+def batch_movegen(num_games=100):
+    """Positions/sec for legal moves and game results: looping over HalfChessBoard(...).legal_moves
+    against batch_movegen on batches of increasing size, from random-game positions."""
+    positions = sample_positions(int(num_games))
+    states = [(p.board, p.white_to_move) for p in positions]
+    pieces, white_to_move = pieces_of_boards(positions)
+
+    start = time.perf_counter()
+    for state, white in states:
+        board = HalfChessBoard(state.copy(), white)
+        board.legal_moves
+        board.result()
+    print(f'loop:        {len(states) / (time.perf_counter() - start):>9.0f} positions/s')
+    for batch_size in (1, 16, 256, 4096, len(states)):
+        start = time.perf_counter()
+        for i in range(0, len(states), batch_size):
+            masks = legal_move_masks(pieces[i:i + batch_size], white_to_move[i:i + batch_size])
+            results(pieces[i:i + batch_size], white_to_move[i:i + batch_size], masks)
+        print(f'batch {batch_size:>5}: {len(states) / (time.perf_counter() - start):>9.0f} positions/s')
+
+
+BENCHMARKS = {
+    'node_cost': node_cost,
+    'search_batch': search_batch,
+    'encode': encode,
+    'tree_memory': tree_memory,
+    'parallel': parallel,
+    'search_metrics': search_metrics,
+    'inference_server': inference_server,
+    'batch_movegen': batch_movegen,
+}
+
+if __name__ == '__main__':
+    if len(sys.argv) == 1 or sys.argv[1] not in BENCHMARKS:
+        print('benchmarks:', ', '.join(BENCHMARKS))
+    else:
+        BENCHMARKS[sys.argv[1]](*sys.argv[2:])
@@ -0,0 +1,332 @@
+"""Bitboard implementation of the half-chess board.
+
+Each piece type/colour is packed into a 32-bit integer with bit `row * 4 + col`
+set for every square it occupies. Knight, king and pawn attacks come from
+precomputed tables; rook and bishop attacks are looked up along precomputed rays.
+"""
+
+from __future__ import annotations
+from itertools import product
+import sys
+import time
+import numpy as np
+from typing import Optional
+from half_chess_board import HalfChessBoard, Move
+
+PIECES = 'RNBPKrnbpk'
+R, N, B, P, K, r, n, b, p, k = range(10)
+WHITE_PIECES = (R, N, B, P, K)
+BLACK_PIECES = (r, n, b, p, k)
+
+FULL = (1 << 32) - 1
+SQUARE_COORDS = [divmod(sq, 4) for sq in range(32)]
+
+
+def _valid(row: int, col: int) -> bool:
+    return 0 <= row < 8 and 0 <= col < 4
+
+
+def _bit(row: int, col: int) -> int:
+    return 1 << (row * 4 + col)
+
+
+def _step_table(steps) -> list[int]:
+    table = []
+    for row, col in SQUARE_COORDS:
+        mask = 0
+        for dr, dc in steps:
+            if _valid(row + dr, col + dc):
+                mask |= _bit(row + dr, col + dc)
+        table.append(mask)
+    return table
+
+
+KNIGHT_ATTACKS = _step_table([(1, 2), (1, -2), (-1, 2), (-1, -2),
+                              (2, 1), (2, -1), (-2, 1), (-2, -1)])
+KING_ATTACKS = _step_table([(dr, dc) for dr, dc in product((-1, 0, 1), (-1, 0, 1))
+                            if dr != 0 or dc != 0])
+# PAWN_ATTACKS[True] holds white pawn captures (towards row 0), PAWN_ATTACKS[False] black ones.
+PAWN_ATTACKS = {True: _step_table([(-1, -1), (-1, 1)]),
+                False: _step_table([(1, -1), (1, 1)])}
+
+ROOK_DIRECTIONS = ((1, 0), (-1, 0), (0, 1), (0, -1))
+BISHOP_DIRECTIONS = ((1, 1), (1, -1), (-1, 1), (-1, -1))
+
+
+def _ray(row: int, col: int, dr: int, dc: int) -> int:
+    mask = 0
+    row, col = row + dr, col + dc
+    while _valid(row, col):
+        mask |= _bit(row, col)
+        row, col = row + dr, col + dc
+    return mask
+
+
+# Each entry is (rays indexed by square, whether the ray runs towards higher squares).
+ROOK_RAYS = [([_ray(row, col, dr, dc) for row, col in SQUARE_COORDS], dr > 0 or dr == 0 and dc > 0)
+             for dr, dc in ROOK_DIRECTIONS]
+BISHOP_RAYS = [([_ray(row, col, dr, dc) for row, col in SQUARE_COORDS], dr > 0)
+               for dr, dc in BISHOP_DIRECTIONS]
+
+ROW_MASKS = [0b1111 << (4 * row) for row in range(8)]
+COL_MASKS = [sum(1 << (4 * row + col) for row in range(8)) for col in range(4)]
+
+
+def slide_attacks(sq: int, occupied: int, rays) -> int:
+    """Squares reached from sq along the given rays, stopping at (and including) the first blocker."""
+    attacks = 0
+    for table, positive in rays:
+        ray = table[sq]
+        blockers = ray & occupied
+        if blockers:
+            if positive:
+                first = (blockers & -blockers).bit_length() - 1
+            else:
+                first = blockers.bit_length() - 1
+            ray ^= table[first]
+        attacks |= ray
+    return attacks
+
+
+def squares(bb: int):
+    """Yields the square indices of the set bits of bb in ascending order."""
+    while bb:
+        lsb = bb & -bb
+        yield lsb.bit_length() - 1
+        bb ^= lsb
+
+
+def is_attacked(sq: int, by_white: bool, pieces: list[int], occupied: int) -> bool:
+    """Whether square sq is attacked by the given side."""
+    base = 0 if by_white else 5
+    if KNIGHT_ATTACKS[sq] & pieces[base + N]:
+        return True
+    if KING_ATTACKS[sq] & pieces[base + K]:
+        return True
+    # A pawn attacks sq if it stands where an opposite-coloured pawn on sq would capture.
+    if PAWN_ATTACKS[not by_white][sq] & pieces[base + P]:
+        return True
+    if slide_attacks(sq, occupied, ROOK_RAYS) & pieces[base + R]:
+        return True
+    if slide_attacks(sq, occupied, BISHOP_RAYS) & pieces[base + B]:
+        return True
+    return False
+
+
+class BitboardHalfChessBoard:
+    """Drop-in alternative to HalfChessBoard backed by one bitboard per piece type/colour."""
+
+    point_values = [5, 3, 3, 1, 0, -5, -3, -3, -1, 0]
+
+    def __init__(self, board=None, white_to_move=True, ignore_pins=False, pieces=None):
+        if pieces is None:
+            if board is None:
+                board = HalfChessBoard.START_BOARD
+            pieces = [0] * 10
+            for (row, col), piece in np.ndenumerate(board):
+                if piece != ' ':
+                    pieces[PIECES.index(piece)] |= _bit(row, col)
+        self.pieces = pieces
+        self.white_to_move = white_to_move
+        self.ignore_pins = ignore_pins
+        self.__legal_moves = None
+
+    @property
+    def legal_moves(self) -> list[Move]:
+        """Legal moves in position, generated on first access and cached."""
+        if self.__legal_moves is None:
+            self.__legal_moves = self.__get_legal_moves()
+        return self.__legal_moves
+
+    @property
+    def board(self) -> np.ndarray:
+        """The position as the 8x4 character array used by HalfChessBoard."""
+        state = np.full([8, 4], ' ')
+        for piece, bb in enumerate(self.pieces):
+            for sq in squares(bb):
+                state[SQUARE_COORDS[sq]] = PIECES[piece]
+        return state
+
+    def __repr__(self) -> str:
+        return '\n'.join('|' + '|'.join(row) + '|' for row in self.board) + '\n'
+
+    def __occupancy(self) -> tuple[int, int]:
+        pieces = self.pieces
+        white = pieces[R] | pieces[N] | pieces[B] | pieces[P] | pieces[K]
+        black = pieces[r] | pieces[n] | pieces[b] | pieces[p] | pieces[k]
+        return white, black
+
+    def __get_legal_moves(self) -> list[Move]:
+        """Gives array of legal moves in position."""
+        pieces = self.pieces
+        white, black = self.__occupancy()
+        if self.white_to_move:
+            base, own, opp, forward, last_row = 0, white, black, -4, 0
+            opp_king = pieces[k]
+        else:
+            base, own, opp, forward, last_row = 5, black, white, 4, 7
+            opp_king = pieces[K]
+        occupied = white | black
+        not_own = ~own & FULL
+
+        moves = []
+        for sq in squares(pieces[base + N]):
+            for to in squares(KNIGHT_ATTACKS[sq] & not_own):
+                moves.append(Move(*SQUARE_COORDS[sq], *SQUARE_COORDS[to]))
+        for sq in squares(pieces[base + K]):
+            for to in squares(KING_ATTACKS[sq] & not_own):
+                moves.append(Move(*SQUARE_COORDS[sq], *SQUARE_COORDS[to]))
+        for sq in squares(pieces[base + R]):
+            for to in squares(slide_attacks(sq, occupied, ROOK_RAYS) & not_own):
+                moves.append(Move(*SQUARE_COORDS[sq], *SQUARE_COORDS[to]))
+        for sq in squares(pieces[base + B]):
+            for to in squares(slide_attacks(sq, occupied, BISHOP_RAYS) & not_own):
+                moves.append(Move(*SQUARE_COORDS[sq], *SQUARE_COORDS[to]))
+        for sq in squares(pieces[base + P]):
+            row, col = SQUARE_COORDS[sq]
+            if row == last_row:
+                continue
+            promotes = row + forward // 4 == last_row
+            # A promoting pawn may also take out any opposing piece other than the king.
+            capturable = opp & ~opp_king if promotes else 0
+            to = sq + forward
+            if not occupied >> to & 1:
+                if capturable:
+                    for cap in squares(capturable):
+                        moves.append(Move(row, col, *SQUARE_COORDS[to], *SQUARE_COORDS[cap]))
+                else:
+                    moves.append(Move(row, col, *SQUARE_COORDS[to]))
+            for to in squares(PAWN_ATTACKS[self.white_to_move][sq] & opp):
+                new_r, new_c = SQUARE_COORDS[to]
+                # Mirrors HalfChessBoard, which skips squares sharing a row or column with the target.
+                allowed = capturable & ~ROW_MASKS[new_r] & ~COL_MASKS[new_c]
+                if allowed:
+                    for cap in squares(allowed):
+                        moves.append(Move(row, col, new_r, new_c, *SQUARE_COORDS[cap]))
+                else:
+                    moves.append(Move(row, col, new_r, new_c))
+
+        if self.ignore_pins:
+            return moves
+        return [m for m in moves if not self.__in_check_after_move(m, occupied)]
+
+    def __in_check_after_move(self, move: Move, occupied: int) -> bool:
+        pieces = self.pieces
+        old_r, old_c, new_r, new_c, prom_r, prom_c = move
+        from_bit = _bit(old_r, old_c)
+        to_bit = _bit(new_r, new_c)
+        removed = to_bit
+        if prom_r is not None and prom_c is not None:
+            removed |= _bit(prom_r, prom_c)
+        own_king = pieces[K] if self.white_to_move else pieces[k]
+
+        if own_king & from_bit:
+            own_king = to_bit
+        if not own_king:
+            return False
+
+        after = occupied & ~from_bit & ~removed
+        promoting = (pieces[P] | pieces[p]) & from_bit and new_r in (0, 7)
+        if not promoting:
+            after |= to_bit
+        if self.white_to_move:
+            opponent = [0] * 5 + [bb & ~removed for bb in pieces[5:]]
+        else:
+            opponent = [bb & ~removed for bb in pieces[:5]] + [0] * 5
+        return is_attacked(own_king.bit_length() - 1, not self.white_to_move, opponent, after)
+
+    def make_move(self, move: Move, future=False) -> BitboardHalfChessBoard:
+        """NOT IN-PLACE; RETURNS NEW BOARD. Same semantics as HalfChessBoard.make_move."""
+        old_r, old_c, new_r, new_c, prom_r, prom_c = move
+
+        if not future and move not in self.legal_moves:
+            raise ValueError('invalid move')
+
+        pieces = list(self.pieces)
+        if old_r == new_r and old_c == new_c:
+            return BitboardHalfChessBoard(white_to_move=not self.white_to_move,
+                                          ignore_pins=future, pieces=pieces)
+        from_bit = _bit(old_r, old_c)
+        to_bit = _bit(new_r, new_c)
+        mover = next(i for i, bb in enumerate(pieces) if bb & from_bit)
+        for i in range(10):
+            pieces[i] &= ~to_bit
+        pieces[mover] ^= from_bit
+        if not (mover == P and new_r == 0 or mover == p and new_r == 7):
+            pieces[mover] |= to_bit
+        elif prom_r is not None and prom_c is not None:
+            prom_bit = _bit(prom_r, prom_c)
+            for i in range(10):
+                pieces[i] &= ~prom_bit
+
+        return BitboardHalfChessBoard(white_to_move=not self.white_to_move,
+                                      ignore_pins=future, pieces=pieces)
+
+    def __in_check(self) -> bool:
+        own_king = self.pieces[K] if self.white_to_move else self.pieces[k]
+        if not own_king:
+            return False
+        white, black = self.__occupancy()
+        return is_attacked(own_king.bit_length() - 1, not self.white_to_move,
+                           self.pieces, white | black)
+
+    def result(self) -> Optional[int]:
+        """Returns result of game.
+        None if the game is still ongoing,
+        0 for stalemate,
+        -1 for black win,
+        1 for white win."""
+        if self.legal_moves != []:
+            if self.__draw_by_insufficient_material():
+                return 0
+            return None
+        if not self.__in_check():
+            return 0
+        if self.white_to_move:
+            return -1
+        return 1
+
+    def material_advantage(self) -> int:
+        """Returns white's material advantage; negative if black is up."""
+        return sum(value * bb.bit_count() for value, bb in zip(self.point_values, self.pieces))
+
+    def __draw_by_insufficient_material(self) -> bool:
+        pieces = self.pieces
+        others = pieces[R] | pieces[P] | pieces[r] | pieces[p]
+        minors = pieces[N] | pieces[B] | pieces[n] | pieces[b]
+        return not others and minors.bit_count() <= 1
+
+
+if __name__ == '__main__':
+    # Plays random games with both implementations, checking they agree and timing move generation.
+    NUM_GAMES = 20 if len(sys.argv) == 1 else int(sys.argv[1])
+    rng = np.random.default_rng(0)
+    games = []
+    for _ in range(NUM_GAMES):
+        board = HalfChessBoard()
+        positions = []
+        while board.result() is None and len(positions) < 100:
+            positions.append((board.board, board.white_to_move))
+            board = board.make_move(board.legal_moves[rng.integers(len(board.legal_moves))])
+        games.append(positions)
+
+    timings = {}
+    for cls in (HalfChessBoard, BitboardHalfChessBoard):
+        start = time.perf_counter()
+        count = 0
+        for positions in games:
+            for state, white_to_move in positions:
+                count += len(cls(state, white_to_move).legal_moves)
+        timings[cls.__name__] = time.perf_counter() - start
+
+    for positions in games:
+        for state, white_to_move in positions:
+            slow = HalfChessBoard(state, white_to_move)
+            fast = BitboardHalfChessBoard(state, white_to_move)
+            assert set(slow.legal_moves) == set(fast.legal_moves)
+            assert slow.result() == fast.result()
+            assert slow.material_advantage() == fast.material_advantage()
+
+    num_positions = sum(len(positions) for positions in games)
+    for name, seconds in timings.items():
+        print(f'{name}: {num_positions / seconds:.0f} positions/s')
@@ -0,0 +1,286 @@
+"""Module for saving MCTS trees and self-play games in progress, and resuming from them
+
+A tree file holds every distinct node reachable from a root (transposed
+positions are stored once) as a 64-byte header, a hash index (the nodes'
+Zobrist hashes sorted into one contiguous uint64 array, then the matching
+uint32 node indices), NODE_DTYPE records in breadth-first order with the root
+first, and EDGE_DTYPE records.
+A node's edges are the block [first_edge, first_edge + num_edges), each
+giving a move's action id and the child's node index. Every node carries its
+position (32 ASCII squares and the side to move) and Zobrist hash next to its
+prior, visit count and value sum, so a subtree can be rebuilt from any node
+without replaying moves from the root.
+
+TreeSnapshot memory-maps a tree file. Its statistics can be read without
+building a tree; to_tree rebuilds mcts.Node objects below any node, so MCTS.run
+continues the search where it stopped. find locates a position by hash, so a
+tree from an earlier run can warm-start the analysis of positions it covers;
+it bisects the hash index in place, reading a few pages per lookup.
+
+GameCheckpoint saves a self-play game in progress (see selfplay.play_game):
+its moves, the search policies recorded so far and the random generator state,
+and, as often as the caller chooses, the current search tree, each file
+replaced atomically. Saving a tree walks every node in Python, so it costs far
+more than saving the game.
+"""
+
+import json
+import os
+import sys
+import time
+from collections import deque
+from typing import Optional
+import numpy as np
+import numpy.typing as npt
+from half_chess_board import HalfChessBoard, ACTION_MOVES, ACTION_IDS
+from encoder_decoder import NUM_ACTIONS
+from mcts import Node
+from transposition import TranspositionTable
+from sample_store import POLICY_DTYPE
+
+TREE_MAGIC = b'HCMT'
+GAME_MAGIC = b'HCSG'
+VERSION = 2
+HEADER_BYTES = 64
+
+NODE_DTYPE = np.dtype([
+    ('hash', '<u8'),             # HalfChessBoard.zobrist_hash
+    ('board', 'u1', (32,)),      # the 8x4 board as ASCII characters, row by row
+    ('white_to_move', 'u1'),
+    ('prior', '<f4'),
+    ('visits', '<i4'),
+    ('value', '<f8'),            # value sum from the perspective of the player who moved into the node
+    ('first_edge', '<u8'),
+    ('num_edges', '<u2'),
+])
+
+EDGE_DTYPE = np.dtype([
+    ('action', '<u2'),
+    ('child', '<u4'),
+])
+
+
+def _replace(path: str, chunks) -> None:
+    """Writes chunks (bytes or arrays) to path through a temporary file, so a crash
+    mid-write leaves the previous file intact."""
+    with open(path + '.tmp', 'wb') as f:
+        for chunk in chunks:
+            f.write(chunk if isinstance(chunk, bytes) else np.ascontiguousarray(chunk).tobytes())
+    os.replace(path + '.tmp', path)
+
+
+def save_tree(root: Node, path: str) -> int:
+    """Writes the tree below root to path; returns the number of nodes written."""
+    index = {root: 0}
+    order = [root]
+    actions, children = [], []
+    first_edge = []
+    queue = deque([root])
+    while queue:
+        node = queue.popleft()
+        first_edge.append(len(actions))
+        for move, child in node.children.items():
+            child_index = index.get(child)
+            if child_index is None:
+                child_index = index[child] = len(order)
+                order.append(child)
+                queue.append(child)
+            actions.append(ACTION_IDS[move])
+            children.append(child_index)
+
+    nodes = np.zeros(len(order), dtype=NODE_DTYPE)
+    nodes['hash'] = [node.state.zobrist_hash for node in order]
+    nodes['board'] = np.stack([node.state.board for node in order]).astype('S1').view(np.uint8).reshape(-1, 32)
+    nodes['white_to_move'] = [node.state.white_to_move for node in order]
+    nodes['prior'] = [node.prior for node in order]
+    nodes['visits'] = [node.visits for node in order]
+    nodes['value'] = [node.value for node in order]
+    nodes['first_edge'] = first_edge
+    nodes['num_edges'] = [len(node.children) for node in order]
+    edges = np.zeros(len(actions), dtype=EDGE_DTYPE)
+    edges['action'] = actions
+    edges['child'] = children
+
+    by_hash = np.argsort(nodes['hash'], kind='stable')
+    header = TREE_MAGIC + np.array([VERSION], '<u4').tobytes() + np.array([len(nodes), len(edges)], '<u8').tobytes()
+    _replace(path, [header.ljust(HEADER_BYTES, b'\0'), nodes['hash'][by_hash].astype('<u8'),
+                    by_hash.astype('<u4'), nodes, edges])
+    return len(nodes)
+
+
+class TreeSnapshot:
+    """Read-only, memory-mapped view of a tree file written by save_tree."""
+
+    def __init__(self, path: str):
+        with open(path, 'rb') as f:
+            header = f.read(HEADER_BYTES)
+        if header[:4] != TREE_MAGIC or np.frombuffer(header[4:8], '<u4')[0] != VERSION:
+            raise ValueError(f'{path} is not a version {VERSION} half-chess search tree')
+        num_nodes, num_edges = (int(n) for n in np.frombuffer(header[8:24], '<u8'))
+        offset = HEADER_BYTES
+        self.hashes = np.memmap(path, dtype='<u8', mode='r', offset=offset, shape=(num_nodes,))
+        offset += self.hashes.nbytes
+        self.by_hash = np.memmap(path, dtype='<u4', mode='r', offset=offset, shape=(num_nodes,))
+        offset += self.by_hash.nbytes
+        self.nodes = np.memmap(path, dtype=NODE_DTYPE, mode='r', offset=offset, shape=(num_nodes,))
+        offset += self.nodes.nbytes
+        if num_edges:
+            self.edges = np.memmap(path, dtype=EDGE_DTYPE, mode='r', offset=offset, shape=(num_edges,))
+        else:
+            self.edges = np.zeros(0, dtype=EDGE_DTYPE)
+
+    def __len__(self) -> int:
+        return len(self.nodes)
+
+    def state(self, index: int) -> HalfChessBoard:
+        record = self.nodes[index]
+        board = record['board'].view('S1').astype('<U1').reshape(8, 4)
+        return HalfChessBoard(board, bool(record['white_to_move']))
+
+    def find(self, zobrist_hash: int) -> Optional[int]:
+        """Index of a node with the given HalfChessBoard.zobrist_hash, or None."""
+        i = self.hashes.searchsorted(np.uint64(zobrist_hash))
+        if i < len(self.hashes) and self.hashes[i] == zobrist_hash:
+            return int(self.by_hash[i])
+        return None
+
+    def to_tree(self, index=0, table: Optional[TranspositionTable] = None) -> Node:
+        """Rebuilds the nodes below index as mcts.Node objects and returns the one at index.
+        With a table, every node is filed under its hash, as MCTS(table=...) would have."""
+        # Find the reachable nodes first, so their fields are read from the map in bulk.
+        first_edges = np.asarray(self.nodes['first_edge'])
+        num_edges = np.asarray(self.nodes['num_edges'])
+        edge_children = np.asarray(self.edges['child'])
+        position = {index: 0}
+        order = [index]
+        for i in order:
+            start = int(first_edges[i])
+            for child in edge_children[start:start + int(num_edges[i])].tolist():
+                if child not in position:
+                    position[child] = len(order)
+                    order.append(child)
+
+        records = self.nodes[np.array(order)]
+        boards = records['board'].view('S1').astype('<U1').reshape(-1, 8, 4)
+        nodes = [Node(prior=prior, state=HalfChessBoard(board, bool(white)))
+                 for prior, board, white in zip(records['prior'].tolist(), boards, records['white_to_move'])]
+        for node, visits, value in zip(nodes, records['visits'].tolist(), records['value'].tolist()):
+            node.visits = visits
+            node.value = value
+        if table is not None:
+            for node, key in zip(nodes, records['hash'].tolist()):
+                table.store(key).node = node
+        edge_actions = np.asarray(self.edges['action'])
+        for node, start, count in zip(nodes, records['first_edge'].tolist(), records['num_edges'].tolist()):
+            if count:
+                node.children = {ACTION_MOVES[action]: nodes[position[child]] for action, child in
+                                 zip(edge_actions[start:start + count].tolist(),
+                                     edge_children[start:start + count].tolist())}
+        return nodes[0]
+
+    def warm_start(self, board: HalfChessBoard, table: Optional[TranspositionTable] = None) -> Optional[Node]:
+        """The subtree searched from board's position in an earlier run, or None if it isn't in the snapshot."""
+        index = self.find(board.zobrist_hash)
+        if index is None:
+            return None
+        if self.nodes['white_to_move'][index] != board.white_to_move \
+                or not (self.state(index).board == board.board).all():
+            return None
+        return self.to_tree(index, table)
+
+
+class GameCheckpoint:
+    """A self-play game in progress, saved as <prefix>.game and its search tree as <prefix>.tree.
+
+    The game file is a 64-byte header, a JSON document (random generator state and
+    the number of leading book plies), the game's action ids from the starting
+    position, and the search policy of every searched ply as POLICY_DTYPE entries."""
+
+    def __init__(self, prefix: str):
+        self.game_path = prefix + '.game'
+        self.tree_path = prefix + '.tree'
+
+    def exists(self) -> bool:
+        return os.path.exists(self.game_path)
+
+    def save(self, actions: list[int], book_plies: int, policies: list[npt.NDArray[np.float32]],
+             rng: np.random.Generator, root: Optional[Node] = None) -> None:
+        """Saves the game after its moves (actions), of which the first book_plies came from a
+        book, and the search policies of the later ones. The search tree is saved only if root
+        is given; load finds the current position in whichever tree was saved last."""
+        if root is not None:
+            save_tree(root, self.tree_path)
+        meta = json.dumps({'rng': rng.bit_generator.state, 'book_plies': book_plies}).encode()
+        dense = np.array(policies, dtype=np.float32).reshape(len(policies), NUM_ACTIONS)
+        rows, columns = np.nonzero(dense)
+        entries = np.empty(len(rows), dtype=POLICY_DTYPE)
+        entries['action'] = columns
+        entries['prob'] = dense[rows, columns]
+        counts = np.bincount(rows, minlength=len(policies)).astype('<u2')
+        header = GAME_MAGIC + np.array([VERSION, len(meta), len(actions), len(policies)], '<u4').tobytes() \
+            + np.array([len(entries)], '<u8').tobytes()
+        _replace(self.game_path, [header.ljust(HEADER_BYTES, b'\0'), meta,
+                                  np.array(actions, '<u2'), counts, entries])
+
+    def load(self, rng: np.random.Generator, table: Optional[TranspositionTable] = None
+             ) -> tuple[list[int], int, list[npt.NDArray[np.float32]], Optional[Node]]:
+        """(actions, book_plies, policies, search tree root) of the saved game; restores rng's state.
+        The root is the saved tree's subtree for the position after actions, or None if the
+        tree file is missing or does not contain that position."""
+        with open(self.game_path, 'rb') as f:
+            data = f.read()
+        if data[:4] != GAME_MAGIC or np.frombuffer(data[4:8], '<u4')[0] != VERSION:
+            raise ValueError(f'{self.game_path} is not a version {VERSION} self-play checkpoint')
+        meta_len, num_actions, num_policies = (int(n) for n in np.frombuffer(data[8:20], '<u4'))
+        num_entries = int(np.frombuffer(data[20:28], '<u8')[0])
+        offset = HEADER_BYTES
+        meta = json.loads(data[offset:offset + meta_len])
+        offset += meta_len
+        actions = np.frombuffer(data, '<u2', num_actions, offset).tolist()
+        offset += 2 * num_actions
+        counts = np.frombuffer(data, '<u2', num_policies, offset).astype(np.intp)
+        offset += 2 * num_policies
+        entries = np.frombuffer(data, POLICY_DTYPE, num_entries, offset)
+
+        dense = np.zeros((num_policies, NUM_ACTIONS), dtype=np.float32)
+        dense[np.repeat(np.arange(num_policies), counts), entries['action']] = entries['prob']
+        rng.bit_generator.state = meta['rng']
+
+        root = None
+        if os.path.exists(self.tree_path):
+            board = HalfChessBoard()
+            for action in actions:
+                board = board.make_move(ACTION_MOVES[action])
+            root = TreeSnapshot(self.tree_path).warm_start(board, table)
+        return actions, meta['book_plies'], list(dense), root
+
+    def remove(self) -> None:
+        for path in (self.game_path, self.tree_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+
+if __name__ == '__main__':
+    from mcts import MCTS
+
+    NUM_SIMULATIONS = 10_000 if len(sys.argv) < 2 else int(sys.argv[1])
+    PATH = 'search.tree' if len(sys.argv) < 3 else sys.argv[2]
+
+    mcts = MCTS(batch_size=16, table=TranspositionTable())
+    root = Node(prior=0, state=HalfChessBoard())
+    mcts.run(root, NUM_SIMULATIONS)
+
+    start = time.perf_counter()
+    count = save_tree(root, PATH)
+    print(f'saved {count} nodes ({os.path.getsize(PATH)} bytes) in {time.perf_counter() - start:.2f}s')
+    start = time.perf_counter()
+    snapshot = TreeSnapshot(PATH)
+    print(f'mapped in {(time.perf_counter() - start) * 1000:.2f} ms; root visits {snapshot.nodes["visits"][0]}')
+    start = time.perf_counter()
+    table = TranspositionTable()
+    restored = snapshot.to_tree(0, table)
+    print(f'rebuilt {len(table)} nodes in {time.perf_counter() - start:.2f}s')
+
+    # The restored tree continues where the original stopped.
+    MCTS(batch_size=16, table=table).run(restored, NUM_SIMULATIONS)
+    print(f'resumed: root visits {restored.visits}')
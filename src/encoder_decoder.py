@@ -1,68 +1,111 @@
-from itertools import product
+from typing import Optional
 import numpy as np
 import numpy.typing as npt
-from half_chess_board import HalfChessBoard, Move
+from half_chess_board import (HalfChessBoard, Move, NUM_ACTIONS, ACTION_MOVES, ACTION_IDS, MIRROR_ACTIONS,
+                              _plain_action, _promotion_action)
+
+PIECE_PLANES = 'RNBPKrnbpk'
+# Maps a character's code point to its plane; empty squares map to the side-to-move plane
+# index 10 and are dropped before writing.
+_PLANE_OF_CODE = np.full(128, 10, dtype=np.intp)
+for _plane, _piece in enumerate(PIECE_PLANES):
+    _PLANE_OF_CODE[ord(_piece)] = _plane
+_PIECE_OF_PLANE = np.array(list(PIECE_PLANES + ' '))
+
+def encode_states(states: npt.NDArray[np.str_], white_to_move: npt.ArrayLike,
+                  out: Optional[npt.NDArray] = None, dtype=np.uint8) -> npt.NDArray:
+    """Encodes N positions given as an (N, 8, 4) character array and N side-to-move flags
+    into an (N, 11, 8, 4) array, writing into out if given."""
+    states = np.asarray(states, dtype='<U1')
+    num = len(states)
+    if out is None:
+        out = np.zeros([num, 11, 8, 4], dtype=dtype)
+    else:
+        if out.shape != (num, 11, 8, 4):
+            raise ValueError(f'out has shape {out.shape}, expected {(num, 11, 8, 4)}')
+        out[...] = 0
+    planes = _PLANE_OF_CODE[states.view(np.uint32)]
+    n, r, c = np.nonzero(planes != 10)
+    out[n, planes[n, r, c], r, c] = 1
+    out[:, 10] = np.asarray(white_to_move, dtype=bool)[:, None, None]
+    return out
+
+def encode_boards(boards: list[HalfChessBoard], out: Optional[npt.NDArray] = None,
+                  dtype=np.uint8) -> npt.NDArray:
+    """Encodes a batch of boards into an (N, 11, 8, 4) array, writing into out if given."""
+    return encode_states(np.stack([board.board for board in boards]),
+                         [board.white_to_move for board in boards], out=out, dtype=dtype)
 
 def encode_board(board: HalfChessBoard) -> npt.NDArray[np.int_]:
-    state = board.board
-    encoded = np.zeros([11, 8, 4]).astype(int)
-    encoder_dict = {'R': 0, 'N': 1, 'B': 2, 'P': 3, 'K': 4,
-                    'r': 5, 'n': 6, 'b': 7, 'p': 8, 'k': 9}
-    for r, c in product(range(8), range(4)):
-        if state[r, c] != ' ':
-            encoded[encoder_dict[state[r, c]]][r][c] = 1
-    if board.white_to_move:
-        encoded[10, :, :] = 1
-    return encoded
+    return encode_boards([board], dtype=int)[0]
+
+def decode_states(encoded: npt.NDArray) -> tuple[npt.NDArray[np.str_], npt.NDArray[np.bool_]]:
+    """Inverse of encode_states: returns the (N, 8, 4) character array and side-to-move flags."""
+    pieces = encoded[:, :10]
+    planes = np.where(pieces.any(axis=1), pieces.argmax(axis=1), 10)
+    return _PIECE_OF_PLANE[planes], encoded[:, 10, 0, 0] == 1
+
+def decode_boards(encoded: npt.NDArray) -> list[HalfChessBoard]:
+    """Decodes an (N, 11, 8, 4) array into a list of boards."""
+    states, white_to_move = decode_states(encoded)
+    return [HalfChessBoard(board=state, white_to_move=bool(white))
+            for state, white in zip(states, white_to_move)]
 
 def decode_board(encoded: npt.NDArray[np.int_]) -> HalfChessBoard:
-    state = np.full([8, 4], ' ')
-    decoder_dict = 'RNBPKrnbpk'
-    for piece, r, c in product(range(10), range(8), range(4)):
-        if encoded[piece, r, c] == 1:
-            state[r, c] = decoder_dict[piece]
-    return HalfChessBoard(
-        board = state,
-        white_to_move = encoded[10, 0, 0] == 1
-    )
+    return decode_boards(encoded[np.newaxis])[0]
 
-def encode_action(move: Move) -> int:
+def _compute_action_id(move: Move) -> int:
     old_row, old_col, new_row, new_col, prom_row, prom_col = move
-
     if prom_row is None or prom_col is None:
-        encoded = new_col
-        encoded = encoded * 8 + new_row
-        encoded = encoded * 4 + old_col
-        encoded = encoded * 8 + old_row
-        return encoded
+        return _plain_action(old_row, old_col, new_row, new_col)
+    return _promotion_action(old_row, old_col, new_col, prom_row, prom_col)
 
-    color = old_row % 2 # old_row must be 1 or 6 for promotions;
-    column_shift = new_col - old_col + 1
-    encoded = prom_col
-    encoded = encoded * 8 + prom_row
-    encoded = encoded * 4 + old_col
-    encoded = encoded * 3 + column_shift
-    encoded = encoded * 2 + color
+def encode_action(move: Move) -> int:
+    encoded = ACTION_IDS.get(move)
+    return _compute_action_id(move) if encoded is None else encoded
 
-    return encoded + 1024
+def decode_action(encoded: int) -> Move:
+    return ACTION_MOVES[encoded]
 
+# Plane order after swapping colours: white piece planes trade places with black ones.
+_MIRROR_PLANES = [5, 6, 7, 8, 9, 0, 1, 2, 3, 4, 10]
 
-def decode_action(encoded: int) -> Move:
-    if encoded < 1024:
-        encoded, old_row = divmod(encoded, 8)
-        encoded, old_col = divmod(encoded, 4)
-        encoded, new_row = divmod(encoded, 8)
-        encoded, new_col = divmod(encoded, 4)
-        return Move(old_row, old_col, new_row, new_col)
-    encoded -= 1024
-    encoded, color = divmod(encoded, 2)
-    encoded, column_shift = divmod(encoded, 3)
-    encoded, old_col = divmod(encoded, 4)
-    encoded, prom_row = divmod(encoded, 8)
-    encoded, prom_col = divmod(encoded, 4)
-    old_row, new_row = (6, 7) if color == 0 else (1, 0)
-    new_col = old_col + column_shift - 1
-    return Move(old_row, old_col, new_row, new_col, prom_row, prom_col)
+def mirror_states(encoded: npt.NDArray) -> npt.NDArray:
+    """encode_states output for the mirror images (HalfChessBoard.mirror) of the encoded positions."""
+    mirrored = encoded[:, _MIRROR_PLANES, ::-1]
+    mirrored[:, 10] = 1 - mirrored[:, 10]
+    return mirrored
+
+def mirror_policies(policies: npt.NDArray) -> npt.NDArray:
+    """(N, NUM_ACTIONS) policies over action ids, moved onto the mirrored actions."""
+    return policies[:, MIRROR_ACTIONS]
+
+def legal_action_ids(board: HalfChessBoard) -> npt.NDArray[np.intp]:
+    """Action ids of board.legal_moves, in the same order."""
+    return np.frombuffer(board.legal_actions, dtype=np.uint16).astype(np.intp)
+
+def legal_move_masks(boards: list[HalfChessBoard],
+                     out: Optional[npt.NDArray[np.bool_]] = None) -> npt.NDArray[np.bool_]:
+    """(N, NUM_ACTIONS) boolean array marking the legal actions of each board."""
+    if out is None:
+        out = np.zeros([len(boards), NUM_ACTIONS], dtype=bool)
+    else:
+        out[...] = False
+    for row, board in zip(out, boards):
+        row[legal_action_ids(board)] = True
+    return out
+
+def legal_move_mask(board: HalfChessBoard) -> npt.NDArray[np.bool_]:
+    return legal_move_masks([board])[0]
+
+def masked_softmax(logits: npt.NDArray, mask: npt.NDArray[np.bool_]) -> npt.NDArray:
+    """Softmax over the last axis restricted to mask; masked-out actions get probability 0.
+    Rows without any legal action come out as all zeros."""
+    masked = np.where(mask, logits, -np.inf)
+    peak = masked.max(axis=-1, keepdims=True)
+    probs = np.exp(masked - np.where(np.isfinite(peak), peak, 0))
+    total = probs.sum(axis=-1, keepdims=True)
+    return np.divide(probs, total, out=np.zeros_like(probs), where=total > 0)
 
 if __name__ == '__main__':
     b = HalfChessBoard(
@@ -0,0 +1,61 @@
+"""Module providing evaluators that score batches of positions for MCTS"""
+
+import numpy as np
+import numpy.typing as npt
+from half_chess_board import HalfChessBoard, Move
+from encoder_decoder import encode_boards, legal_action_ids, masked_softmax, NUM_ACTIONS
+
+
+class Evaluator:
+    """Interface for position evaluators plugged into MCTS.
+
+    evaluate takes a batch of states and returns their values, each from the
+    perspective of the player to move, and their policies, each a dictionary
+    of legal moves to probabilities."""
+
+    def evaluate(self, states: list[HalfChessBoard]) -> tuple[npt.NDArray[np.float32], list[dict[Move, float]]]:
+        raise NotImplementedError
+
+
+class PredictEvaluator(Evaluator):
+    """Evaluates a batch one state at a time with a single-state predict function
+    such as mcts.dummy_model_predict."""
+
+    def __init__(self, predict):
+        self.predict = predict
+
+    def evaluate(self, states):
+        values, policies = [], []
+        for state in states:
+            value, policy = self.predict(state)
+            values.append(value)
+            policies.append(policy)
+        return np.array(values, dtype=np.float32), policies
+
+
+class NumpyEvaluator(Evaluator):
+    """Stand-in for a real network: a randomly initialised two-layer perceptron
+    over the encode_board planes, with a tanh value head and a policy head over
+    the encode_action ids, softmaxed over the legal moves."""
+
+    def __init__(self, hidden=512, seed=0):
+        rng = np.random.default_rng(seed)
+        inputs = 11 * 8 * 4
+        self.w_hidden = (rng.standard_normal((inputs, hidden)) / np.sqrt(inputs)).astype(np.float32)
+        self.w_value = (rng.standard_normal(hidden) / np.sqrt(hidden)).astype(np.float32)
+        self.w_policy = (rng.standard_normal((hidden, NUM_ACTIONS)) / np.sqrt(hidden)).astype(np.float32)
+
+    def evaluate(self, states):
+        x = encode_boards(states, dtype=np.float32).reshape(len(states), -1)
+        hidden = np.maximum(x @ self.w_hidden, 0)
+        values = np.tanh(hidden @ self.w_value)
+        logits = hidden @ self.w_policy
+
+        ids = [legal_action_ids(state) for state in states]
+        mask = np.zeros([len(states), NUM_ACTIONS], dtype=bool)
+        for row, legal in zip(mask, ids):
+            row[legal] = True
+        probs = masked_softmax(logits, mask)
+        policies = [dict(zip(state.legal_moves, row[legal].tolist()))
+                    for state, row, legal in zip(states, probs, ids)]
+        return values, policies
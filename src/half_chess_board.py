@@ -1,8 +1,9 @@
 """Implementation of object representing the half-chess board."""
 
 from __future__ import annotations
+from array import array
 from itertools import chain, product
-from copy import deepcopy
+import random
 import numpy as np
 from typing import Optional, NamedTuple
 
@@ -24,6 +25,70 @@ class Move(NamedTuple):
             return f"({self.old_r}{self.old_c}, {self.new_r}{self.new_c}, {self.prom_r}{self.prom_c})"
         return f"({self.old_r}{self.old_c}, {self.new_r}{self.new_c})"
 
+def _zobrist_keys(seed=20240101):
+    """Fixed 64-bit keys per (piece, row, col), plus one for black to move,
+    so hashes agree across processes and runs."""
+    rng = random.Random(seed)
+    pieces = {piece: [[rng.getrandbits(64) for _ in range(4)] for _ in range(8)]
+              for piece in 'RNKBPrnkbp'}
+    return pieces, rng.getrandbits(64)
+
+
+ZOBRIST_PIECES, ZOBRIST_BLACK_TO_MOVE = _zobrist_keys()
+# Key of the mirror-image piece on the mirror-image square (see HalfChessBoard.mirror),
+# so the mirrored position's hash can be kept alongside the position's own.
+ZOBRIST_MIRRORED = {piece: [[ZOBRIST_PIECES[piece.swapcase()][7 - r][c] for c in range(4)] for r in range(8)]
+                    for piece in ZOBRIST_PIECES}
+
+
+# Moves are numbered by action id: 1024 plain moves, followed by 768 promotions that take out a piece.
+NUM_ACTIONS = 1024 + 768
+
+def _plain_action(old_r: int, old_c: int, new_r: int, new_c: int) -> int:
+    return ((new_c * 8 + new_r) * 4 + old_c) * 8 + old_r
+
+def _promotion_action(old_r: int, old_c: int, new_c: int, prom_r: int, prom_c: int) -> int:
+    color = old_r % 2  # old_r must be 1 or 6 for promotions
+    column_shift = new_c - old_c + 1
+    return (((prom_c * 8 + prom_r) * 4 + old_c) * 3 + column_shift) * 2 + color + 1024
+
+def _compute_action_move(encoded: int) -> Move:
+    if encoded < 1024:
+        encoded, old_row = divmod(encoded, 8)
+        encoded, old_col = divmod(encoded, 4)
+        encoded, new_row = divmod(encoded, 8)
+        encoded, new_col = divmod(encoded, 4)
+        return Move(old_row, old_col, new_row, new_col)
+    encoded -= 1024
+    encoded, color = divmod(encoded, 2)
+    encoded, column_shift = divmod(encoded, 3)
+    encoded, old_col = divmod(encoded, 4)
+    encoded, prom_row = divmod(encoded, 8)
+    encoded, prom_col = divmod(encoded, 4)
+    old_row, new_row = (6, 7) if color == 0 else (1, 0)
+    new_col = old_col + column_shift - 1
+    return Move(old_row, old_col, new_row, new_col, prom_row, prom_col)
+
+# Every Move the generator can produce, indexed by action id, and the inverse mapping.
+ACTION_MOVES = [_compute_action_move(encoded) for encoded in range(NUM_ACTIONS)]
+ACTION_IDS = {move: encoded for encoded, move in enumerate(ACTION_MOVES)}
+
+def _compute_mirror_move(move: Move) -> Move:
+    old_r, old_c, new_r, new_c, prom_r, prom_c = move
+    return Move(7 - old_r, old_c, 7 - new_r, new_c, None if prom_r is None else 7 - prom_r, prom_c)
+
+# Action id of each action's mirror image; the permutation is its own inverse.
+MIRROR_ACTIONS = [ACTION_IDS[_compute_mirror_move(move)] for move in ACTION_MOVES]
+
+def mirror_move(move: Move) -> Move:
+    """The move mirrored by HalfChessBoard.mirror."""
+    return ACTION_MOVES[MIRROR_ACTIONS[ACTION_IDS[move]]]
+
+def mirror_policy(policy: dict[Move, float]) -> dict[Move, float]:
+    """A policy over a position's moves, as a policy over its mirror image's moves."""
+    return {mirror_move(move): prob for move, prob in policy.items()}
+
+
 class HalfChessBoard:
     """Class representing the board's state. Also provides legal moves in position."""
 
@@ -41,24 +106,110 @@ class HalfChessBoard:
                     'k': 0,
                     ' ': 0}
 
+    START_BOARD = np.array([
+        ['r', 'n', 'k', 'b'],
+        ['p', 'p', 'p', 'p'],
+        [' ', ' ', ' ', ' '],
+        [' ', ' ', ' ', ' '],
+        [' ', ' ', ' ', ' '],
+        [' ', ' ', ' ', ' '],
+        ['P', 'P', 'P', 'P'],
+        ['R', 'N', 'K', 'B'],
+    ])
+
     def __init__(self, board=None, white_to_move=True, ignore_pins=False):
         if board is None:
-            self.board = np.array([
-                ['r', 'n', 'k', 'b'],
-                ['p', 'p', 'p', 'p'],
-                [' ', ' ', ' ', ' '],
-                [' ', ' ', ' ', ' '],
-                [' ', ' ', ' ', ' '],
-                [' ', ' ', ' ', ' '],
-                ['P', 'P', 'P', 'P'],
-                ['R', 'N', 'K', 'B'],
-            ])
+            self.board = self.START_BOARD.copy()
         else:
             self.board = board
         self.white_to_move = white_to_move
         self.ignore_pins = ignore_pins
-        self.legal_moves = []
-        self.legal_moves = self.__get_legal_moves()
+        # Legal moves as action ids; the Move list and the id set for membership tests
+        # are derived from it on first use.
+        self.__legal_actions = None
+        self.__legal_moves = None
+        self.__legal_set = None
+        # (Zobrist hash, hash of the mirror image), computed on first use.
+        self.__hashes = None
+        # Squares of each piece and white's material advantage, built on first use and
+        # then kept up to date by push, pop and make_move.
+        self.__pieces = None
+        self.__score = 0
+        # Undo stack of (move, moved piece, captured piece, piece removed by promotion,
+        # cached legal move lists, hashes before the move).
+        self.__stack = []
+
+    @property
+    def legal_actions(self) -> array:
+        """Action ids of the legal moves in position, generated on first access and cached."""
+        if self.__legal_actions is None:
+            self.__legal_actions = self.__get_legal_actions()
+        return self.__legal_actions
+
+    @property
+    def legal_moves(self) -> list[Move]:
+        """Legal moves in position, in the same order as legal_actions."""
+        if self.__legal_moves is None:
+            self.__legal_moves = [ACTION_MOVES[action] for action in self.legal_actions]
+        return self.__legal_moves
+
+    def is_legal(self, move: Move) -> bool:
+        """Whether move is one of legal_moves, checked against a set of action ids."""
+        if self.__legal_set is None:
+            self.__legal_set = set(self.legal_actions)
+        return ACTION_IDS.get(move) in self.__legal_set
+
+    @property
+    def zobrist_hash(self) -> int:
+        """64-bit Zobrist hash of the pieces and side to move.
+        Computed on first access, then updated incrementally by push, pop and make_move."""
+        return self.__zobrist_hashes()[0]
+
+    @property
+    def canonical_hash(self) -> int:
+        """Zobrist hash shared by the position and its mirror image: that of whichever has white to move."""
+        h, mirrored = self.__zobrist_hashes()
+        return h if self.white_to_move else mirrored
+
+    def __zobrist_hashes(self) -> tuple[int, int]:
+        if self.__hashes is None:
+            h = 0 if self.white_to_move else ZOBRIST_BLACK_TO_MOVE
+            mirrored = ZOBRIST_BLACK_TO_MOVE if self.white_to_move else 0
+            for r, c in product(range(8), range(4)):
+                if self.board[r, c] != ' ':
+                    h ^= ZOBRIST_PIECES[self.board[r, c]][r][c]
+                    mirrored ^= ZOBRIST_MIRRORED[self.board[r, c]][r][c]
+            self.__hashes = h, mirrored
+        return self.__hashes
+
+    def mirror(self) -> HalfChessBoard:
+        """The equivalent position with the colours swapped and the board flipped top to bottom.
+        White and black start mirrored, so the mirror image has the same value for the player to move,
+        and its legal moves are the mirror_move images of these."""
+        return HalfChessBoard(np.char.swapcase(self.board[::-1]), not self.white_to_move, self.ignore_pins)
+
+    def canonical(self) -> HalfChessBoard:
+        """The representative of the position and its mirror image with white to move."""
+        return self if self.white_to_move else self.mirror()
+
+    def piece_squares(self, piece: str) -> list[tuple[int, int]]:
+        """Squares holding piece, in row-major order."""
+        return sorted(self.__piece_lists()[piece])
+
+    @property
+    def material_signature(self) -> str:
+        """Pieces on the board, white then black, each in KRBNP order, e.g. 'KBNk'."""
+        pieces = self.__piece_lists()
+        return ''.join(piece * len(pieces[piece]) for piece in 'KRBNPkrbnp')
+
+    def __piece_lists(self) -> dict[str, set[tuple[int, int]]]:
+        if self.__pieces is None:
+            pieces = {piece: set() for piece in self.WHITE_PIECES + self.BLACK_PIECES}
+            for r, c in zip(*np.nonzero(self.board != ' ')):
+                pieces[self.board[r, c]].add((int(r), int(c)))
+            self.__pieces = pieces
+            self.__score = sum(self.point_values[piece] * len(squares) for piece, squares in pieces.items())
+        return self.__pieces
 
     def __repr__(self) -> str:
         return '\n'.join('|' + '|'.join(row) + '|' for row in self.board) + '\n'
@@ -66,67 +217,152 @@ class HalfChessBoard:
     def __is_valid(self, row: int, col: int) -> bool:
         return 0 <= row < 8 and 0 <= col < 4
 
-    def __get_legal_moves(self) -> list[Move]:
-        """Gives array of legal moves in position.
-        Each move is formatted (old_row, old_col, new_row, new_col).
-        """
-        moves = []
+    def __get_legal_actions(self) -> array:
+        """Gives array of legal moves in position, as action ids."""
+        moves = array('H')
+        pieces = self.__piece_lists()
+        own = self.WHITE_PIECES if self.white_to_move else self.BLACK_PIECES
+        occupied = sorted(chain.from_iterable(pieces[piece] for piece in own))
         if self.white_to_move:
-            for r, c in product(range(8), range(4)):
+            for r, c in occupied:
                 if self.board[r, c] == 'P':
-                    moves += self.__legal_moves_P(r, c)
+                    self.__legal_moves_P(r, c, moves)
                 elif self.board[r, c] == 'N':
-                    moves += self.__legal_moves_N(r, c)
+                    self.__legal_moves_N(r, c, moves)
                 elif self.board[r, c] == 'R':
-                    moves += self.__legal_moves_R(r, c)
+                    self.__legal_moves_R(r, c, moves)
                 elif self.board[r, c] == 'B':
-                    moves += self.__legal_moves_B(r, c)
+                    self.__legal_moves_B(r, c, moves)
                 elif self.board[r, c] == 'K':
-                    moves += self.__legal_moves_K(r, c)
+                    self.__legal_moves_K(r, c, moves)
         else:
-            for r, c in product(range(8), range(4)):
+            for r, c in occupied:
                 if self.board[r, c] == 'p':
-                    moves += self.__legal_moves_p(r, c)
+                    self.__legal_moves_p(r, c, moves)
                 elif self.board[r, c] == 'n':
-                    moves += self.__legal_moves_n(r, c)
+                    self.__legal_moves_n(r, c, moves)
                 elif self.board[r, c] == 'r':
-                    moves += self.__legal_moves_r(r, c)
+                    self.__legal_moves_r(r, c, moves)
                 elif self.board[r, c] == 'b':
-                    moves += self.__legal_moves_b(r, c)
+                    self.__legal_moves_b(r, c, moves)
                 elif self.board[r, c] == 'k':
-                    moves += self.__legal_moves_k(r, c)
+                    self.__legal_moves_k(r, c, moves)
         if self.ignore_pins:
             return moves
-        return [m for m in moves if not self.__in_check_after_move(m)]
+        return array('H', [m for m in moves if not self.__in_check_after_move(ACTION_MOVES[m])])
 
     def make_move(self, move: Move, future=False) -> HalfChessBoard:
         """NOT IN-PLACE; RETURNS NEW BOARD.
         Input move should be formatted as (old_row, old_col, new_row, new_col).
         Piece from [old_row, old_col] is moved to [new_row, new_col], leaving a space in its place.
-        Player to move is switched. Move validity is checked."""
+        Player to move is switched. Move validity is checked unless the move is hypothetical (future=True)."""
 
-        old_r, old_c, r, c, prom_r, prom_c = move
+        if not future and not self.is_legal(move):
+            raise ValueError('invalid move')
 
-        if self.legal_moves:
-            if move not in self.legal_moves:
-                raise ValueError('invalid move')
+        new_board = HalfChessBoard(self.board.copy(), self.white_to_move, ignore_pins=future)
+        new_board.__hashes = self.__hashes
+        if self.__pieces is not None:
+            new_board.__pieces = {piece: set(squares) for piece, squares in self.__pieces.items()}
+            new_board.__score = self.__score
+        new_board.__apply(move)
+        return new_board
 
-        state = deepcopy(self.board)
+    def push(self, move: Move) -> None:
+        """IN-PLACE version of make_move; undo with pop().
+        The move is not validated, so callers should only push moves from legal_moves."""
+        prev_hash = self.__hashes
+        moved, captured, prom_captured = self.__apply(move)
+        legal = self.__legal_actions, self.__legal_moves, self.__legal_set
+        self.__stack.append((move, moved, captured, prom_captured, legal, prev_hash))
+        self.__legal_actions = self.__legal_moves = self.__legal_set = None
+
+    def pop(self) -> Move:
+        """Takes back the last pushed move and returns it."""
+        move, moved, captured, prom_captured, legal, prev_hash = self.__stack.pop()
+        old_r, old_c, r, c, prom_r, prom_c = move
+        self.white_to_move = not self.white_to_move
+        self.__legal_actions, self.__legal_moves, self.__legal_set = legal
+        self.__hashes = prev_hash
         if old_r == r and old_c == c:
-            return HalfChessBoard(state, not self.white_to_move, ignore_pins=future)
+            return move
+        self.board[old_r, old_c] = moved
+        self.board[r, c] = captured
+        if prom_captured is not None:
+            self.board[prom_r, prom_c] = prom_captured
+        pieces = self.__pieces
+        if pieces is not None:
+            pieces[moved].discard((r, c))
+            pieces[moved].add((old_r, old_c))
+            if r == 0 and moved == 'P' or r == 7 and moved == 'p':
+                self.__score += self.point_values[moved]
+            if captured != ' ':
+                pieces[captured].add((r, c))
+                self.__score += self.point_values[captured]
+            if prom_captured is not None and prom_captured != ' ':
+                pieces[prom_captured].add((prom_r, prom_c))
+                self.__score += self.point_values[prom_captured]
+        return move
+
+    def __apply(self, move: Move) -> tuple[str, str, Optional[str]]:
+        """Plays move on self.board and switches the player to move.
+        Returns the moved piece, the previous contents of the target square
+        and the piece removed by a promotion capture, if any.
+        The Zobrist hashes and piece lists are updated if they have been computed."""
+        old_r, old_c, r, c, prom_r, prom_c = move
+        self.white_to_move = not self.white_to_move
+        hashes = self.__hashes
+        if hashes is not None:
+            h, mirrored = hashes[0] ^ ZOBRIST_BLACK_TO_MOVE, hashes[1] ^ ZOBRIST_BLACK_TO_MOVE
+            self.__hashes = h, mirrored
+        if old_r == r and old_c == c:
+            return ' ', ' ', None
+        state = self.board
+        moved, captured = state[old_r, old_c], state[r, c]
         state[r, c] = state[old_r, old_c]
         state[old_r, old_c] = ' '
 
+        prom_captured = None
         if r == 0 and state[r, c] == 'P' or r == 7 and state[r, c] == 'p':
             state[r, c] = ' '
             if prom_r is not None and prom_c is not None:
+                prom_captured = state[prom_r, prom_c]
                 state[prom_r, prom_c] = ' '
 
-        new_board = HalfChessBoard(state, not self.white_to_move, ignore_pins=future)
-        return new_board
+        if hashes is not None:
+            toggled = [(moved, old_r, old_c)]
+            if captured != ' ':
+                toggled.append((captured, r, c))
+            if state[r, c] != ' ':
+                toggled.append((moved, r, c))
+            if prom_captured is not None and prom_captured != ' ':
+                toggled.append((prom_captured, prom_r, prom_c))
+            for piece, row, col in toggled:
+                h ^= ZOBRIST_PIECES[piece][row][col]
+                mirrored ^= ZOBRIST_MIRRORED[piece][row][col]
+            self.__hashes = h, mirrored
+
+        pieces = self.__pieces
+        if pieces is not None:
+            pieces[moved].discard((old_r, old_c))
+            if state[r, c] != ' ':
+                pieces[moved].add((r, c))
+            else:
+                self.__score -= self.point_values[moved]
+            if captured != ' ':
+                pieces[captured].discard((r, c))
+                self.__score -= self.point_values[captured]
+            if prom_captured is not None and prom_captured != ' ':
+                pieces[prom_captured].discard((prom_r, prom_c))
+                self.__score -= self.point_values[prom_captured]
+        return moved, captured, prom_captured
+
+    def __king_square(self, king: str) -> Optional[tuple[int, int]]:
+        return next(iter(self.__piece_lists()[king]), None)
 
     def __in_check(self) -> bool:
-        return self.__in_check_after_move(Move(0, 0, 0, 0))
+        king = self.__king_square('K' if self.white_to_move else 'k')
+        return king is not None and self.is_attacked(*king, by_white=not self.white_to_move)
 
     def result(self) -> Optional[int]:
         """Returns result of game.
@@ -134,7 +370,7 @@ class HalfChessBoard:
         0 for stalemate,
         -1 for black win,
         1 for white win."""
-        if self.legal_moves != []:
+        if self.legal_actions:
             if self.__draw_by_insufficient_material():
                 return 0
             return None
@@ -145,188 +381,195 @@ class HalfChessBoard:
         return 1
 
     def __in_check_after_move(self, move: Move) -> bool:
-        post_board = self.make_move(move, future=True)
-        king = 'k' if post_board.white_to_move else 'K'
-        for legal_move in post_board.legal_moves:
-            if post_board.board[legal_move.new_r, legal_move.new_c] == king:
+        self.push(move)
+        king = self.__king_square('k' if self.white_to_move else 'K')
+        in_check = king is not None and self.is_attacked(*king, by_white=self.white_to_move)
+        self.pop()
+        return in_check
+
+    def is_attacked(self, row: int, col: int, by_white: bool) -> bool:
+        """Whether the square [row, col] is attacked by the given side's pieces."""
+        pieces = self.WHITE_PIECES if by_white else self.BLACK_PIECES
+        rook, knight, king, bishop, pawn = pieces
+
+        for r, c in chain(product((1, -1), (2, -2)), product((2, -2), (1, -1))):
+            if self.__is_valid(row + r, col + c) and self.board[row + r, col + c] == knight:
+                return True
+        for r, c in product((-1, 0, 1), (-1, 0, 1)):
+            if (r != 0 or c != 0) \
+                and self.__is_valid(row + r, col + c) \
+                and self.board[row + r, col + c] == king:
+                return True
+        # White pawns capture towards row 0, so they attack from the row below.
+        pawn_row = row + 1 if by_white else row - 1
+        for c in (col - 1, col + 1):
+            if self.__is_valid(pawn_row, c) and self.board[pawn_row, c] == pawn:
                 return True
+        for (r, c), slider in chain(product(((1, 0), (-1, 0), (0, 1), (0, -1)), rook),
+                                    product(((1, 1), (1, -1), (-1, 1), (-1, -1)), bishop)):
+            i = 1
+            while self.__is_valid(row + i * r, col + i * c):
+                if self.board[row + i * r, col + i * c] != ' ':
+                    if self.board[row + i * r, col + i * c] == slider:
+                        return True
+                    break
+                i += 1
         return False
 
-    def __legal_moves_P(self, row: int, col: int) -> list[Move]:
+    def __legal_moves_P(self, row: int, col: int, moves: array) -> None:
         if row == 0:
-            return []
-        moves = []
+            return
 
         capturable_coords = []
         if row == 1:
-            for r, c in product(range(8), range(4)):
-                if self.board[r, c] in self.BLACK_PIECES and self.board[r, c] not in 'Kk':
-                    capturable_coords.append((r, c))
+            pieces = self.__piece_lists()
+            capturable_coords = sorted(chain.from_iterable(pieces[piece] for piece in 'rnbp'))
 
         if self.board[row - 1, col] == ' ':
             flag = True
             for cap_r, cap_c in capturable_coords:
                 flag = False
-                moves.append(Move(row, col, row - 1, col, cap_r, cap_c))
+                moves.append(_promotion_action(row, col, col, cap_r, cap_c))
             if flag:
-                moves.append(Move(row, col, row - 1, col))
+                moves.append(_plain_action(row, col, row - 1, col))
 
         if col != 0 and self.board[row - 1, col - 1] in self.BLACK_PIECES:
             flag = True
             for cap_r, cap_c in capturable_coords:
                 if cap_r != row - 1 and cap_c != col - 1:
                     flag = False
-                    moves.append(Move(row, col, row - 1, col - 1, cap_r, cap_c))
+                    moves.append(_promotion_action(row, col, col - 1, cap_r, cap_c))
             if flag:
-                moves.append(Move(row, col, row - 1, col - 1))
+                moves.append(_plain_action(row, col, row - 1, col - 1))
 
         if col != 3 and self.board[row - 1, col + 1] in self.BLACK_PIECES:
             flag = True
             for cap_r, cap_c in capturable_coords:
                 if cap_r != row - 1 and cap_c != col + 1:
                     flag = False
-                    moves.append(Move(row, col, row - 1, col + 1, cap_r, cap_c))
+                    moves.append(_promotion_action(row, col, col + 1, cap_r, cap_c))
             if flag:
-                moves.append(Move(row, col, row - 1, col + 1))
-
-        return moves
+                moves.append(_plain_action(row, col, row - 1, col + 1))
     
-    def __legal_moves_p(self, row: int, col: int) -> list[Move]:
+    def __legal_moves_p(self, row: int, col: int, moves: array) -> None:
         if row == 7:
-            return []
-        moves = []
+            return
 
         capturable_coords = []
         if row == 6:
-            for r, c in product(range(8), range(4)):
-                if self.board[r, c] in self.WHITE_PIECES and self.board[r, c] not in 'Kk':
-                    capturable_coords.append((r, c))
+            pieces = self.__piece_lists()
+            capturable_coords = sorted(chain.from_iterable(pieces[piece] for piece in 'RNBP'))
 
         if self.board[row + 1, col] == ' ':
             flag = True
             for cap_r, cap_c in capturable_coords:
                 flag = False
-                moves.append(Move(row, col, row + 1, col, cap_r, cap_c))
+                moves.append(_promotion_action(row, col, col, cap_r, cap_c))
             if flag:
-                moves.append(Move(row, col, row + 1, col))
+                moves.append(_plain_action(row, col, row + 1, col))
 
         if col != 0 and self.board[row + 1, col - 1] in self.WHITE_PIECES:
             flag = True
             for cap_r, cap_c in capturable_coords:
                 if cap_r != row + 1 and cap_c != col - 1:
                     flag = False
-                    moves.append(Move(row, col, row + 1, col - 1, cap_r, cap_c))
+                    moves.append(_promotion_action(row, col, col - 1, cap_r, cap_c))
             if flag:
-                moves.append(Move(row, col, row + 1, col - 1))
+                moves.append(_plain_action(row, col, row + 1, col - 1))
 
         if col != 3 and self.board[row + 1, col + 1] in self.WHITE_PIECES:
             flag = True
             for cap_r, cap_c in capturable_coords:
                 if cap_r != row + 1 and cap_c != col + 1:
                     flag = False
-                    moves.append(Move(row, col, row + 1, col + 1, cap_r, cap_c))
+                    moves.append(_promotion_action(row, col, col + 1, cap_r, cap_c))
             if flag:
-                moves.append(Move(row, col, row + 1, col + 1))
-
-        return moves
+                moves.append(_plain_action(row, col, row + 1, col + 1))
 
-    def __legal_moves_K(self, row: int, col: int) -> list[Move]:
-        moves = []
+    def __legal_moves_K(self, row: int, col: int, moves: array) -> None:
         for r, c in product((-1, 0, 1), (-1, 0, 1)):
             if (r != 0 or c != 0) \
                 and self.__is_valid(row + r, col + c) \
                 and self.board[row + r, col + c] not in self.WHITE_PIECES:
-                moves.append(Move(row, col, row + r, col + c))
-        return moves
+                moves.append(_plain_action(row, col, row + r, col + c))
     
-    def __legal_moves_k(self, row: int, col: int) -> list[Move]:
-        moves = []
+    def __legal_moves_k(self, row: int, col: int, moves: array) -> None:
         for r, c in product((-1, 0, 1), (-1, 0, 1)):
             if (r != 0 or c != 0) \
                 and self.__is_valid(row + r, col + c) \
                 and self.board[row + r, col + c] not in self.BLACK_PIECES:
-                moves.append(Move(row, col, row + r, col + c))
-        return moves
+                moves.append(_plain_action(row, col, row + r, col + c))
 
-    def __legal_moves_N(self, row: int, col: int) -> list[Move]:
-        moves = []
+    def __legal_moves_N(self, row: int, col: int, moves: array) -> None:
         for r, c in chain(product((1, -1), (2, -2)), product((2, -2), (1, -1))):
             if self.__is_valid(row + r, col + c) and \
                 self.board[row + r, col + c] not in self.WHITE_PIECES:
-                moves.append(Move(row, col, row + r, col + c))
-        return moves
+                moves.append(_plain_action(row, col, row + r, col + c))
     
-    def __legal_moves_n(self, row: int, col: int) -> list[Move]:
-        moves = []
+    def __legal_moves_n(self, row: int, col: int, moves: array) -> None:
         for r, c in chain(product((1, -1), (2, -2)), product((2, -2), (1, -1))):
             if self.__is_valid(row + r, col + c) and \
                 self.board[row + r, col + c] not in self.BLACK_PIECES:
-                moves.append(Move(row, col, row + r, col + c))
-        return moves
+                moves.append(_plain_action(row, col, row + r, col + c))
 
-    def __legal_moves_R(self, row: int, col: int) -> list[Move]:
-        moves = []
+    def __legal_moves_R(self, row: int, col: int, moves: array) -> None:
         # Downward moves
         for r in range(row + 1, 8):
             if self.board[r, col] not in self.WHITE_PIECES:
-                moves.append(Move(row, col, r, col))
+                moves.append(_plain_action(row, col, r, col))
             if self.board[r, col] != ' ':
                 break
         # Upward moves
         for r in range(row - 1, -1, -1):
             if self.board[r, col] not in self.WHITE_PIECES:
-                moves.append(Move(row, col, r, col))
+                moves.append(_plain_action(row, col, r, col))
             if self.board[r, col] != ' ':
                 break
         # Rightward moves
         for c in range(col + 1, 4):
             if self.board[row, c] not in self.WHITE_PIECES:
-                moves.append(Move(row, col, row, c))
+                moves.append(_plain_action(row, col, row, c))
             if self.board[row, c] != ' ':
                 break
         # Leftward moves
         for c in range(col - 1, -1, -1):
             if self.board[row, c] not in self.WHITE_PIECES:
-                moves.append(Move(row, col, row, c))
+                moves.append(_plain_action(row, col, row, c))
             if self.board[row, c] != ' ':
                 break
-        return moves
     
-    def __legal_moves_r(self, row: int, col: int) -> list[Move]:
-        moves = []
+    def __legal_moves_r(self, row: int, col: int, moves: array) -> None:
         # Downward moves
         for r in range(row + 1, 8):
             if self.board[r, col] not in self.BLACK_PIECES:
-                moves.append(Move(row, col, r, col))
+                moves.append(_plain_action(row, col, r, col))
             if self.board[r, col] != ' ':
                 break
         # Upward moves
         for r in range(row - 1, -1, -1):
             if self.board[r, col] not in self.BLACK_PIECES:
-                moves.append(Move(row, col, r, col))
+                moves.append(_plain_action(row, col, r, col))
             if self.board[r, col] != ' ':
                 break
         # Rightward moves
         for c in range(col + 1, 4):
             if self.board[row, c] not in self.BLACK_PIECES:
-                moves.append(Move(row, col, row, c))
+                moves.append(_plain_action(row, col, row, c))
             if self.board[row, c] != ' ':
                 break
         # Leftward moves
         for c in range(col - 1, -1, -1):
             if self.board[row, c] not in self.BLACK_PIECES:
-                moves.append(Move(row, col, row, c))
+                moves.append(_plain_action(row, col, row, c))
             if self.board[row, c] != ' ':
                 break
-        return moves
 
-    def __legal_moves_B(self, row: int, col: int) -> list[Move]:
-        moves = []
+    def __legal_moves_B(self, row: int, col: int, moves: array) -> None:
         # Down right
         i = 1
         while self.__is_valid(row + i, col + i):
             if self.board[row + i, col + i] not in self.WHITE_PIECES:
-                moves.append(Move(row, col, row + i, col + i))
+                moves.append(_plain_action(row, col, row + i, col + i))
             if self.board[row + i, col + i] != ' ':
                 break
             i += 1
@@ -334,7 +577,7 @@ class HalfChessBoard:
         i = 1
         while self.__is_valid(row + i, col - i):
             if self.board[row + i, col - i] not in self.WHITE_PIECES:
-                moves.append(Move(row, col, row + i, col - i))
+                moves.append(_plain_action(row, col, row + i, col - i))
             if self.board[row + i, col - i] != ' ':
                 break
             i += 1
@@ -342,7 +585,7 @@ class HalfChessBoard:
         i = 1
         while self.__is_valid(row - i, col + i):
             if self.board[row - i, col + i] not in self.WHITE_PIECES:
-                moves.append(Move(row, col, row - i, col + i))
+                moves.append(_plain_action(row, col, row - i, col + i))
             if self.board[row - i, col + i] != ' ':
                 break
             i += 1
@@ -350,19 +593,17 @@ class HalfChessBoard:
         i = 1
         while self.__is_valid(row - i, col - i):
             if self.board[row - i, col - i] not in self.WHITE_PIECES:
-                moves.append(Move(row, col, row - i, col - i))
+                moves.append(_plain_action(row, col, row - i, col - i))
             if self.board[row - i, col - i] != ' ':
                 break
             i += 1
-        return moves
     
-    def __legal_moves_b(self, row: int, col: int) -> list[Move]:
-        moves = []
+    def __legal_moves_b(self, row: int, col: int, moves: array) -> None:
         # Down right
         i = 1
         while self.__is_valid(row + i, col + i):
             if self.board[row + i, col + i] not in self.BLACK_PIECES:
-                moves.append(Move(row, col, row + i, col + i))
+                moves.append(_plain_action(row, col, row + i, col + i))
             if self.board[row + i, col + i] != ' ':
                 break
             i += 1
@@ -370,7 +611,7 @@ class HalfChessBoard:
         i = 1
         while self.__is_valid(row + i, col - i):
             if self.board[row + i, col - i] not in self.BLACK_PIECES:
-                moves.append(Move(row, col, row + i, col - i))
+                moves.append(_plain_action(row, col, row + i, col - i))
             if self.board[row + i, col - i] != ' ':
                 break
             i += 1
@@ -378,7 +619,7 @@ class HalfChessBoard:
         i = 1
         while self.__is_valid(row - i, col + i):
             if self.board[row - i, col + i] not in self.BLACK_PIECES:
-                moves.append(Move(row, col, row - i, col + i))
+                moves.append(_plain_action(row, col, row - i, col + i))
             if self.board[row - i, col + i] != ' ':
                 break
             i += 1
@@ -386,27 +627,21 @@ class HalfChessBoard:
         i = 1
         while self.__is_valid(row - i, col - i):
             if self.board[row - i, col - i] not in self.BLACK_PIECES:
-                moves.append(Move(row, col, row - i, col - i))
+                moves.append(_plain_action(row, col, row - i, col - i))
             if self.board[row - i, col - i] != ' ':
                 break
             i += 1
-        return moves
 
     def material_advantage(self) -> int:
         """Returns white's material advantage; negative if black is up."""
-        ret = 0
-        for r, c in product(range(8), range(4)):
-            ret += self.point_values[self.board[r, c]]
-        return ret
-
-    def __material(self) -> str:
-        mat = ''
-        for r, c in product(range(8), range(4)):
-            if self.board[r, c] not in ' Kk':
-                mat += self.board[r, c]
-        return mat
+        self.__piece_lists()
+        return self.__score
 
     def __draw_by_insufficient_material(self) -> bool:
-        return self.__material() in ['N', 'n', 'B', 'b', '']
+        # Drawn with no pieces besides the kings, or a single knight or bishop.
+        pieces = self.__piece_lists()
+        if pieces['R'] or pieces['P'] or pieces['r'] or pieces['p']:
+            return False
+        return len(pieces['N']) + len(pieces['B']) + len(pieces['n']) + len(pieces['b']) <= 1
         # The case of a dead position with two opposing same-colored bishops is impossible,
         # since there are no same-colored bishops in half-chess.
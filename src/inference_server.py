@@ -0,0 +1,131 @@
+"""Module providing an asyncio inference server that batches evaluations across searches
+
+Many searches (e.g. concurrent self-play games) share one InferenceServer.
+Each awaits server.evaluate(states) from MCTS.run_async; the server queues the
+states and a background task hands them to a single Evaluator in batches of up
+to max_batch_size, waiting at most max_wait_ms after the first queued state
+for more to arrive. The evaluator runs on a worker thread, so the searches
+keep producing the next batch while the current one is evaluated (NumPy and
+most network runtimes release the GIL). Generating legal moves pushes and pops
+moves on the board itself, so evaluate builds each state's legal moves before
+queueing it; the worker thread then only reads them, even when searches share
+nodes through a TranspositionTable.
+"""
+
+import asyncio
+import sys
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+import numpy as np
+import numpy.typing as npt
+from half_chess_board import HalfChessBoard, Move
+from evaluator import Evaluator, NumpyEvaluator
+
+
+class InferenceServer:
+    """Coalesces evaluate calls from concurrent coroutines into evaluator batches.
+    Use as `async with InferenceServer(evaluator) as server:`."""
+
+    def __init__(self, evaluator: Optional[Evaluator] = None, max_batch_size=256, max_wait_ms=1.0):
+        self.evaluator = evaluator if evaluator is not None else NumpyEvaluator()
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.queue = None
+        self.task = None
+        self.executor = None
+        self.batches = 0
+        self.requests = 0
+        # Seconds from a state being queued to its result being set, for the most recent requests.
+        self.latencies = deque(maxlen=100_000)
+
+    async def __aenter__(self) -> 'InferenceServer':
+        self.start()
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.stop()
+
+    def start(self) -> None:
+        self.queue = asyncio.Queue()
+        self.executor = ThreadPoolExecutor(1)
+        self.task = asyncio.get_running_loop().create_task(self.__serve())
+
+    async def stop(self) -> None:
+        self.task.cancel()
+        try:
+            await self.task
+        except asyncio.CancelledError:
+            pass
+        self.executor.shutdown()
+
+    async def evaluate(self, states: list[HalfChessBoard]
+                       ) -> tuple[npt.NDArray[np.float32], list[dict[Move, float]]]:
+        """Same contract as Evaluator.evaluate; the states may be split across batches."""
+        loop = asyncio.get_running_loop()
+        futures = []
+        for state in states:
+            state.legal_moves  # cached now, so the worker thread never pushes moves on a shared board
+            future = loop.create_future()
+            self.queue.put_nowait((state, future, time.perf_counter()))
+            futures.append(future)
+        results = await asyncio.gather(*futures)
+        return np.array([value for value, _ in results], dtype=np.float32), [policy for _, policy in results]
+
+    def mean_batch_size(self) -> float:
+        return self.requests / self.batches if self.batches else 0.0
+
+    async def __serve(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                if not self.queue.empty():
+                    batch.append(self.queue.get_nowait())
+                    continue
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            try:
+                values, policies = await loop.run_in_executor(
+                    self.executor, self.evaluator.evaluate, [state for state, _, _ in batch])
+            except Exception as e:
+                for _, future, _ in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            now = time.perf_counter()
+            for (_, future, queued), value, policy in zip(batch, values, policies):
+                if not future.done():
+                    future.set_result((float(value), policy))
+                self.latencies.append(now - queued)
+            self.batches += 1
+            self.requests += len(batch)
+
+
+if __name__ == '__main__':
+    from mcts import MCTS, Node
+
+    NUM_GAMES = 64 if len(sys.argv) < 2 else int(sys.argv[1])
+    NUM_SIMULATIONS = 100 if len(sys.argv) < 3 else int(sys.argv[2])
+
+    async def main():
+        async with InferenceServer(NumpyEvaluator(hidden=1024)) as server:
+            mcts = MCTS(batch_size=8)
+            roots = [Node(prior=0, state=HalfChessBoard()) for _ in range(NUM_GAMES)]
+            start = time.perf_counter()
+            await asyncio.gather(*(mcts.run_async(root, NUM_SIMULATIONS, server) for root in roots))
+            elapsed = time.perf_counter() - start
+            latencies = np.array(server.latencies) * 1000
+            print(f'{NUM_GAMES} searches: {server.requests / elapsed:.0f} evaluations/s, '
+                  f'mean batch {server.mean_batch_size():.1f}, '
+                  f'latency p50 {np.percentile(latencies, 50):.1f} ms, p99 {np.percentile(latencies, 99):.1f} ms')
+
+    asyncio.run(main())
@@ -1,9 +1,16 @@
 """Module providing tools and behavior for MCTS tree search"""
 
+import heapq
 import math
 import sys
+import time
+from typing import Callable, Generator, Optional
 import numpy as np
-from half_chess_board import HalfChessBoard, Move
+from half_chess_board import HalfChessBoard, Move, mirror_policy
+from evaluator import Evaluator, PredictEvaluator
+from transposition import TranspositionTable
+from tablebase import Tablebases
+from search_metrics import SearchMetrics
 import treevis
 
 def ucb_score(parent, child):
@@ -27,14 +34,24 @@ class Node:
         self.value = 0
         self.visits = 0
 
-    def expand(self, action_probs):
-        """action_probs is a dictionary of moves to probabilities."""
+    def expand(self, action_probs, table: Optional[TranspositionTable] = None):
+        """action_probs is a dictionary of moves to probabilities.
+        With a table, a child position that is already in the tree is shared rather than
+        duplicated, keeping the prior it was first created with.
+        The children are published in a single assignment, so threads reading the
+        tree never see a partial expansion."""
+        children = {}
         for move in self.state.legal_moves:
             if move in action_probs and action_probs[move] > 0:
-                self.children[move] = Node(
-                    prior = action_probs[move],
-                    state = self.state.make_move(move)
-                )
+                state = self.state.make_move(move)
+                if table is None:
+                    children[move] = Node(prior=action_probs[move], state=state)
+                    continue
+                entry = table.store(state.zobrist_hash)
+                if entry.node is None:
+                    entry.node = Node(prior=action_probs[move], state=state)
+                children[move] = entry.node
+        self.children = children
     
     def select_child(self):
         max_score, selected_action, selected_child = -99, None, None
@@ -44,9 +61,265 @@ class Node:
                 max_score, selected_action, selected_child = score, action, child
         return selected_action, selected_child
 
+def terminal_value(state: HalfChessBoard) -> Optional[float]:
+    """Game result from the perspective of the player to move, or None if the game is ongoing."""
+    result = state.result()
+    if result is None:
+        return None
+    return result if state.white_to_move else -result
+
+class MCTS:
+    """Batched MCTS search.
+
+    Leaves are collected batch_size at a time; each selected path carries a
+    virtual loss so the following descents in the batch spread over other
+    leaves. The batch is evaluated with one evaluator call, after which the
+    virtual losses are removed and the real values backed up.
+
+    A node's value is the sum of backed-up values from the perspective of the
+    player who moved into it, so select_child maximises for the side to move.
+    With a table, transposed positions share one node, and a position and
+    its mirror image (see HalfChessBoard.mirror) share one evaluation.
+    With tablebases, leaves they cover are scored with their exact value and
+    left unexpanded, so the search stops at solved positions.
+    With metrics, a callable such as search_metrics.JsonlSink, each run is
+    timed and counted, and its SearchMetrics record is passed to metrics."""
+
+    def __init__(self, evaluator: Optional[Evaluator] = None, batch_size=1, virtual_loss=1,
+                 table: Optional[TranspositionTable] = None, tablebases: Optional[Tablebases] = None,
+                 metrics: Optional[Callable[[dict], None]] = None):
+        self.evaluator = evaluator if evaluator is not None else PredictEvaluator(dummy_model_predict)
+        self.batch_size = batch_size
+        self.virtual_loss = virtual_loss
+        self.table = table
+        self.tablebases = tablebases
+        self.metrics = metrics
+
+    def run(self, root: Node, num_simulations: int) -> None:
+        """Runs num_simulations simulations from root, expanding it first if necessary."""
+        search = self.__search(root, num_simulations)
+        try:
+            states = next(search)
+            while True:
+                states = search.send(self.evaluator.evaluate(states))
+        except StopIteration:
+            pass
+
+    async def run_async(self, root: Node, num_simulations: int, server) -> None:
+        """As run, but leaf batches are evaluated by awaiting server.evaluate, e.g. an
+        inference_server.InferenceServer shared with other searches running concurrently."""
+        search = self.__search(root, num_simulations)
+        try:
+            states = next(search)
+            while True:
+                states = search.send(await server.evaluate(states))
+        except StopIteration:
+            pass
+
+    def __search(self, root: Node, num_simulations: int) -> Generator[list[HalfChessBoard], tuple, None]:
+        """The search loop of run: yields each batch of states to evaluate and is sent
+        their (values, policies) in return."""
+        m = SearchMetrics() if self.metrics is not None else None
+        if m and self.table is not None:
+            table_hits, table_misses = self.table.hits, self.table.misses
+        start = time.perf_counter()
+
+        if self.table is not None:
+            entry = self.table.store(root.state.zobrist_hash)
+            if entry.node is None:
+                entry.node = root
+        if not root.children and root.state.result() is None:
+            yield from self.__evaluate_and_expand([root], m)
+
+        done = 0
+        while done < num_simulations:
+            pending = []
+            while len(pending) < self.batch_size and done + len(pending) < num_simulations:
+                if m:
+                    t = time.perf_counter()
+                search_path, repeated = self.__select(root)
+                leaf = search_path[-1]
+                if m:
+                    m.select_time += time.perf_counter() - t
+                if repeated:
+                    # The move sequence repeated a position; score the cycle as a draw.
+                    self.__finish(search_path, 0, m, terminal=True)
+                    done += 1
+                    continue
+                value = terminal_value(leaf.state)
+                if value is not None:
+                    self.__finish(search_path, value, m, terminal=True)
+                    done += 1
+                    continue
+                if self.tablebases is not None:
+                    value = self.tablebases.value(leaf.state)
+                    if value is not None:
+                        self.__finish(search_path, value, m, tablebase=True)
+                        done += 1
+                        continue
+                if any(leaf is other[-1] for other in pending):
+                    # Virtual loss did not steer this descent elsewhere; evaluate what we have.
+                    break
+                self.__add_virtual_loss(search_path)
+                pending.append(search_path)
+
+            if pending:
+                values = yield from self.__evaluate_and_expand([path[-1] for path in pending], m)
+                for search_path, value in zip(pending, values):
+                    self.__remove_virtual_loss(search_path)
+                    self.__finish(search_path, value, m)
+                done += len(pending)
+
+        if m:
+            if self.table is not None:
+                m.table_hits = self.table.hits - table_hits
+                m.table_misses = self.table.misses - table_misses
+            self.metrics(m.record(time.perf_counter() - start, root, self.table))
+
+    def __finish(self, search_path: list[Node], value: float, m: Optional[SearchMetrics],
+                 terminal=False, tablebase=False) -> None:
+        """Backs up a simulation's leaf value, counting it in m if metrics are on."""
+        if not m:
+            self.__backup(search_path, value)
+            return
+        t = time.perf_counter()
+        self.__backup(search_path, value)
+        m.backup_time += time.perf_counter() - t
+        m.simulations += 1
+        m.terminal += terminal
+        m.tablebase += tablebase
+        m.add_depth(len(search_path) - 1)
+
+    def __select(self, root: Node) -> tuple[list[Node], bool]:
+        node = root
+        search_path = [node]
+        while node.children:
+            action, node = node.select_child()
+            if node in search_path:
+                return search_path, True
+            search_path.append(node)
+        return search_path, False
+
+    def __evaluate_and_expand(self, leaves: list[Node], m: Optional[SearchMetrics] = None
+                              ) -> Generator[list[HalfChessBoard], tuple, list[float]]:
+        """Expands the leaves and returns their values; the uncached ones are yielded as one batch
+        for evaluation. Cached evaluations are stored for the white-to-move orientation of each position."""
+        evaluations = [None] * len(leaves)
+        entries = [None] * len(leaves)
+        if self.table is not None:
+            for i, leaf in enumerate(leaves):
+                entries[i] = self.table.store(leaf.state.canonical_hash)
+                if entries[i].policy is not None:
+                    policy = entries[i].policy
+                    evaluations[i] = entries[i].value, policy if leaf.state.white_to_move else mirror_policy(policy)
+
+        missing = [i for i, evaluation in enumerate(evaluations) if evaluation is None]
+        if m:
+            m.evaluated += len(missing)
+            m.eval_cache_hits += len(leaves) - len(missing)
+            t = time.perf_counter()
+        if missing:
+            values, policies = yield [leaves[i].state for i in missing]
+            for i, value, policy in zip(missing, values, policies):
+                evaluations[i] = float(value), policy
+                if entries[i] is not None:
+                    entries[i].value = float(value)
+                    entries[i].policy = policy if leaves[i].state.white_to_move else mirror_policy(policy)
+
+        if m:
+            m.evaluate_time += time.perf_counter() - t
+            t = time.perf_counter()
+        for leaf, (value, policy) in zip(leaves, evaluations):
+            leaf.expand(action_probs=policy, table=self.table)
+        if m:
+            m.expand_time += time.perf_counter() - t
+        return [value for value, policy in evaluations]
+
+    def __add_virtual_loss(self, search_path: list[Node]) -> None:
+        for node in search_path:
+            node.visits += self.virtual_loss
+            node.value -= self.virtual_loss
+
+    def __remove_virtual_loss(self, search_path: list[Node]) -> None:
+        for node in search_path:
+            node.visits -= self.virtual_loss
+            node.value += self.virtual_loss
+
+    def __backup(self, search_path: list[Node], value: float) -> None:
+        """Backs up a value given from the perspective of the player to move at the leaf."""
+        for node in reversed(search_path):
+            value = -value
+            node.value += value
+            node.visits += 1
+
+def count_nodes(root: Node) -> int:
+    """Number of distinct nodes reachable from root."""
+    seen = {root}
+    stack = [root]
+    while stack:
+        for child in stack.pop().children.values():
+            if child not in seen:
+                seen.add(child)
+                stack.append(child)
+    return len(seen)
+
+class TreeSearch:
+    """MCTS over the course of one game, keeping the tree between moves.
+
+    After play(move) the child reached by move becomes the new root and the
+    rest of the tree is released, unless mcts has a TranspositionTable: the
+    table keeps every node it files alive until it evicts it (up to its
+    capacity), and pruning does not remove table entries. If max_nodes is set,
+    the tree is checked after each search; when it is over budget, the
+    expansions of the least-visited nodes below the root are dropped. Those
+    nodes keep their statistics and are expanded again if the search returns
+    to them."""
+
+    def __init__(self, state: HalfChessBoard, mcts: Optional[MCTS] = None, max_nodes: Optional[int] = None):
+        self.mcts = mcts if mcts is not None else MCTS()
+        self.max_nodes = max_nodes
+        self.root = Node(prior=0, state=state)
+
+    def search(self, num_simulations: int) -> Node:
+        """Adds num_simulations simulations to the current tree and returns its root."""
+        self.mcts.run(self.root, num_simulations)
+        if self.max_nodes is not None:
+            self.prune(self.max_nodes)
+        return self.root
+
+    def play(self, move: Move) -> None:
+        """Advances the root by move, keeping the searched subtree below it if there is one."""
+        child = self.root.children.get(move)
+        if child is None:
+            child = Node(prior=0, state=self.root.state.make_move(move))
+        self.root = child
+
+    def prune(self, max_nodes: int) -> int:
+        """Keeps the expansions of the most-visited nodes that fit in max_nodes nodes,
+        collapsing the rest into leaves. The root's expansion is always kept, even if it
+        alone exceeds max_nodes. Returns the number of nodes kept."""
+        kept = 1
+        seen = {self.root}
+        # Best-first over expansions; the counter breaks ties without comparing nodes.
+        heap = [(-self.root.visits, 0, self.root)]
+        counter = 1
+        while heap:
+            _, _, node = heapq.heappop(heap)
+            children = [child for child in node.children.values() if child not in seen]
+            if kept + len(children) > max_nodes and node is not self.root:
+                node.children = {}
+                continue
+            kept += len(children)
+            for child in children:
+                seen.add(child)
+                heapq.heappush(heap, (-child.visits, counter, child))
+                counter += 1
+        return kept
+
 if __name__ == '__main__':
 
-    NUM_SIMULATIONS = 30 if len(sys.argv) == 1 else int(sys.argv[1])
+    NUM_SIMULATIONS = 30 if len(sys.argv) < 2 else int(sys.argv[1])
+    BATCH_SIZE = 1 if len(sys.argv) < 3 else int(sys.argv[2])
 
     # initialize root
     root = Node(
@@ -64,25 +337,7 @@ if __name__ == '__main__':
             ]),
             white_to_move=True)
     )
-    # expand the root
-    value, action_probs = dummy_model_predict(root.state)
-    root.expand(action_probs=action_probs)
-
-    # run simulations
-    for _ in range(NUM_SIMULATIONS):
-        node = root
-        search_path = [node]
-        while node.children:
-            action, node = node.select_child()
-            search_path.append(node)
-        value = node.state.result()
-        if value is None:
-            # game isn't over
-            value, action_probs = dummy_model_predict(node.state)
-            node.expand(action_probs=action_probs)
-        for node in search_path:
-            node.value += value
-            node.visits += 1
+    MCTS(batch_size=BATCH_SIZE, table=TranspositionTable()).run(root, NUM_SIMULATIONS)
 
     # print(root.state)
     # for mv, child_node in root.children.items():
@@ -0,0 +1,278 @@
+"""Module providing an opening book built from self-play and search statistics
+
+A book maps positions, keyed by HalfChessBoard.canonical_hash, to weighted
+moves. Like the transposition table's evaluations, a position and its mirror
+image share their entries, which store moves as seen with white to move.
+BookBuilder collects statistics from
+
+- played games (add_game): each move played in the first max_plies plies,
+  with the game's outcome for the player who made it,
+- MCTS searches (add_search, add_tree): root visit counts, or those of every
+  well-visited node of a search tree, and
+- sample_store directories (add_samples): the search policies of positions
+  that occur in at least min_count samples, i.e. those every game passes through.
+
+write() sums the statistics per (position, move), sorts them by key and action
+and saves them as a 32-byte header, the keys as one contiguous uint64 array,
+and then the rest of each entry as RECORD_DTYPE records. OpeningBook
+memory-maps both sections and finds a position's moves by binary search over
+the key array, so lookups read a few pages however large the book is.
+
+BookPlayer (tournament players) and selfplay.play_game(book=...) play book
+moves without searching, picking each in proportion to its weight.
+"""
+
+import argparse
+import os
+import tempfile
+import time
+from collections import deque
+from typing import Optional
+import numpy as np
+import numpy.typing as npt
+from half_chess_board import (HalfChessBoard, Move, ACTION_MOVES, ACTION_IDS, MIRROR_ACTIONS,
+                              ZOBRIST_PIECES, mirror_move)
+from encoder_decoder import PIECE_PLANES, mirror_states, mirror_policies
+
+MAGIC = b'HCOB'
+VERSION = 2
+HEADER_BYTES = 32
+
+ENTRY_DTYPE = np.dtype([
+    ('key', '<u8'),     # canonical_hash of the position
+    ('action', '<u2'),  # action id of the move with white to move
+    ('weight', '<f4'),  # summed visit counts (or visit fractions, for samples, and plays, for games)
+    ('games', '<u4'),   # games in which the move was played
+    ('score', '<f4'),   # summed outcomes of those games for the player who made the move
+])
+# An entry without its key, as stored after the file's key array.
+RECORD_DTYPE = np.dtype([(name, ENTRY_DTYPE[name]) for name in ENTRY_DTYPE.names if name != 'key'])
+
+# ZOBRIST_PIECES indexed by encode_board plane, for hashing encoded positions.
+_PLANE_KEYS = np.array([ZOBRIST_PIECES[piece] for piece in PIECE_PLANES], dtype=np.uint64)
+
+
+def plane_hashes(planes: npt.NDArray) -> npt.NDArray[np.uint64]:
+    """canonical_hash of (N, 11, 8, 4) encoded positions, all with white to move."""
+    pieces = planes[:, :len(PIECE_PLANES)].reshape(len(planes), -1) != 0
+    return np.bitwise_xor.reduce(np.where(pieces, _PLANE_KEYS.reshape(-1), np.uint64(0)), axis=1)
+
+
+def _canonical_action(board: HalfChessBoard, move: Move) -> int:
+    action = ACTION_IDS[move]
+    return action if board.white_to_move else MIRROR_ACTIONS[action]
+
+
+class BookBuilder:
+    """Accumulates (position, move) statistics in chunks, summed when the book is written."""
+
+    def __init__(self, max_plies=16):
+        self.max_plies = max_plies
+        self.chunks: list[npt.NDArray] = []
+
+    def __add(self, keys, actions, weights, games=0, scores=0.0) -> None:
+        chunk = np.zeros(len(keys), dtype=ENTRY_DTYPE)
+        chunk['key'] = keys
+        chunk['action'] = actions
+        chunk['weight'] = weights
+        chunk['games'] = games
+        chunk['score'] = scores
+        self.chunks.append(chunk)
+
+    def add_game(self, moves: list[Move], result: int, start: Optional[HalfChessBoard] = None) -> None:
+        """Adds the first max_plies moves of a game from start (default: HalfChessBoard())
+        that ended with result (for white)."""
+        board = start if start is not None else HalfChessBoard()
+        keys, actions, scores = [], [], []
+        for move in moves[:self.max_plies]:
+            keys.append(board.canonical_hash)
+            actions.append(_canonical_action(board, move))
+            scores.append(result if board.white_to_move else -result)
+            board = board.make_move(move)
+        self.__add(np.array(keys, dtype=np.uint64), actions, 1, 1, scores)
+
+    def add_search(self, board: HalfChessBoard, visits: dict[Move, int]) -> None:
+        """Adds the visit counts of a search from board, e.g. parallel_mcts.root_parallel_search."""
+        moves = [move for move, count in visits.items() if count > 0]
+        if moves:
+            self.__add(np.full(len(moves), board.canonical_hash, dtype=np.uint64),
+                       [_canonical_action(board, move) for move in moves], [visits[move] for move in moves])
+
+    def add_tree(self, root, min_visits=100) -> int:
+        """Adds the child visit counts of every node within max_plies of an MCTS root that has
+        at least min_visits visits. Returns the number of positions added."""
+        seen = {root}
+        queue = deque([(root, 0)])
+        added = 0
+        while queue:
+            node, depth = queue.popleft()
+            if depth >= self.max_plies or node.visits < min_visits or not node.children:
+                continue
+            self.add_search(node.state, {move: child.visits for move, child in node.children.items()})
+            added += 1
+            for child in node.children.values():
+                if child not in seen:
+                    seen.add(child)
+                    queue.append((child, depth + 1))
+        return added
+
+    def add_samples(self, store, min_count=100, chunk_size=65536) -> int:
+        """Adds the search policies of the samples in a sample_store.SampleStore whose position
+        occurs in at least min_count samples, as fractional visits. Returns the number of positions."""
+        hashes = np.empty(len(store), dtype=np.uint64)
+        for start in range(0, len(store), chunk_size):
+            indices = np.arange(start, min(start + chunk_size, len(store)))
+            planes, _, _ = store.batch(indices, np.uint8)
+            black = planes[:, 10, 0, 0] == 0
+            planes[black] = mirror_states(planes[black])
+            hashes[indices] = plane_hashes(planes)
+        keys, counts = np.unique(hashes, return_counts=True)
+        keys = keys[counts >= min_count]
+        if len(keys) == 0:
+            return 0
+
+        for start in range(0, len(store), chunk_size):
+            indices = np.arange(start, min(start + chunk_size, len(store)))
+            indices = indices[np.isin(hashes[indices], keys)]
+            if len(indices) == 0:
+                continue
+            planes, policies, _ = store.batch(indices, np.uint8)
+            black = planes[:, 10, 0, 0] == 0
+            policies[black] = mirror_policies(policies[black])
+            rows, actions = np.nonzero(policies)
+            self.__add(hashes[indices][rows], actions, policies[rows, actions])
+        return len(keys)
+
+    def entries(self) -> npt.NDArray:
+        """The accumulated statistics summed per (key, action), sorted."""
+        if not self.chunks:
+            return np.zeros(0, dtype=ENTRY_DTYPE)
+        entries = np.concatenate(self.chunks)
+        entries = entries[np.lexsort((entries['action'], entries['key']))]
+        first = np.ones(len(entries), dtype=bool)
+        first[1:] = (entries['key'][1:] != entries['key'][:-1]) | (entries['action'][1:] != entries['action'][:-1])
+        starts = np.flatnonzero(first)
+        merged = entries[starts]
+        for field in ('weight', 'games', 'score'):
+            merged[field] = np.add.reduceat(entries[field].astype(np.float64), starts)
+        self.chunks = [merged]
+        return merged
+
+    def write(self, path: str, min_weight=0.0) -> int:
+        """Writes the book, leaving out moves with less than min_weight; returns the number of entries."""
+        entries = self.entries()
+        entries = entries[entries['weight'] >= min_weight]
+        header = MAGIC + np.uint32(VERSION).tobytes() + np.uint64(len(entries)).tobytes()
+        with open(path, 'wb') as f:
+            f.write(header.ljust(HEADER_BYTES, b'\0'))
+            np.ascontiguousarray(entries['key']).tofile(f)
+            entries[list(RECORD_DTYPE.names)].astype(RECORD_DTYPE).tofile(f)
+        return len(entries)
+
+
+class OpeningBook:
+    """Read-only, memory-mapped book written by BookBuilder.write.
+    keys is the sorted key array and records the matching RECORD_DTYPE entries."""
+
+    def __init__(self, path: str):
+        with open(path, 'rb') as f:
+            header = f.read(HEADER_BYTES)
+        if header[:4] != MAGIC or np.frombuffer(header[4:8], dtype='<u4')[0] != VERSION:
+            raise ValueError(f'{path} is not a version {VERSION} half-chess opening book')
+        count = int(np.frombuffer(header[8:16], dtype='<u8')[0])
+        if count:
+            # Contiguous and aligned, so searchsorted bisects the map in place instead of copying the column.
+            self.keys = np.memmap(path, dtype='<u8', mode='r', offset=HEADER_BYTES, shape=(count,))
+            self.records = np.memmap(path, dtype=RECORD_DTYPE, mode='r', offset=HEADER_BYTES + 8 * count,
+                                     shape=(count,))
+        else:
+            self.keys = np.zeros(0, dtype='<u8')
+            self.records = np.zeros(0, dtype=RECORD_DTYPE)
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def lookup(self, board: HalfChessBoard) -> npt.NDArray:
+        """The RECORD_DTYPE entries of board's position (empty if it is out of book),
+        with white-to-move actions."""
+        key = np.uint64(board.canonical_hash)
+        start = self.keys.searchsorted(key, side='left')
+        end = self.keys.searchsorted(key, side='right')
+        return self.records[start:end]
+
+    def moves(self, board: HalfChessBoard) -> dict[Move, float]:
+        """board's book moves and their weights."""
+        entries = self.lookup(board)
+        moves = {}
+        for action, weight in zip(entries['action'].tolist(), entries['weight'].tolist()):
+            move = ACTION_MOVES[action] if board.white_to_move else mirror_move(ACTION_MOVES[action])
+            # Guards against hash collisions with other positions.
+            if board.is_legal(move):
+                moves[move] = weight
+        return moves
+
+    def choose(self, board: HalfChessBoard, rng: np.random.Generator, temperature=1.0,
+               min_weight=0.0) -> Optional[Move]:
+        """A book move drawn with probability proportional to weight ** (1 / temperature)
+        among moves with at least min_weight, or None if board is out of book."""
+        moves = {move: weight for move, weight in self.moves(board).items() if weight >= min_weight and weight > 0}
+        if not moves:
+            return None
+        weights = np.array(list(moves.values()), dtype=np.float64) ** (1 / temperature)
+        return list(moves)[rng.choice(len(moves), p=weights / weights.sum())]
+
+
+if __name__ == '__main__':
+    from mcts import MCTS, Node
+    from sample_store import SampleStore
+    from transposition import TranspositionTable
+
+    parser = argparse.ArgumentParser(description='Build an opening book and time lookups in it.')
+    parser.add_argument('out')
+    parser.add_argument('--samples', action='append', default=[], help='sample_store directory (repeatable)')
+    parser.add_argument('--min-count', type=int, default=100, help='samples a position needs to enter the book')
+    parser.add_argument('--simulations', type=int, default=0, help='also search the starting position this much')
+    parser.add_argument('--min-visits', type=int, default=100, help='visits a searched node needs to enter the book')
+    parser.add_argument('--max-plies', type=int, default=16)
+    parser.add_argument('--min-weight', type=float, default=0.0)
+    args = parser.parse_args()
+
+    builder = BookBuilder(max_plies=args.max_plies)
+    for directory in args.samples:
+        positions = builder.add_samples(SampleStore(directory), args.min_count)
+        print(f'{directory}: {positions} positions')
+    if args.simulations:
+        root = Node(prior=0, state=HalfChessBoard())
+        MCTS(batch_size=16, table=TranspositionTable()).run(root, args.simulations)
+        print(f'search: {builder.add_tree(root, args.min_visits)} positions')
+    count = builder.write(args.out, args.min_weight)
+    print(f'{count} entries, {os.path.getsize(args.out)} bytes')
+
+    book = OpeningBook(args.out)
+    board = HalfChessBoard()
+    rng = np.random.default_rng(0)
+    start = time.perf_counter()
+    for _ in range(10_000):
+        book.choose(board, rng)
+    print(f'{(time.perf_counter() - start) / 10_000 * 1e6:.1f} us per choose from the starting position')
+
+    # Lookups bisect the key array in place, so their cost barely grows with the book.
+    rng = np.random.default_rng(0)
+    times = []
+    with tempfile.TemporaryDirectory() as directory:
+        for size in (10_000, 100_000, 1_000_000, 4_000_000):
+            synthetic = BookBuilder()
+            chunk = np.zeros(size, dtype=ENTRY_DTYPE)
+            chunk['key'] = rng.integers(0, 2 ** 63, size, dtype=np.uint64)
+            chunk['weight'] = 1
+            synthetic.chunks.append(chunk)
+            path = os.path.join(directory, f'{size}.book')
+            synthetic.write(path)
+            sized = OpeningBook(path)
+            start = time.perf_counter()
+            for _ in range(1000):
+                sized.lookup(board)
+            times.append((time.perf_counter() - start) / 1000)
+            print(f'{size} entries: {times[-1] * 1e6:.1f} us per lookup')
+            del sized
+    assert times[-1] < 5 * times[0], 'lookup time grows with the book'
@@ -0,0 +1,208 @@
+"""Module providing parallel MCTS for a single move decision.
+
+Two modes are offered:
+
+- Root parallelism (root_parallel_search): independent trees are searched in
+  worker processes, each with its own Dirichlet noise on the root priors so
+  the trees differ, and the root visit counts are summed.
+- Shared-tree parallelism (SharedTreeMCTS): several threads descend one tree,
+  spreading out with virtual loss. Node statistics are updated under striped
+  locks, and a leaf is claimed by one thread before its legal moves are
+  generated (which pushes and pops moves on its board), so no other thread
+  touches its board until it is expanded.
+  Threads only run in parallel while the evaluator releases the GIL (e.g.
+  inside NumPy or a network runtime), so this mode suits heavy evaluators.
+"""
+
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+import numpy as np
+from half_chess_board import HalfChessBoard, Move
+from evaluator import Evaluator, PredictEvaluator
+from mcts import MCTS, Node, dummy_model_predict, terminal_value
+
+
+def add_dirichlet_noise(root: Node, rng: np.random.Generator, alpha=0.3, fraction=0.25) -> None:
+    """Mixes Dirichlet noise into the priors of an expanded root's children."""
+    children = list(root.children.values())
+    noise = rng.dirichlet([alpha] * len(children))
+    for child, eta in zip(children, noise):
+        child.prior = (1 - fraction) * child.prior + fraction * eta
+
+
+def _search_tree(state: HalfChessBoard, num_simulations: int, evaluator: Evaluator,
+                 batch_size: int, seed: int) -> dict[Move, int]:
+    """Process entry point: searches one independent tree and returns its root visit counts."""
+    mcts = MCTS(evaluator, batch_size=batch_size)
+    root = Node(prior=0, state=state)
+    mcts.run(root, 0)
+    add_dirichlet_noise(root, np.random.default_rng(seed))
+    mcts.run(root, num_simulations)
+    return {move: child.visits for move, child in root.children.items()}
+
+
+def root_parallel_search(state: HalfChessBoard, num_simulations: int, num_workers: Optional[int] = None,
+                         evaluator: Optional[Evaluator] = None, batch_size=1, seed=0,
+                         pool: Optional[ProcessPoolExecutor] = None) -> dict[Move, int]:
+    """Splits num_simulations over num_workers independent trees (default: one per core)
+    and returns the summed visit counts of the root's children.
+    Pass a pool to reuse worker processes across moves."""
+    if evaluator is None:
+        evaluator = PredictEvaluator(dummy_model_predict)
+    num_workers = num_workers or os.cpu_count()
+    shares = [num_simulations // num_workers + (i < num_simulations % num_workers) for i in range(num_workers)]
+    own_pool = pool is None
+    if own_pool:
+        pool = ProcessPoolExecutor(num_workers)
+    try:
+        futures = [pool.submit(_search_tree, state, share, evaluator, batch_size, seed * num_workers + i)
+                   for i, share in enumerate(shares) if share]
+        visits = {}
+        for future in futures:
+            for move, count in future.result().items():
+                visits[move] = visits.get(move, 0) + count
+    finally:
+        if own_pool:
+            pool.shutdown()
+    return visits
+
+
+class SharedTreeMCTS:
+    """MCTS with num_threads threads descending one shared tree under virtual loss.
+
+    Node statistics are guarded by a fixed array of locks, picked by hashing
+    the node, so threads only contend when they touch nodes that share a lock.
+    Child selection reads statistics without locking; a slightly stale read
+    only changes which child is tried."""
+
+    def __init__(self, evaluator: Optional[Evaluator] = None, num_threads=4, virtual_loss=1, num_locks=1024):
+        self.evaluator = evaluator if evaluator is not None else PredictEvaluator(dummy_model_predict)
+        self.num_threads = num_threads
+        self.virtual_loss = virtual_loss
+        self.locks = [threading.Lock() for _ in range(num_locks)]
+        self.counter_lock = threading.Lock()
+        self.in_flight = set()
+        self.remaining = 0
+        self.errors: list[BaseException] = []
+
+    def run(self, root: Node, num_simulations: int) -> None:
+        """Runs num_simulations simulations from root across the threads.
+        If a thread fails, the others stop and its exception is raised."""
+        if not root.children and terminal_value(root.state) is None:
+            _, policies = self.evaluator.evaluate([root.state])
+            root.expand(action_probs=policies[0])
+        self.remaining = num_simulations
+        self.errors = []
+        threads = [threading.Thread(target=self.__work, args=(root,)) for _ in range(self.num_threads)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        if self.errors:
+            raise self.errors[0]
+
+    def __lock(self, node: Node) -> threading.Lock:
+        return self.locks[hash(node) % len(self.locks)]
+
+    def __claim(self) -> bool:
+        with self.counter_lock:
+            if self.remaining == 0:
+                return False
+            self.remaining -= 1
+            return True
+
+    def __release(self) -> None:
+        with self.counter_lock:
+            self.remaining += 1
+
+    def __work(self, root: Node) -> None:
+        try:
+            while self.__claim():
+                if not self.__simulate(root):
+                    # Collided with another thread's leaf; give the simulation back and let it finish.
+                    self.__release()
+                    time.sleep(0)
+        except BaseException as error:
+            with self.counter_lock:
+                self.errors.append(error)
+                self.remaining = 0
+
+    def __simulate(self, root: Node) -> bool:
+        node = root
+        search_path = [node]
+        self.__apply(node, self.virtual_loss, -self.virtual_loss)
+        while node.children:
+            _, node = node.select_child()
+            search_path.append(node)
+            self.__apply(node, self.virtual_loss, -self.virtual_loss)
+
+        # Claim the leaf before anything generates its legal moves on the shared board.
+        with self.__lock(node):
+            claimed = not node.children and node not in self.in_flight
+            if claimed:
+                self.in_flight.add(node)
+        if not claimed:
+            self.__undo(search_path)
+            return False
+        try:
+            value = terminal_value(node.state)
+            if value is None:
+                values, policies = self.evaluator.evaluate([node.state])
+                value = float(values[0])
+                node.expand(action_probs=policies[0])
+        except BaseException:
+            self.__undo(search_path)
+            raise
+        finally:
+            with self.__lock(node):
+                self.in_flight.discard(node)
+
+        for visited in reversed(search_path):
+            value = -value
+            self.__apply(visited, 1 - self.virtual_loss, value + self.virtual_loss)
+        return True
+
+    def __undo(self, search_path: list[Node]) -> None:
+        for visited in search_path:
+            self.__apply(visited, -self.virtual_loss, self.virtual_loss)
+
+    def __apply(self, node: Node, visits, value) -> None:
+        with self.__lock(node):
+            node.visits += visits
+            node.value += value
+
+
+if __name__ == '__main__':
+    NUM_SIMULATIONS = 800 if len(sys.argv) < 2 else int(sys.argv[1])
+    NUM_WORKERS = os.cpu_count() if len(sys.argv) < 3 else int(sys.argv[2])
+
+    board = HalfChessBoard()
+    visits = root_parallel_search(board, NUM_SIMULATIONS, NUM_WORKERS)
+    print('root parallel:', sorted(visits.items(), key=lambda item: -item[1])[:3])
+
+    root = Node(prior=0, state=board)
+    SharedTreeMCTS(num_threads=NUM_WORKERS).run(root, NUM_SIMULATIONS)
+    print('shared tree:  ', sorted(((move, child.visits) for move, child in root.children.items()),
+                                   key=lambda item: -item[1])[:3])
+
+    # Without virtual loss and with frequent thread switches, threads often reach the same
+    # fresh leaf together; every child edge must still be a legal move of a fresh copy of its board.
+    sys.setswitchinterval(1e-6)
+    root = Node(prior=0, state=HalfChessBoard())
+    SharedTreeMCTS(num_threads=8, virtual_loss=0).run(root, NUM_SIMULATIONS)
+    sys.setswitchinterval(0.005)
+    illegal, seen, stack = 0, {root}, [root]
+    while stack:
+        node = stack.pop()
+        legal = set(HalfChessBoard(node.state.board.copy(), node.state.white_to_move).legal_moves)
+        illegal += sum(move not in legal for move in node.children)
+        for child in node.children.values():
+            if child not in seen:
+                seen.add(child)
+                stack.append(child)
+    print(f'shared tree, 8 threads: {root.visits} visits, {len(seen)} nodes, {illegal} illegal edges')
+    assert illegal == 0
@@ -0,0 +1,165 @@
+"""Perft: move generator correctness and speed checks.
+
+perft(board, depth) counts the leaf positions of the legal move tree, walking
+it in place with push/pop. Running this module counts a fixed suite of
+positions against recorded node counts and prints one line per position:
+
+    perft <name> depth=<d> nodes=<n> expected=<e> status=<ok|MISMATCH> result=<r> seconds=<s> nodes/s=<r>
+
+With --profile, it then prints the time spent in each move generation helper:
+
+    profile <function> calls=<n> tottime=<s> cumtime=<s>
+
+The first columns only change when move generation changes, so output can be
+diffed against a recorded run to catch correctness and speed regressions.
+"""
+
+import argparse
+import cProfile
+import pstats
+import sys
+import time
+import numpy as np
+from half_chess_board import HalfChessBoard, ACTION_MOVES
+
+
+def perft(board: HalfChessBoard, depth: int) -> int:
+    """Number of leaf positions reached by playing every legal move sequence of length depth."""
+    if depth == 0:
+        return 1
+    actions = board.legal_actions
+    if depth == 1:
+        return len(actions)
+    nodes = 0
+    for action in actions:
+        board.push(ACTION_MOVES[action])
+        nodes += perft(board, depth - 1)
+        board.pop()
+    return nodes
+
+
+def divide(board: HalfChessBoard, depth: int) -> dict:
+    """Perft counts below each legal move, for narrowing down a mismatch."""
+    counts = {}
+    for move in board.legal_moves:
+        board.push(move)
+        counts[move] = perft(board, depth - 1)
+        board.pop()
+    return counts
+
+
+def _board(rows: list[str], white_to_move=True) -> HalfChessBoard:
+    return HalfChessBoard(np.array([list(row) for row in rows]), white_to_move)
+
+
+# name -> (board factory, depth, expected node count)
+POSITIONS = {
+    'start': (lambda: HalfChessBoard(), 5, 19902),
+    # White pawns on the second-to-last row, with a choice of pieces to take out on promotion.
+    'promotion-captures': (lambda: _board([
+        ' nbr',
+        'P  P',
+        ' b  ',
+        '    ',
+        'k   ',
+        '  K ',
+        '   p',
+        '    ',
+    ]), 4, 24316),
+    # The white knight and bishop are pinned against their king.
+    'pins': (lambda: _board([
+        '  k ',
+        '    ',
+        'r NK',
+        '  B ',
+        '    ',
+        'b   ',
+        '    ',
+        '    ',
+    ]), 4, 3649),
+    # Black to move has no legal moves and is not in check.
+    'stalemate': (lambda: _board([
+        'k   ',
+        '    ',
+        'K N ',
+        '    ',
+        '    ',
+        '    ',
+        '    ',
+        '    ',
+    ], white_to_move=False), 1, 0),
+    # Moves remain, but result() already scores the game as a draw.
+    'insufficient-material': (lambda: _board([
+        ' k  ',
+        '    ',
+        '    ',
+        '    ',
+        '  N ',
+        '    ',
+        '    ',
+        '   K',
+    ]), 5, 16578),
+    # The endgame searched in mcts.py.
+    'kbn-vs-k': (lambda: _board([
+        ' k  ',
+        '   B',
+        ' K  ',
+        '  N ',
+        '    ',
+        '    ',
+        '    ',
+        '    ',
+    ]), 6, 20218),
+}
+
+# Functions reported by --profile (their names as compiled, before name mangling).
+PROFILED = ('__get_legal_actions', '__legal_moves_P', '__legal_moves_p', '__legal_moves_N',
+            '__legal_moves_n', '__legal_moves_B', '__legal_moves_b', '__legal_moves_R',
+            '__legal_moves_r', '__legal_moves_K', '__legal_moves_k', '__in_check_after_move',
+            'is_attacked', 'push', 'pop')
+
+
+def run_suite(depth_offset=0) -> bool:
+    """Runs every position in POSITIONS, printing one line each; returns whether all counts matched."""
+    all_ok = True
+    for name, (make_board, depth, expected) in POSITIONS.items():
+        depth += depth_offset
+        board = make_board()
+        start = time.perf_counter()
+        nodes = perft(board, depth)
+        seconds = time.perf_counter() - start
+        ok = depth_offset != 0 or nodes == expected
+        all_ok &= ok
+        print(f'perft {name} depth={depth} nodes={nodes} expected={expected if depth_offset == 0 else "-"} '
+              f'status={"ok" if ok else "MISMATCH"} result={board.result()} '
+              f'seconds={seconds:.3f} nodes/s={nodes / max(seconds, 1e-9):.0f}')
+    return all_ok
+
+
+def print_profile(profiler: cProfile.Profile) -> None:
+    stats = pstats.Stats(profiler).stats
+    totals = {}
+    for (filename, _, function), (_, calls, tottime, cumtime, _) in stats.items():
+        if function in PROFILED and filename.endswith('half_chess_board.py'):
+            prev = totals.get(function, (0, 0, 0))
+            totals[function] = (prev[0] + calls, prev[1] + tottime, prev[2] + cumtime)
+    for function in PROFILED:
+        calls, tottime, cumtime = totals.get(function, (0, 0, 0))
+        print(f'profile {function} calls={calls} tottime={tottime:.3f} cumtime={cumtime:.3f}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Count and time perft over the position suite.')
+    parser.add_argument('--profile', action='store_true', help='print a per-function time breakdown')
+    parser.add_argument('--depth-offset', type=int, default=0,
+                        help='search deeper or shallower than the recorded depths (skips the count check)')
+    args = parser.parse_args()
+
+    profiler = cProfile.Profile() if args.profile else None
+    if profiler:
+        profiler.enable()
+    ok = run_suite(args.depth_offset)
+    if profiler:
+        profiler.disable()
+        print_profile(profiler)
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,206 @@
+"""Module providing an append-only, memory-mapped store for training samples.
+
+A store is a directory of shards. Each shard is a pair of flat files:
+
+- <prefix>-NNNNN.samples: RECORD_DTYPE records holding the encode_board
+  planes bit-packed into 44 bytes, the game outcome for the player to move,
+  and the location of the sample's policy entries.
+- <prefix>-NNNNN.policy: POLICY_DTYPE (action id, probability) pairs, one per
+  move with a nonzero search probability.
+
+A sample's policy entries are written before its record, so a shard cut off
+mid-write reads back as its complete samples. At roughly 60 bytes per record
+plus 4 per searched move, a million positions take a little over 100 MB.
+
+A position and its mirror image (HalfChessBoard.mirror) are equivalent, so
+by default the writer stores every sample in its white-to-move orientation,
+and SampleStore.sample_batch can mirror random samples back as augmentation.
+
+SampleStore memory-maps every shard, so a minibatch only reads the records
+and policy entries it touches.
+"""
+
+import glob
+import os
+import sys
+import time
+from typing import Optional
+import numpy as np
+import numpy.typing as npt
+from encoder_decoder import NUM_ACTIONS, PIECE_PLANES, mirror_states, mirror_policies
+
+PLANES_SHAPE = (len(PIECE_PLANES) + 1, 8, 4)
+PLANE_BITS = int(np.prod(PLANES_SHAPE))
+PACKED_BYTES = PLANE_BITS // 8
+
+RECORD_DTYPE = np.dtype([
+    ('planes', np.uint8, (PACKED_BYTES,)),  # np.packbits of the 11x8x4 planes
+    ('outcome', np.int8),                    # game result for the player to move
+    ('num_moves', np.uint16),                # number of policy entries
+    ('policy_start', np.uint64),             # index of the first policy entry in the shard
+])
+
+POLICY_DTYPE = np.dtype([
+    ('action', np.uint16),
+    ('prob', np.float16),
+])
+
+
+def pack_planes(planes: npt.NDArray[np.uint8]) -> npt.NDArray[np.uint8]:
+    """(N, 11, 8, 4) 0/1 planes to (N, 44) bytes."""
+    return np.packbits(planes.reshape(len(planes), PLANE_BITS), axis=1)
+
+
+def unpack_planes(packed: npt.NDArray[np.uint8], dtype=np.uint8) -> npt.NDArray:
+    """Inverse of pack_planes."""
+    return np.unpackbits(packed, axis=1, count=PLANE_BITS).reshape(-1, *PLANES_SHAPE).astype(dtype, copy=False)
+
+
+def count_samples(directory: str, prefix: str) -> int:
+    """Number of complete samples in the shards <prefix>-NNNNN.samples of directory."""
+    return sum(os.path.getsize(path) // RECORD_DTYPE.itemsize
+               for path in glob.glob(os.path.join(glob.escape(directory), f'{glob.escape(prefix)}-*.samples')))
+
+
+class SampleWriter:
+    """Appends samples to numbered shards, starting a new shard every shard_size samples.
+    Shards from earlier runs into the same directory are left untouched.
+    With canonical=True, black-to-move samples are mirrored before writing."""
+
+    def __init__(self, out_dir: str, prefix: str, shard_size=1_000_000, canonical=True):
+        self.out_dir = out_dir
+        self.prefix = prefix
+        self.shard_size = shard_size
+        self.canonical = canonical
+        self.shard = 0
+        self.count = 0
+        self.num_entries = 0
+        self.files = None
+        os.makedirs(out_dir, exist_ok=True)
+
+    def write(self, states: npt.NDArray[np.uint8], policies: npt.NDArray[np.float32],
+              outcomes: npt.NDArray[np.int8]) -> None:
+        """Appends samples given as (N, 11, 8, 4) planes, (N, NUM_ACTIONS) policies and N outcomes."""
+        if self.canonical:
+            black = states[:, 10, 0, 0] == 0
+            if black.any():
+                states, policies = states.copy(), policies.copy()
+                states[black] = mirror_states(states[black])
+                policies[black] = mirror_policies(policies[black])
+        while len(states):
+            if self.files is None or self.count == self.shard_size:
+                self.__next_shard()
+            n = min(len(states), self.shard_size - self.count)
+            self.__write_chunk(states[:n], policies[:n], outcomes[:n])
+            states, policies, outcomes = states[n:], policies[n:], outcomes[n:]
+
+    def close(self) -> None:
+        if self.files is not None:
+            for file in self.files:
+                file.close()
+            self.files = None
+
+    def __write_chunk(self, states, policies, outcomes) -> None:
+        rows, actions = np.nonzero(policies)
+        entries = np.empty(len(rows), dtype=POLICY_DTYPE)
+        entries['action'] = actions
+        entries['prob'] = policies[rows, actions]
+        num_moves = np.bincount(rows, minlength=len(states))
+
+        records = np.empty(len(states), dtype=RECORD_DTYPE)
+        records['planes'] = pack_planes(states)
+        records['outcome'] = outcomes
+        records['num_moves'] = num_moves
+        records['policy_start'] = self.num_entries + np.cumsum(num_moves) - num_moves
+
+        samples_file, policy_file = self.files
+        entries.tofile(policy_file)
+        policy_file.flush()
+        records.tofile(samples_file)
+        samples_file.flush()
+        self.count += len(records)
+        self.num_entries += len(entries)
+
+    def __next_shard(self) -> None:
+        self.close()
+        while os.path.exists((path := os.path.join(self.out_dir, f'{self.prefix}-{self.shard:05d}')) + '.samples'):
+            self.shard += 1
+        self.files = open(path + '.samples', 'xb'), open(path + '.policy', 'xb')
+        self.count = 0
+        self.num_entries = 0
+
+
+class SampleStore:
+    """Read-only view of every shard in a directory, indexed as one sequence of samples."""
+
+    def __init__(self, directory: str):
+        self.records = []
+        self.policies = []
+        for path in sorted(glob.glob(os.path.join(directory, '*.samples'))):
+            records = self.__map(path, RECORD_DTYPE)
+            if len(records) == 0:
+                continue
+            self.records.append(records)
+            self.policies.append(self.__map(path[:-len('.samples')] + '.policy', POLICY_DTYPE))
+        self.offsets = np.cumsum([0] + [len(records) for records in self.records])
+
+    def __len__(self) -> int:
+        return int(self.offsets[-1])
+
+    def batch(self, indices: npt.NDArray[np.int64], dtype=np.float32
+              ) -> tuple[npt.NDArray, npt.NDArray[np.float32], npt.NDArray[np.int8]]:
+        """(planes, dense policies, outcomes) for the samples at indices, in order."""
+        indices = np.asarray(indices)
+        planes = np.empty((len(indices), *PLANES_SHAPE), dtype=dtype)
+        policies = np.zeros((len(indices), NUM_ACTIONS), dtype=np.float32)
+        outcomes = np.empty(len(indices), dtype=np.int8)
+
+        shards = np.searchsorted(self.offsets, indices, side='right') - 1
+        for shard in np.unique(shards):
+            rows = np.nonzero(shards == shard)[0]
+            records = self.records[shard][indices[rows] - self.offsets[shard]]
+            planes[rows] = unpack_planes(records['planes'], dtype)
+            outcomes[rows] = records['outcome']
+
+            # Gather every policy entry of the selected records with one fancy index.
+            counts = records['num_moves'].astype(np.int64)
+            within = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+            entries = self.policies[shard][np.repeat(records['policy_start'].astype(np.int64), counts) + within]
+            policies[np.repeat(rows, counts), entries['action']] = entries['prob']
+        return planes, policies, outcomes
+
+    def sample_batch(self, batch_size: int, rng: Optional[np.random.Generator] = None, dtype=np.float32,
+                     augment=False) -> tuple[npt.NDArray, npt.NDArray[np.float32], npt.NDArray[np.int8]]:
+        """A uniformly random minibatch (with replacement) across all shards.
+        With augment=True, each sample is replaced by its mirror image with probability 1/2."""
+        rng = rng if rng is not None else np.random.default_rng()
+        planes, policies, outcomes = self.batch(rng.integers(len(self), size=batch_size), dtype)
+        if augment:
+            flip = rng.random(batch_size) < 0.5
+            planes[flip] = mirror_states(planes[flip])
+            policies[flip] = mirror_policies(policies[flip])
+        return planes, policies, outcomes
+
+    @staticmethod
+    def __map(path: str, dtype: np.dtype) -> npt.NDArray:
+        # Ignore a trailing partial record left by an interrupted write.
+        count = os.path.getsize(path) // dtype.itemsize
+        if count == 0:
+            return np.empty(0, dtype=dtype)
+        return np.memmap(path, dtype=dtype, mode='r', shape=(count,))
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print('usage: python sample_store.py <directory> [batch_size]')
+        sys.exit(1)
+    BATCH_SIZE = 1024 if len(sys.argv) < 3 else int(sys.argv[2])
+
+    store = SampleStore(sys.argv[1])
+    print(f'{len(store)} samples in {len(store.records)} shards')
+    if len(store):
+        rng = np.random.default_rng(0)
+        start = time.perf_counter()
+        for _ in range(100):
+            store.sample_batch(BATCH_SIZE, rng)
+        print(f'{100 * BATCH_SIZE / (time.perf_counter() - start):.0f} random samples/s')
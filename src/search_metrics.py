@@ -0,0 +1,109 @@
+"""Module providing MCTS search metrics as flat, JSON-serializable records
+
+MCTS(metrics=sink) counts what one run() call does in a SearchMetrics and,
+when the run finishes, passes sink the record from SearchMetrics.record:
+
+- simulations, seconds, simulations_per_sec
+- select_s, expand_s, evaluate_s, backup_s: time in each phase; expand_s
+  covers Node.expand, including make_move for every child
+- other_s: the rest, mostly checking leaves for the end of the game (which
+  generates their legal moves) and tablebase probes
+- evaluated_leaves, eval_cache_hits, eval_cache_hit_rate: leaves sent to
+  the evaluator, and leaves whose evaluation came from the transposition table
+- terminal_leaves, tablebase_leaves: leaves scored without evaluation, by the
+  game rules or a repetition, and by a tablebase
+- max_depth, mean_depth: of the selected leaves, in plies below the root
+- tree_nodes, tree_bytes: distinct nodes below the root after the run, and
+  their approximate memory footprint
+- table_size, table_hits, table_misses, table_hit_rate: transposition table
+  size, and lookups during the run (node sharing and evaluations together)
+
+With metrics switched off (the default), the search only pays for a few flag checks.
+"""
+
+import json
+import sys
+from typing import Optional, TextIO
+
+
+class SearchMetrics:
+    """Counters for one MCTS.run call; times are perf_counter seconds."""
+
+    def __init__(self):
+        self.simulations = 0
+        self.select_time = 0.0
+        self.expand_time = 0.0
+        self.evaluate_time = 0.0
+        self.backup_time = 0.0
+        self.evaluated = 0
+        self.eval_cache_hits = 0
+        self.terminal = 0
+        self.tablebase = 0
+        self.depth_total = 0
+        self.max_depth = 0
+        self.table_hits = 0
+        self.table_misses = 0
+
+    def add_depth(self, depth: int) -> None:
+        self.depth_total += depth
+        if depth > self.max_depth:
+            self.max_depth = depth
+
+    def record(self, seconds: float, root, table=None) -> dict:
+        """The metrics as a flat dict, with the tree below root measured now."""
+        nodes, nbytes = tree_footprint(root)
+        lookups = self.evaluated + self.eval_cache_hits
+        table_lookups = self.table_hits + self.table_misses
+        return {
+            'simulations': self.simulations,
+            'seconds': round(seconds, 6),
+            'simulations_per_sec': round(self.simulations / seconds, 1) if seconds > 0 else None,
+            'select_s': round(self.select_time, 6),
+            'expand_s': round(self.expand_time, 6),
+            'evaluate_s': round(self.evaluate_time, 6),
+            'backup_s': round(self.backup_time, 6),
+            'other_s': round(seconds - self.select_time - self.expand_time - self.evaluate_time
+                             - self.backup_time, 6),
+            'evaluated_leaves': self.evaluated,
+            'eval_cache_hits': self.eval_cache_hits,
+            'eval_cache_hit_rate': round(self.eval_cache_hits / lookups, 4) if lookups else None,
+            'terminal_leaves': self.terminal,
+            'tablebase_leaves': self.tablebase,
+            'max_depth': self.max_depth,
+            'mean_depth': round(self.depth_total / self.simulations, 3) if self.simulations else None,
+            'tree_nodes': nodes,
+            'tree_bytes': nbytes,
+            'table_size': None if table is None else len(table),
+            'table_hits': self.table_hits,
+            'table_misses': self.table_misses,
+            'table_hit_rate': round(self.table_hits / table_lookups, 4) if table_lookups else None,
+        }
+
+
+def tree_footprint(root) -> tuple[int, int]:
+    """Distinct nodes below root and their approximate size in bytes:
+    the node objects, their children dicts and their boards' arrays."""
+    seen = {root}
+    stack = [root]
+    nbytes = 0
+    while stack:
+        node = stack.pop()
+        nbytes += sys.getsizeof(node) + sys.getsizeof(node.__dict__) + sys.getsizeof(node.children) \
+            + node.state.board.nbytes
+        for child in node.children.values():
+            if child not in seen:
+                seen.add(child)
+                stack.append(child)
+    return len(seen), nbytes
+
+
+class JsonlSink:
+    """Metrics sink writing one JSON object per record, with optional constant fields (e.g. a run label)."""
+
+    def __init__(self, out: Optional[TextIO] = None, **fields):
+        self.out = out if out is not None else sys.stdout
+        self.fields = fields
+
+    def __call__(self, record: dict) -> None:
+        self.out.write(json.dumps({**self.fields, **record}) + '\n')
+        self.out.flush()
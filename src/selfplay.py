@@ -0,0 +1,202 @@
+"""Module for generating training samples by MCTS self-play across a process pool.
+
+Each worker plays whole games from the starting position and appends every
+game's samples to its own shards of a sample_store directory as soon as the
+game ends, so workers never contend for output and a crash loses at most the
+games in progress. With a checkpoint directory, each worker also saves its game
+in progress after every move (checkpoint.GameCheckpoint, with the search tree
+every few moves) and records how many games it has finished, so a restarted
+run plays only the games that are left, resuming the interrupted ones. Read
+the samples back with sample_store.SampleStore.
+"""
+
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+import numpy as np
+import numpy.typing as npt
+from half_chess_board import HalfChessBoard, ACTION_IDS, ACTION_MOVES
+from encoder_decoder import encode_boards, encode_action, decode_action, NUM_ACTIONS
+from evaluator import Evaluator, NumpyEvaluator
+from mcts import MCTS, Node, TreeSearch
+from sample_store import SampleWriter, count_samples
+from opening_book import OpeningBook
+from checkpoint import GameCheckpoint
+
+# The samples of one game, before they are written out.
+SAMPLE_DTYPE = np.dtype([
+    ('state', np.uint8, (11, 8, 4)),       # encode_board planes
+    ('policy', np.float32, (NUM_ACTIONS,)),  # root visit-count distribution
+    ('outcome', np.int8),                   # game result for the player to move
+])
+
+
+def search_policy(root: Node) -> npt.NDArray[np.float32]:
+    """Visit-count distribution over action ids at a searched root."""
+    policy = np.zeros(NUM_ACTIONS, dtype=np.float32)
+    for move, child in root.children.items():
+        policy[encode_action(move)] = child.visits
+    total = policy.sum()
+    if total > 0:
+        policy /= total
+    return policy
+
+
+def play_game(mcts: MCTS, num_simulations: int, rng: np.random.Generator,
+              temperature_plies=8, max_plies=200, max_nodes=100_000,
+              book: Optional[OpeningBook] = None, checkpoint: Optional[GameCheckpoint] = None,
+              tree_every=10) -> npt.NDArray:
+    """Plays one game from the starting position and returns its samples.
+    Moves are sampled in proportion to visit counts for the first temperature_plies
+    plies and chosen greedily afterwards; games reaching max_plies are scored as draws.
+    The search tree is reused from move to move, pruned to max_nodes nodes.
+    With a book, book moves are played without searching (and without samples) until
+    the game leaves the book.
+    With a checkpoint, the game is saved after every move, and the search tree after every
+    tree_every searched moves; if the checkpoint exists, the game is resumed from it
+    (restoring rng) instead of starting afresh."""
+    board = HalfChessBoard()
+    search = TreeSearch(board, mcts, max_nodes=max_nodes)
+    actions, boards, policies = [], [], []
+    book_plies = 0
+    if checkpoint is not None and checkpoint.exists():
+        actions, book_plies, policies, root = checkpoint.load(rng, mcts.table)
+        for ply, action in enumerate(actions):
+            if ply >= book_plies:
+                boards.append(board)
+            board = board.make_move(ACTION_MOVES[action])
+        search.root = root if root is not None else Node(prior=0, state=board)
+    else:
+        while book is not None and board.result() is None:
+            move = book.choose(board, rng)
+            if move is None:
+                break
+            search.play(move)
+            board = search.root.state
+            actions.append(ACTION_IDS[move])
+        book_plies = len(actions)
+    while board.result() is None and len(boards) < max_plies:
+        root = search.search(num_simulations)
+        policy = search_policy(root)
+        boards.append(board)
+        policies.append(policy)
+
+        if len(boards) <= temperature_plies:
+            action = rng.choice(NUM_ACTIONS, p=policy / policy.sum(dtype=np.float64))
+        else:
+            action = policy.argmax()
+        move = decode_action(int(action))
+        search.play(move)
+        board = search.root.state
+        actions.append(ACTION_IDS[move])
+        if checkpoint is not None:
+            checkpoint.save(actions, book_plies, policies, rng,
+                            search.root if len(boards) % tree_every == 0 else None)
+
+    result = board.result() or 0
+    samples = np.zeros(len(boards), dtype=SAMPLE_DTYPE)
+    encode_boards(boards, out=samples['state'])
+    samples['policy'] = policies
+    samples['outcome'] = [result if b.white_to_move else -result for b in boards]
+    return samples
+
+
+def _save_progress(path: str, games: int, samples: int) -> None:
+    with open(path + '.tmp', 'w') as f:
+        json.dump({'games': games, 'samples': samples}, f)
+    os.replace(path + '.tmp', path)
+
+
+def worker(worker_id: int, num_games: int, out_dir: str, evaluator: Evaluator,
+           num_simulations: int, batch_size: int, seed: int, book_path: Optional[str] = None,
+           checkpoint_dir: Optional[str] = None, tree_every=10) -> tuple[int, int]:
+    """Plays num_games games, streaming them to this worker's shards.
+    Game i draws its random choices from np.random.default_rng([seed, worker_id, i]).
+
+    With checkpoint_dir, the worker keeps its game in progress there and a progress file
+    with the number of games it has finished and of samples in its shards at that point.
+    A game counts as finished once its samples are in the store: if the shards hold more
+    samples than the progress file says, the worker stopped after writing its last game
+    but before recording it, so that game's checkpoint is dropped rather than replayed.
+    Games already finished are skipped.
+    Returns the number of games played and samples written by this call."""
+    prefix = f'selfplay-w{worker_id:03d}'
+    book = OpeningBook(book_path) if book_path is not None else None
+    mcts = MCTS(evaluator, batch_size=batch_size)
+    checkpoint, progress_path, games_done = None, None, 0
+    if checkpoint_dir is not None:
+        os.makedirs(checkpoint_dir, exist_ok=True)
+        checkpoint = GameCheckpoint(os.path.join(checkpoint_dir, prefix))
+        progress_path = os.path.join(checkpoint_dir, prefix + '.progress')
+        written = count_samples(out_dir, prefix)
+        if os.path.exists(progress_path):
+            with open(progress_path) as f:
+                progress = json.load(f)
+            games_done = progress['games']
+            if written > progress['samples']:
+                checkpoint.remove()
+                games_done += 1
+                _save_progress(progress_path, games_done, written)
+        else:
+            _save_progress(progress_path, 0, written)
+
+    writer = SampleWriter(out_dir, prefix)
+    num_samples = 0
+    try:
+        for game in range(games_done, num_games):
+            samples = play_game(mcts, num_simulations, np.random.default_rng([seed, worker_id, game]),
+                                book=book, checkpoint=checkpoint, tree_every=tree_every)
+            writer.write(samples['state'], samples['policy'], samples['outcome'])
+            num_samples += len(samples)
+            if checkpoint is not None:
+                checkpoint.remove()
+                _save_progress(progress_path, game + 1, count_samples(out_dir, prefix))
+    finally:
+        writer.close()
+    return max(num_games - games_done, 0), num_samples
+
+
+def generate(num_games: int, out_dir: str, evaluator: Optional[Evaluator] = None,
+             num_workers: Optional[int] = None, num_simulations=100, batch_size=8, seed=0,
+             book_path: Optional[str] = None, checkpoint_dir: Optional[str] = None,
+             tree_every=10) -> tuple[int, int]:
+    """Plays num_games self-play games split across num_workers processes (default: one per core),
+    opening from the opening_book at book_path if given and checkpointing games in progress
+    to checkpoint_dir if given (the search trees every tree_every moves). Rerun with the same
+    checkpoint_dir, num_games and num_workers to play only the games an interrupted run left.
+    Returns the total number of games played and samples written by this call."""
+    if evaluator is None:
+        evaluator = NumpyEvaluator()
+    num_workers = num_workers or os.cpu_count()
+    shares = [num_games // num_workers + (i < num_games % num_workers) for i in range(num_workers)]
+    with ProcessPoolExecutor(num_workers) as pool:
+        futures = [pool.submit(worker, i, share, out_dir, evaluator, num_simulations, batch_size, seed,
+                               book_path, checkpoint_dir, tree_every)
+                   for i, share in enumerate(shares) if share]
+        totals = [future.result() for future in futures]
+    return sum(games for games, _ in totals), sum(samples for _, samples in totals)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Generate self-play training samples.')
+    parser.add_argument('out_dir')
+    parser.add_argument('num_games', type=int)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--simulations', type=int, default=100)
+    parser.add_argument('--batch-size', type=int, default=8)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--book', default=None, help='opening book to play the first moves from')
+    parser.add_argument('--checkpoint-dir', default=None, help='save games in progress here, and resume them')
+    parser.add_argument('--tree-every', type=int, default=10, help='moves between saves of the search tree')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    games, samples = generate(args.num_games, args.out_dir, num_workers=args.workers,
+                              num_simulations=args.simulations, batch_size=args.batch_size,
+                              seed=args.seed, book_path=args.book,
+                              checkpoint_dir=args.checkpoint_dir, tree_every=args.tree_every)
+    hours = (time.perf_counter() - start) / 3600
+    print(f'{games} games, {samples} samples, {games / hours:.0f} games/hour')
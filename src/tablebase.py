@@ -0,0 +1,280 @@
+"""Endgame tablebases for small half-chess material sets.
+
+A material signature lists the white pieces then the black pieces, each in
+KRBNP order, e.g. 'KBNk'. A table stores one uint16 per index of the perfect
+index function
+
+    index = side * 32**n + sq_1 * 32**(n-1) + ... + sq_n
+
+where side is 0 for white to move, n is the number of pieces, and sq_i is the
+square (row * 4 + col) of the i-th piece of the signature. Each entry packs
+the outcome for the player to move in its low two bits (see INVALID, LOSS,
+DRAW, WIN) and the distance to mate in plies above them. Indices that don't
+describe a legal position (two pieces on one square, a pawn on its last row,
+the side not to move in check) are INVALID.
+
+Tables are solved by retrograde analysis with the HalfChessBoard rules, using
+the bitboard move generator. Captures and promotions leave the table, so the
+smaller tables they lead to are built (or loaded) first. Building is
+practical up to four pieces (2 * 32**4 entries); five-piece tables fit the
+format but take hours in pure Python.
+
+Files are a 32-byte header followed by the entries, and are memory-mapped
+for O(1) probing.
+"""
+
+import os
+import sys
+import time
+from array import array
+from typing import Optional
+import numpy as np
+import numpy.typing as npt
+from half_chess_board import HalfChessBoard
+from bitboard import BitboardHalfChessBoard, PIECES, K, k, is_attacked, squares
+
+INVALID, LOSS, DRAW, WIN = range(4)
+ORDER = 'KRBNPkrbnp'
+MAGIC = b'HCTB'
+VERSION = 1
+HEADER_BYTES = 32
+
+
+def signature_of(placement: list[tuple[str, int]]) -> str:
+    return ''.join(piece for piece, _ in placement)
+
+
+def canonical_placement(pieces: list[tuple[str, int]]) -> list[tuple[str, int]]:
+    """(piece, square) pairs in signature order, identical pieces by ascending square."""
+    return sorted(pieces, key=lambda item: (ORDER.index(item[0]), item[1]))
+
+
+def placement_of_board(board: HalfChessBoard) -> list[tuple[str, int]]:
+    return [(piece, r * 4 + c) for piece in dict.fromkeys(board.material_signature)
+            for r, c in board.piece_squares(piece)]
+
+
+def placement_of_bitboards(pieces: list[int]) -> list[tuple[str, int]]:
+    return canonical_placement([(PIECES[piece], sq) for piece, bb in enumerate(pieces) for sq in squares(bb)])
+
+
+def index_of(placement: list[tuple[str, int]], white_to_move: bool) -> int:
+    index = 0 if white_to_move else 1
+    for _, sq in placement:
+        index = index * 32 + sq
+    return index
+
+
+def table_size(signature: str) -> int:
+    return 2 * 32 ** len(signature)
+
+
+def _pack(wdl: int, dtm: int) -> int:
+    return dtm << 2 | wdl
+
+
+class Tablebase:
+    """One solved material signature; entries are usually a read-only memmap."""
+
+    def __init__(self, signature: str, entries: npt.NDArray[np.uint16]):
+        self.signature = signature
+        self.entries = entries
+
+    def probe_index(self, index: int) -> tuple[int, int]:
+        """(outcome code, distance to mate in plies) for the player to move."""
+        entry = int(self.entries[index])
+        return entry & 3, entry >> 2
+
+    def save(self, path: str) -> None:
+        header = MAGIC + np.uint32(VERSION).tobytes() + self.signature.encode().ljust(16, b'\0')
+        with open(path, 'wb') as f:
+            f.write(header.ljust(HEADER_BYTES, b'\0'))
+            np.asarray(self.entries, dtype='<u2').tofile(f)
+
+    @classmethod
+    def load(cls, path: str) -> 'Tablebase':
+        with open(path, 'rb') as f:
+            header = f.read(HEADER_BYTES)
+        if header[:4] != MAGIC or np.frombuffer(header[4:8], dtype='<u4')[0] != VERSION:
+            raise ValueError(f'{path} is not a version {VERSION} half-chess tablebase')
+        signature = header[8:24].rstrip(b'\0').decode()
+        entries = np.memmap(path, dtype='<u2', mode='r', offset=HEADER_BYTES, shape=(table_size(signature),))
+        return cls(signature, entries)
+
+
+class Tablebases:
+    """The tables available in a directory, loaded on first use.
+    Missing tables are built (with their dependencies) when build=True."""
+
+    def __init__(self, directory: str, build=False):
+        self.directory = directory
+        self.build = build
+        self.tables: dict[str, Optional[Tablebase]] = {}
+
+    def path(self, signature: str) -> str:
+        return os.path.join(self.directory, f'{signature}.hctb')
+
+    def get(self, signature: str) -> Optional[Tablebase]:
+        if signature not in self.tables:
+            if os.path.exists(self.path(signature)):
+                self.tables[signature] = Tablebase.load(self.path(signature))
+            elif self.build:
+                os.makedirs(self.directory, exist_ok=True)
+                table = build_table(signature, self)
+                table.save(self.path(signature))
+                self.tables[signature] = Tablebase.load(self.path(signature))
+            else:
+                self.tables[signature] = None
+        return self.tables[signature]
+
+    def probe_placement(self, placement: list[tuple[str, int]], white_to_move: bool) -> Optional[tuple[int, int]]:
+        table = self.get(signature_of(placement))
+        if table is None:
+            return None
+        return table.probe_index(index_of(placement, white_to_move))
+
+    def probe(self, board: HalfChessBoard) -> Optional[tuple[int, int]]:
+        """(outcome code, distance to mate) for the player to move, or None if no table covers board."""
+        if len(board.material_signature) > 5:
+            return None
+        return self.probe_placement(placement_of_board(board), board.white_to_move)
+
+    def value(self, board: HalfChessBoard) -> Optional[float]:
+        """Exact game value for the player to move (1, 0 or -1), or None if no table covers board."""
+        probe = self.probe(board)
+        if probe is None or probe[0] == INVALID:
+            return None
+        return {LOSS: -1.0, DRAW: 0.0, WIN: 1.0}[probe[0]]
+
+    def result(self, board: HalfChessBoard) -> Optional[int]:
+        """Solved result in the style of HalfChessBoard.result: 1 white wins, -1 black wins, 0 draw."""
+        value = self.value(board)
+        if value is None:
+            return None
+        return int(value if board.white_to_move else -value)
+
+
+def build_table(signature: str, tablebases: Tablebases) -> Tablebase:
+    """Solves signature by retrograde analysis; tables for captures and promotions come from tablebases."""
+    if signature.count('K') != 1 or signature.count('k') != 1:
+        raise ValueError(f'signature {signature!r} needs exactly one king per side')
+    if canonical_placement([(piece, 0) for piece in signature]) != [(piece, 0) for piece in signature]:
+        raise ValueError(f'signature {signature!r} is not in {ORDER} order')
+    num = len(signature)
+    half = 32 ** num
+    piece_ids = [PIECES.index(piece) for piece in signature]
+
+    entries = np.zeros(2 * half, dtype=np.uint16)
+    num_moves = np.zeros(2 * half, dtype=np.int32)
+    # For losses: the longest win among the children resolved so far.
+    longest = np.zeros(2 * half, dtype=np.int32)
+    blocked = np.zeros(2 * half, dtype=bool)  # a child is a draw, so the position can't be lost
+    edge_child, edge_parent = array('i'), array('i')
+    buckets: dict[int, list[tuple[int, int]]] = {}
+
+    for index in range(2 * half):
+        white_to_move = index < half
+        rest = index % half
+        sqs = []
+        for _ in range(num):
+            rest, sq = divmod(rest, 32)
+            sqs.append(sq)
+        sqs.reverse()
+        if len(set(sqs)) < num:
+            continue
+        pieces = [0] * 10
+        for piece, sq in zip(piece_ids, sqs):
+            pieces[piece] |= 1 << sq
+        if pieces[PIECES.index('P')] & 0b1111 or pieces[PIECES.index('p')] >> 28:
+            continue
+        occupied = sum(1 << sq for sq in sqs)
+        enemy_king = pieces[k] if white_to_move else pieces[K]
+        if is_attacked(enemy_king.bit_length() - 1, white_to_move, pieces, occupied):
+            continue
+
+        board = BitboardHalfChessBoard(white_to_move=white_to_move, pieces=pieces)
+        result = board.result()
+        if result is not None:
+            if board.legal_moves:
+                entries[index] = _pack(DRAW, 0)     # insufficient material
+            elif result == 0:
+                entries[index] = _pack(DRAW, 0)     # stalemate
+            else:
+                entries[index] = _pack(LOSS, 0)     # checkmated
+                buckets.setdefault(0, []).append((index, LOSS))
+            continue
+
+        entries[index] = _pack(DRAW, 0)
+        num_moves[index] = len(board.legal_moves)
+        base = 0 if white_to_move else half
+        child_base = half - base
+        for move in board.legal_moves:
+            from_sq = move.old_r * 4 + move.old_c
+            to_sq = move.new_r * 4 + move.new_c
+            slot = sqs.index(from_sq)
+            promotes = signature[slot] in 'Pp' and move.new_r in (0, 7)
+            if to_sq not in sqs and not promotes:
+                edge_child.append(child_base + index - base + (to_sq - from_sq) * 32 ** (num - 1 - slot))
+                edge_parent.append(index)
+                continue
+            child = board.make_move(move, future=True)
+            placement = placement_of_bitboards(child.pieces)
+            probe = tablebases.probe_placement(placement, not white_to_move)
+            if probe is None:
+                raise FileNotFoundError(f'{signature} needs the {signature_of(placement)} table: build it first '
+                                        f'(or pass build=True) in {tablebases.directory}')
+            wdl, dtm = probe
+            if wdl == LOSS:
+                buckets.setdefault(dtm + 1, []).append((index, WIN))
+            elif wdl == WIN:
+                num_moves[index] -= 1
+                longest[index] = max(longest[index], dtm)
+            else:
+                blocked[index] = True
+        if num_moves[index] == 0 and not blocked[index]:
+            buckets.setdefault(longest[index] + 1, []).append((index, LOSS))
+
+    # Predecessor lists in CSR form.
+    edge_child = np.frombuffer(edge_child, dtype=np.int32)
+    edge_parent = np.frombuffer(edge_parent, dtype=np.int32)
+    order = np.argsort(edge_child, kind='stable')
+    parents = edge_parent[order]
+    starts = np.searchsorted(edge_child[order], np.arange(2 * half + 1))
+
+    # Resolve positions in order of distance to mate, so each is assigned its shortest win
+    # (or longest loss) the first time it is reached.
+    resolved = np.zeros(2 * half, dtype=bool)
+    dtm = 0
+    while buckets:
+        for index, wdl in buckets.pop(dtm, []):
+            if resolved[index]:
+                continue
+            resolved[index] = True
+            entries[index] = _pack(wdl, dtm)
+            for parent in parents[starts[index]:starts[index + 1]]:
+                if resolved[parent]:
+                    continue
+                if wdl == LOSS:
+                    buckets.setdefault(dtm + 1, []).append((parent, WIN))
+                else:
+                    num_moves[parent] -= 1
+                    longest[parent] = max(longest[parent], dtm)
+                    if num_moves[parent] == 0 and not blocked[parent]:
+                        buckets.setdefault(longest[parent] + 1, []).append((parent, LOSS))
+        dtm += 1
+    # Anything left unresolved can be held to a draw and keeps its DRAW entry.
+    return Tablebase(signature, entries)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 3:
+        print('usage: python tablebase.py <directory> <signature>...  e.g. KBNk')
+        sys.exit(1)
+    tablebases = Tablebases(sys.argv[1], build=True)
+    for signature in sys.argv[2:]:
+        start = time.perf_counter()
+        table = tablebases.get(signature)
+        codes = np.asarray(table.entries) & 3
+        print(f'{signature}: {time.perf_counter() - start:.1f}s, '
+              f'{np.count_nonzero(codes == WIN)} wins, {np.count_nonzero(codes == DRAW)} draws, '
+              f'{np.count_nonzero(codes == LOSS)} losses, longest mate {int(np.asarray(table.entries).max() >> 2)} plies')
@@ -0,0 +1,337 @@
+"""Module for playing matches between two engines across a process pool and estimating Elo
+
+A match is a series of game pairs. Each pair starts from an opening reached
+by a few random plies from HalfChessBoard(), and is played once with each
+player as white, so neither player profits from a lucky opening. Games are
+adjudicated by result(); games reaching max_plies plies are draws, unless
+a material margin is given and one side leads by at least that much.
+
+Players are configurations (MCTSPlayer, AlphaBetaPlayer, RandomPlayer, and
+BookPlayer, which opens any of them from an opening_book) that are sent to
+every worker process once, when the pool starts. match() yields each game's
+record as soon as it finishes, and MatchStats accumulates the score, the Elo
+difference with its confidence interval, and each player's nodes per second.
+"""
+
+import argparse
+import json
+import math
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Iterator, Optional
+import numpy as np
+from half_chess_board import HalfChessBoard, Move, ACTION_MOVES
+from evaluator import Evaluator
+from mcts import MCTS, TreeSearch
+from alphabeta import AlphaBeta
+from opening_book import OpeningBook
+
+
+class Player:
+    """Interface for match players. new_game starts a game from board, move picks a move
+    for the player to move in board, and play is told every move of the game, for players
+    that keep state between moves. nodes counts the positions searched so far."""
+    name = 'player'
+    nodes = 0
+
+    def new_game(self, board: HalfChessBoard, seed: int) -> None:
+        pass
+
+    def move(self, board: HalfChessBoard) -> Move:
+        raise NotImplementedError
+
+    def play(self, move: Move) -> None:
+        pass
+
+
+class RandomPlayer(Player):
+    """Plays uniformly random legal moves; a baseline that costs one node per move."""
+
+    def __init__(self, name='random'):
+        self.name = name
+        self.rng = None
+
+    def new_game(self, board, seed):
+        self.rng = np.random.default_rng(seed)
+
+    def move(self, board):
+        self.nodes += 1
+        actions = board.legal_actions
+        return ACTION_MOVES[actions[self.rng.integers(len(actions))]]
+
+
+class MCTSPlayer(Player):
+    """Plays the most visited move after num_simulations simulations, keeping the tree between moves.
+    If the search expands no move (the evaluator gives every move zero prior), plays the first legal move."""
+
+    def __init__(self, num_simulations: int, evaluator: Optional[Evaluator] = None, batch_size=8,
+                 max_nodes: Optional[int] = 100_000, name: Optional[str] = None):
+        self.name = name or f'mcts{num_simulations}'
+        self.num_simulations = num_simulations
+        self.mcts = MCTS(evaluator, batch_size=batch_size)
+        self.max_nodes = max_nodes
+        self.search = None
+
+    def new_game(self, board, seed):
+        self.search = TreeSearch(board, self.mcts, max_nodes=self.max_nodes)
+
+    def move(self, board):
+        root = self.search.search(self.num_simulations)
+        self.nodes += self.num_simulations
+        if not root.children:
+            return board.legal_moves[0]
+        return max(root.children.items(), key=lambda item: item[1].visits)[0]
+
+    def play(self, move):
+        self.search.play(move)
+
+
+class AlphaBetaPlayer(Player):
+    """Plays the alpha-beta engine's move, searching to depth plies or for time_ms milliseconds.
+    The transposition table is kept between the moves of a game and cleared between games."""
+
+    def __init__(self, depth: Optional[int] = None, time_ms: Optional[float] = None, name: Optional[str] = None):
+        if depth is None and time_ms is None:
+            raise ValueError('AlphaBetaPlayer needs a depth or a time_ms')
+        self.name = name or (f'alphabeta{time_ms:g}ms' if depth is None else f'alphabeta{depth}')
+        self.depth = depth
+        self.time_ms = time_ms
+        self.engine = None
+
+    def new_game(self, board, seed):
+        self.engine = AlphaBeta()
+
+    def move(self, board):
+        move, _, _ = self.engine.search(board, max_depth=self.depth or 64, time_ms=self.time_ms)
+        self.nodes += self.engine.nodes
+        return move
+
+
+class BookPlayer(Player):
+    """Plays moves from the opening book at book_path while the game is in book,
+    without searching, and player's moves afterwards."""
+
+    def __init__(self, player: Player, book_path: str, temperature=1.0):
+        self.player = player
+        self.name = player.name
+        self.book_path = book_path
+        self.temperature = temperature
+        self.book = None
+        self.rng = None
+        self.in_book = False
+
+    def new_game(self, board, seed):
+        if self.book is None:
+            # Opened in the worker process rather than pickled with the player.
+            self.book = OpeningBook(self.book_path)
+        self.rng = np.random.default_rng(seed)
+        self.in_book = True
+        self.player.new_game(board, seed)
+
+    def move(self, board):
+        if self.in_book:
+            move = self.book.choose(board, self.rng, self.temperature)
+            if move is not None:
+                return move
+            self.in_book = False
+        nodes = self.player.nodes
+        move = self.player.move(board)
+        self.nodes += self.player.nodes - nodes
+        return move
+
+    def play(self, move):
+        self.player.play(move)
+
+
+def parse_player(spec: str) -> Player:
+    """Player from a command-line spec: random, mcts:<simulations>,
+    alphabeta:<depth> or alphabeta:<milliseconds>ms."""
+    kind, _, arg = spec.partition(':')
+    if kind == 'random':
+        return RandomPlayer()
+    if kind == 'mcts' and arg.isdigit():
+        return MCTSPlayer(int(arg))
+    if kind == 'alphabeta' and arg.endswith('ms'):
+        return AlphaBetaPlayer(time_ms=float(arg[:-2]))
+    if kind == 'alphabeta' and arg.isdigit():
+        return AlphaBetaPlayer(depth=int(arg))
+    raise ValueError(f'unknown player {spec!r}')
+
+
+def random_opening(rng: np.random.Generator, plies=4, max_tries=100) -> HalfChessBoard:
+    """A position reached by plies random moves from HalfChessBoard() in which the game goes on."""
+    for _ in range(max_tries):
+        board = HalfChessBoard()
+        for _ in range(plies):
+            actions = board.legal_actions
+            board = board.make_move(ACTION_MOVES[actions[rng.integers(len(actions))]])
+            if board.result() is not None:
+                break
+        else:
+            return board
+    raise RuntimeError(f'no ongoing opening found after {max_tries} tries')
+
+
+def play_game(white: Player, black: Player, board: HalfChessBoard, seed: int, max_plies=200,
+              material_margin: Optional[int] = None) -> dict:
+    """Plays one game from board and returns its record: result (for white), how the game
+    ended, plies, and each side's nodes and thinking seconds.
+    A game reaching max_plies is a draw, or a win for the side up by at least material_margin points."""
+    players = (white, black)
+    nodes = [0, 0]
+    seconds = [0.0, 0.0]
+    for player in players:
+        player.new_game(board, seed)
+    plies = 0
+    while board.result() is None and plies < max_plies:
+        side = 0 if board.white_to_move else 1
+        player = players[side]
+        start_nodes = player.nodes
+        start = time.perf_counter()
+        move = player.move(board)
+        seconds[side] += time.perf_counter() - start
+        nodes[side] += player.nodes - start_nodes
+        for p in players:
+            p.play(move)
+        board = board.make_move(move)
+        plies += 1
+    result = board.result()
+    termination = 'result'
+    if result is None:
+        result, termination = 0, 'max_plies'
+        material = board.material_advantage()
+        if material_margin is not None and abs(material) >= material_margin:
+            result, termination = (1 if material > 0 else -1), 'material'
+    return {
+        'result': result,
+        'termination': termination,
+        'plies': plies,
+        'white_nodes': nodes[0], 'black_nodes': nodes[1],
+        'white_s': round(seconds[0], 6), 'black_s': round(seconds[1], 6),
+    }
+
+
+# The two players of the match in each worker process, set by _init_worker.
+_players: tuple[Player, Player] = None
+
+
+def _init_worker(player_a: Player, player_b: Player) -> None:
+    global _players
+    _players = (player_a, player_b)
+
+
+def _play_pair_game(game: int, opening: HalfChessBoard, a_is_white: bool, seed: int, max_plies: int,
+                    material_margin: Optional[int]) -> dict:
+    """Process entry point: plays one game of the match and labels the record with player names."""
+    player_a, player_b = _players
+    white, black = (player_a, player_b) if a_is_white else (player_b, player_a)
+    record = play_game(white, black, opening, seed, max_plies, material_margin)
+    score = (record['result'] + 1) / 2
+    return {'game': game, 'white': white.name, 'black': black.name,
+            'score_a': score if a_is_white else 1 - score, **record}
+
+
+def match(player_a: Player, player_b: Player, num_games: int, num_workers: Optional[int] = None,
+          opening_plies=4, max_plies=200, material_margin: Optional[int] = None, seed=0) -> Iterator[dict]:
+    """Plays num_games games between player_a and player_b across num_workers processes
+    (default: one per core), yielding each game's record as it finishes.
+    Games 2i and 2i + 1 share an opening, with colours swapped; score_a is player_a's score."""
+    rng = np.random.default_rng(seed)
+    openings = [random_opening(rng, opening_plies) for _ in range((num_games + 1) // 2)]
+    num_workers = num_workers or os.cpu_count()
+    with ProcessPoolExecutor(num_workers, initializer=_init_worker, initargs=(player_a, player_b)) as pool:
+        futures = [pool.submit(_play_pair_game, game, openings[game // 2], game % 2 == 0, seed + game,
+                               max_plies, material_margin)
+                   for game in range(num_games)]
+        for future in as_completed(futures):
+            yield future.result()
+
+
+def elo(wins: int, draws: int, losses: int, z=1.96) -> tuple[float, float, float]:
+    """Elo difference implied by a score, with the bounds of its z-sigma confidence
+    interval (from the normal approximation of the mean game score)."""
+    n = wins + draws + losses
+    if n == 0:
+        return 0.0, -math.inf, math.inf
+    score = (wins + draws / 2) / n
+    variance = (wins * (1 - score) ** 2 + draws * (0.5 - score) ** 2 + losses * score ** 2) / n
+    margin = z * math.sqrt(variance / n)
+    return _elo_of_score(score), _elo_of_score(score - margin), _elo_of_score(score + margin)
+
+
+def _elo_of_score(score: float) -> float:
+    if score <= 0:
+        return -math.inf
+    if score >= 1:
+        return math.inf
+    return -400 * math.log10(1 / score - 1)
+
+
+class MatchStats:
+    """Running totals of a match from player_a's point of view."""
+
+    def __init__(self, name_a: str, name_b: str):
+        self.names = (name_a, name_b)
+        self.wins = self.draws = self.losses = 0
+        self.nodes = {name_a: 0, name_b: 0}
+        self.seconds = {name_a: 0.0, name_b: 0.0}
+
+    def add(self, record: dict) -> None:
+        if record['score_a'] == 1:
+            self.wins += 1
+        elif record['score_a'] == 0:
+            self.losses += 1
+        else:
+            self.draws += 1
+        for colour in ('white', 'black'):
+            self.nodes[record[colour]] += record[f'{colour}_nodes']
+            self.seconds[record[colour]] += record[f'{colour}_s']
+
+    def nodes_per_sec(self, name: str) -> float:
+        return self.nodes[name] / self.seconds[name] if self.seconds[name] else 0.0
+
+    def summary(self) -> str:
+        name_a, name_b = self.names
+        diff, lower, upper = elo(self.wins, self.draws, self.losses)
+        return (f'{name_a} vs {name_b}: +{self.wins} ={self.draws} -{self.losses}, '
+                f'Elo {diff:+.1f} [{lower:+.1f}, {upper:+.1f}], '
+                f'{name_a} {self.nodes_per_sec(name_a):.0f} nodes/s, {name_b} {self.nodes_per_sec(name_b):.0f} nodes/s')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Play a match between two players and estimate their Elo difference.')
+    parser.add_argument('player_a', help='random, mcts:<simulations>, alphabeta:<depth> or alphabeta:<ms>ms')
+    parser.add_argument('player_b')
+    parser.add_argument('--games', type=int, default=1000)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--opening-plies', type=int, default=4)
+    parser.add_argument('--max-plies', type=int, default=200)
+    parser.add_argument('--material-margin', type=int, default=None,
+                        help='score games reaching --max-plies as wins for a side this many points up')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--book', default=None, help='opening book both players open from')
+    parser.add_argument('--out', default=None, help='file for per-game JSON lines (default: none)')
+    args = parser.parse_args()
+
+    player_a, player_b = parse_player(args.player_a), parse_player(args.player_b)
+    if args.book is not None:
+        player_a, player_b = BookPlayer(player_a, args.book), BookPlayer(player_b, args.book)
+    if player_a.name == player_b.name:
+        player_b.name += "'"
+    stats = MatchStats(player_a.name, player_b.name)
+    out = open(args.out, 'w') if args.out else None
+    start = time.perf_counter()
+    try:
+        for i, record in enumerate(match(player_a, player_b, args.games, args.workers,
+                                         args.opening_plies, args.max_plies, args.material_margin, args.seed), 1):
+            stats.add(record)
+            if out is not None:
+                out.write(json.dumps(record) + '\n')
+            if i % 100 == 0 or i == args.games:
+                print(f'{i} games, {time.perf_counter() - start:.0f}s: {stats.summary()}', file=sys.stderr)
+    finally:
+        if out is not None:
+            out.close()
+    print(stats.summary())
@@ -0,0 +1,54 @@
+"""Module providing a bounded transposition table keyed by Zobrist hashes"""
+
+from collections import OrderedDict
+from typing import Optional
+
+
+class Entry:
+    """Information shared by every path that reaches a position:
+    the MCTS node holding its statistics, and its cached network evaluation.
+    MCTS files nodes under HalfChessBoard.zobrist_hash and evaluations under
+    canonical_hash, so the entry of a white-to-move position also caches the
+    evaluation of its mirror image."""
+    __slots__ = ('node', 'value', 'policy')
+
+    def __init__(self):
+        self.node = None
+        self.value = None
+        self.policy = None
+
+
+class TranspositionTable:
+    """Maps position hashes to entries, evicting the least recently used entry
+    once more than `capacity` positions are stored."""
+
+    def __init__(self, capacity=1_000_000):
+        self.capacity = capacity
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def __contains__(self, key: int) -> bool:
+        return key in self.entries
+
+    def lookup(self, key: int) -> Optional[Entry]:
+        """Returns the entry for key, or None if the position is not stored."""
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return entry
+
+    def store(self, key: int) -> Entry:
+        """Returns the entry for key, creating it (and evicting if full) when absent."""
+        entry = self.lookup(key)
+        if entry is None:
+            entry = self.entries[key] = Entry()
+            if len(self.entries) > self.capacity:
+                self.entries.popitem(last=False)
+        return entry
@@ -1,20 +1,105 @@
-"""Module for visualizing MCTS decision trees"""
+"""Module for exporting and visualizing MCTS decision trees
 
+walk streams a pruned breadth-first traversal of a tree, keeping only the
+frontier and the ids of nodes already emitted in memory. export_jsonl and
+export_dot write it out record by record, so trees from large searches can be
+inspected without building a graph of the whole tree, and vis only lays out
+the pruned graph.
+"""
+
+import argparse
+import heapq
+import json
+from collections import deque
+from typing import Iterator, NamedTuple, Optional, TextIO
 import networkx as nx
 import matplotlib.pyplot as plt
 
 # import mcts
 
-def vis(root, filename=None):
-    """Visualizes decision tree from MCTS node."""
-    G = nx.DiGraph()
-    queue = [root]
+
+class Edge(NamedTuple):
+    """One step of walk: node (numbered id) reached from parent (None for the root) by action."""
+    id: int
+    parent: Optional[int]
+    action: object
+    node: object
+    depth: int
+    # False if node was already reached through another path (a transposition); it is not expanded again.
+    first_visit: bool
+
+
+def walk(root, max_depth: Optional[int] = None, min_visits=1, top_k: Optional[int] = None) -> Iterator[Edge]:
+    """Breadth-first edges of the tree below root, keeping children with at least min_visits visits,
+    at most top_k of them (the most visited) per node, down to max_depth plies."""
+    ids = {root: 0}
+    yield Edge(0, None, None, root, 0, True)
+    queue = deque([(root, 0)])
     while queue:
-        curr = queue.pop(0)
-        for action, child in curr.children.items():
-            if child.visits > 0:
-                G.add_edge(curr, child, action=action)
-                queue.append(child)
+        node, depth = queue.popleft()
+        if max_depth is not None and depth >= max_depth:
+            continue
+        children = [(action, child) for action, child in node.children.items() if child.visits >= min_visits]
+        if top_k is not None and len(children) > top_k:
+            children = heapq.nlargest(top_k, children, key=lambda item: item[1].visits)
+        for action, child in children:
+            child_id = ids.get(child)
+            if child_id is None:
+                child_id = ids[child] = len(ids)
+                queue.append((child, depth + 1))
+                yield Edge(child_id, ids[node], action, child, depth + 1, True)
+            else:
+                yield Edge(child_id, ids[node], action, child, depth + 1, False)
+
+
+def _mean_value(node) -> float:
+    return node.value / node.visits if node.visits else 0.0
+
+
+def export_jsonl(root, out: TextIO, **prune) -> int:
+    """Writes one JSON object per edge of walk(root, **prune) to out, starting with the root
+    (parent null), and returns the number written.
+    value is the mean value from the perspective of the player who moved into the node."""
+    count = 0
+    for edge in walk(root, **prune):
+        node = edge.node
+        out.write(json.dumps({
+            'id': edge.id,
+            'parent': edge.parent,
+            'move': None if edge.action is None else repr(edge.action),
+            'depth': edge.depth,
+            'visits': int(node.visits),
+            'value': round(float(_mean_value(node)), 4),
+            'prior': round(float(node.prior), 4),
+        }) + '\n')
+        count += 1
+    return count
+
+
+def export_dot(root, out: TextIO, **prune) -> int:
+    """Writes walk(root, **prune) to out as a Graphviz digraph; returns the number of edges written."""
+    count = 0
+    out.write('digraph mcts {\n')
+    for edge in walk(root, **prune):
+        node = edge.node
+        if edge.first_visit:
+            out.write(f'  {edge.id} [label="{node.visits}\\n{_mean_value(node):.2f}"];\n')
+        if edge.parent is not None:
+            out.write(f'  {edge.parent} -> {edge.id} [label="{edge.action!r}"];\n')
+            count += 1
+    out.write('}\n')
+    return count
+
+
+def vis(root, filename=None, max_depth: Optional[int] = None, min_visits=1, top_k: Optional[int] = None):
+    """Visualizes decision tree from MCTS node, pruned as in walk."""
+    G = nx.DiGraph()
+    G.add_node(root)
+    nodes = {}
+    for edge in walk(root, max_depth=max_depth, min_visits=min_visits, top_k=top_k):
+        nodes[edge.id] = edge.node
+        if edge.parent is not None:
+            G.add_edge(nodes[edge.parent], edge.node, action=edge.action)
 
     plt.figure(figsize=(12, 12))
     pos = nx.nx_agraph.graphviz_layout(G, prog='twopi')
@@ -25,4 +110,28 @@ def vis(root, filename=None):
     if filename is None:
         plt.show()
     else:
-        plt.savefig(filename, format='PNG')
\ No newline at end of file
+        plt.savefig(filename, format='PNG')
+
+
+if __name__ == '__main__':
+    import time
+    from half_chess_board import HalfChessBoard
+    from mcts import MCTS, Node
+    from transposition import TranspositionTable
+
+    parser = argparse.ArgumentParser(description='Search from the starting position and export the tree.')
+    parser.add_argument('out', help='output file; .dot for Graphviz, anything else for JSON lines')
+    parser.add_argument('--simulations', type=int, default=10_000)
+    parser.add_argument('--batch-size', type=int, default=16)
+    parser.add_argument('--max-depth', type=int, default=None)
+    parser.add_argument('--min-visits', type=int, default=1)
+    parser.add_argument('--top-k', type=int, default=None)
+    args = parser.parse_args()
+
+    root = Node(prior=0, state=HalfChessBoard())
+    MCTS(batch_size=args.batch_size, table=TranspositionTable()).run(root, args.simulations)
+    start = time.perf_counter()
+    export = export_dot if args.out.endswith('.dot') else export_jsonl
+    with open(args.out, 'w') as f:
+        count = export(root, f, max_depth=args.max_depth, min_visits=args.min_visits, top_k=args.top_k)
+    print(f'{count} edges written in {time.perf_counter() - start:.2f}s')